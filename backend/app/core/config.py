@@ -19,6 +19,120 @@ class Settings(BaseSettings):
     # API pour Gemini (Google AI)
     gemini_api_key: str = os.getenv("GEMINI_API_KEY", "")
 
+    # Inférence ML (micro-batching)
+    ml_batching_enabled: bool = os.getenv("ML_BATCHING_ENABLED", "true").lower() == "true"
+    ml_max_batch_size: int = int(os.getenv("ML_MAX_BATCH_SIZE", "8"))
+    ml_batch_max_wait_ms: float = float(os.getenv("ML_BATCH_MAX_WAIT_MS", "10"))
+    # Moteur d'inférence: keras | tflite_fp16 | tflite_int8 | onnx
+    ml_engine: str = os.getenv("ML_ENGINE", "keras")
+    ml_engine_threads: int = int(os.getenv("ML_ENGINE_THREADS", "0"))  # 0 = valeur par défaut du moteur
+    ml_onnx_intra_op_threads: int = int(os.getenv("ML_ONNX_INTRA_OP_THREADS", "0"))
+    ml_onnx_inter_op_threads: int = int(os.getenv("ML_ONNX_INTER_OP_THREADS", "0"))
+    ml_onnx_profile: bool = os.getenv("ML_ONNX_PROFILE", "false").lower() == "true"
+    ml_onnx_profile_dir: str = os.getenv("ML_ONNX_PROFILE_DIR", "")
+    # Tailles de batch pré-tracées au démarrage
+    ml_warmup_batch_sizes: List[int] = [int(size) for size in os.getenv("ML_WARMUP_BATCH_SIZES", "1,2,4,8").split(",") if size]
+    ml_max_images_per_request: int = int(os.getenv("ML_MAX_IMAGES_PER_REQUEST", "64"))
+
+    # Registre de modèles: version candidate (app/ml/models/<nom>/), part du trafic et mode shadow
+    ml_candidate_model: str = os.getenv("ML_CANDIDATE_MODEL", "")
+    ml_candidate_traffic_percent: float = float(os.getenv("ML_CANDIDATE_TRAFFIC_PERCENT", "0"))
+    ml_shadow_mode: bool = os.getenv("ML_SHADOW_MODE", "false").lower() == "true"
+    ml_shadow_max_queue: int = int(os.getenv("ML_SHADOW_MAX_QUEUE", "32"))
+
+    # Cache des prédictions par empreinte de l'image (mémoire + SQLite optionnel)
+    ml_prediction_cache_enabled: bool = os.getenv("ML_PREDICTION_CACHE_ENABLED", "true").lower() == "true"
+    ml_prediction_cache_size: int = int(os.getenv("ML_PREDICTION_CACHE_SIZE", "1024"))
+    ml_prediction_cache_ttl: float = float(os.getenv("ML_PREDICTION_CACHE_TTL", "86400"))
+    ml_prediction_cache_path: str = os.getenv("ML_PREDICTION_CACHE_PATH", "")  # vide = mémoire seulement
+    ml_prediction_cache_disk_max_entries: int = int(os.getenv("ML_PREDICTION_CACHE_DISK_MAX_ENTRIES", "100000"))
+    ml_prediction_cache_disk_prune_seconds: float = float(os.getenv("ML_PREDICTION_CACHE_DISK_PRUNE_SECONDS", "60"))  # purge du niveau disque
+
+    # Quasi-doublons: réutilisation de la prédiction d'un scan récent de l'utilisateur (dHash)
+    ml_near_duplicate_enabled: bool = os.getenv("ML_NEAR_DUPLICATE_ENABLED", "true").lower() == "true"
+    ml_near_duplicate_max_distance: int = int(os.getenv("ML_NEAR_DUPLICATE_MAX_DISTANCE", "6"))  # bits sur 64
+    ml_near_duplicate_history: int = int(os.getenv("ML_NEAR_DUPLICATE_HISTORY", "20"))  # scans par utilisateur
+    ml_near_duplicate_ttl: float = float(os.getenv("ML_NEAR_DUPLICATE_TTL", "600"))
+
+    # Cache des recommandations Gemini par (maladie, langue, version du prompt)
+    ml_recommendation_language: str = os.getenv("ML_RECOMMENDATION_LANGUAGE", "fr")
+    ml_recommendation_cache_enabled: bool = os.getenv("ML_RECOMMENDATION_CACHE_ENABLED", "true").lower() == "true"
+    ml_recommendation_cache_size: int = int(os.getenv("ML_RECOMMENDATION_CACHE_SIZE", "256"))
+    ml_recommendation_cache_ttl: float = float(os.getenv("ML_RECOMMENDATION_CACHE_TTL", "604800"))  # 7 jours
+    ml_recommendation_cache_persistent: bool = os.getenv("ML_RECOMMENDATION_CACHE_PERSISTENT", "true").lower() == "true"
+    # Catalogue des maladies (table diseases) indexé en mémoire, consulté avant le LLM
+    ml_recommendation_catalogue_enabled: bool = os.getenv("ML_RECOMMENDATION_CATALOGUE_ENABLED", "true").lower() == "true"
+    ml_recommendation_catalogue_refresh_seconds: float = float(os.getenv("ML_RECOMMENDATION_CATALOGUE_REFRESH_SECONDS", "600"))
+    # Langue dans laquelle le catalogue est rédigé (servi uniquement pour cette langue)
+    ml_recommendation_catalogue_language: str = os.getenv("ML_RECOMMENDATION_CATALOGUE_LANGUAGE", "fr")
+    # Recommandations précalculées uniquement (python -m app.ml.precompute_recommendations): jamais d'appel LLM en requête
+    ml_recommendation_lookup_only: bool = os.getenv("ML_RECOMMENDATION_LOOKUP_ONLY", "false").lower() == "true"
+
+    # Recommandations des scans complétées en arrière-plan (statut pending/processing/ready/failed)
+    ml_async_recommendations: bool = os.getenv("ML_ASYNC_RECOMMENDATIONS", "true").lower() == "true"
+    ml_recommendation_worker_batch_size: int = int(os.getenv("ML_RECOMMENDATION_WORKER_BATCH_SIZE", "16"))
+    ml_recommendation_worker_poll_seconds: float = float(os.getenv("ML_RECOMMENDATION_WORKER_POLL_SECONDS", "5"))
+    ml_recommendation_worker_max_attempts: int = int(os.getenv("ML_RECOMMENDATION_WORKER_MAX_ATTEMPTS", "5"))
+    ml_recommendation_worker_retry_backoff_seconds: float = float(os.getenv("ML_RECOMMENDATION_WORKER_RETRY_BACKOFF_SECONDS", "30"))
+    ml_recommendation_worker_retry_backoff_max_seconds: float = float(os.getenv("ML_RECOMMENDATION_WORKER_RETRY_BACKOFF_MAX_SECONDS", "3600"))
+    # Durée de réservation d'un scan: au-delà (worker arrêté en cours de génération), il est repris
+    ml_recommendation_worker_lease_seconds: float = float(os.getenv("ML_RECOMMENDATION_WORKER_LEASE_SECONDS", "300"))
+
+    # Décodage des images pour le modèle: exact (pleine résolution), quality ou speed (JPEG décodé à taille réduite).
+    # Ne passer à quality/speed qu'après un contrôle de non-régression sur de vraies photos de feuilles:
+    # python -m benchmarks.bench_jpeg_draft --images <dossier> --model <modèle> (top-1 identique attendu)
+    ml_decode_profile: str = os.getenv("ML_DECODE_PROFILE", "exact")
+    # Prétraitement des octets bruts: pil ou opencv (OpenCV/NumPy, écriture directe dans le buffer de sortie)
+    ml_preprocess_backend: str = os.getenv("ML_PREPROCESS_BACKEND", "pil")
+    # Entrées du modèle en uint8 (4x moins de données): la mise à l'échelle 0-1 est intégrée au modèle
+    ml_uint8_input: bool = os.getenv("ML_UINT8_INPUT", "false").lower() == "true"
+
+    # Passerelle des appels Gemini: concurrence, délais (secondes) et disjoncteur
+    ml_llm_max_concurrency: int = int(os.getenv("ML_LLM_MAX_CONCURRENCY", "4"))
+    ml_llm_timeout_seconds: float = float(os.getenv("ML_LLM_TIMEOUT_SECONDS", "10"))
+    ml_llm_queue_timeout_seconds: float = float(os.getenv("ML_LLM_QUEUE_TIMEOUT_SECONDS", "2"))
+    ml_llm_slow_call_seconds: float = float(os.getenv("ML_LLM_SLOW_CALL_SECONDS", "6"))
+    ml_llm_breaker_failures: int = int(os.getenv("ML_LLM_BREAKER_FAILURES", "5"))
+    ml_llm_breaker_reset_seconds: float = float(os.getenv("ML_LLM_BREAKER_RESET_SECONDS", "30"))
+    # Relance couverte après ce délai sans réponse (0 = désactivée)
+    ml_llm_hedge_after_seconds: float = float(os.getenv("ML_LLM_HEDGE_AFTER_SECONDS", "0"))
+
+    # Échéance d'un scan et budgets par étape (secondes): au-delà, l'étape est dégradée
+    ml_deadlines_enabled: bool = os.getenv("ML_DEADLINES_ENABLED", "true").lower() == "true"
+    ml_request_deadline_seconds: float = float(os.getenv("ML_REQUEST_DEADLINE_SECONDS", "8"))
+    ml_budget_decode_seconds: float = float(os.getenv("ML_BUDGET_DECODE_SECONDS", "1"))
+    ml_budget_preprocess_seconds: float = float(os.getenv("ML_BUDGET_PREPROCESS_SECONDS", "1"))
+    ml_budget_inference_seconds: float = float(os.getenv("ML_BUDGET_INFERENCE_SECONDS", "2"))
+    ml_budget_recommendations_seconds: float = float(os.getenv("ML_BUDGET_RECOMMENDATIONS_SECONDS", "2.5"))
+    ml_budget_upload_seconds: float = float(os.getenv("ML_BUDGET_UPLOAD_SECONDS", "3"))
+    ml_budget_db_seconds: float = float(os.getenv("ML_BUDGET_DB_SECONDS", "1"))
+
+    # Pools d'exécution (traitement d'image, inférence, E/S sortantes)
+    ml_image_workers: int = int(os.getenv("ML_IMAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+    ml_inference_workers: int = int(os.getenv("ML_INFERENCE_WORKERS", "1"))
+    ml_io_workers: int = int(os.getenv("ML_IO_WORKERS", "8"))
+
+    # Processus d'inférence (0 = inférence dans le processus API)
+    ml_worker_processes: int = int(os.getenv("ML_WORKER_PROCESSES", "0"))
+    ml_worker_routing: str = os.getenv("ML_WORKER_ROUTING", "least_loaded")  # round_robin | least_loaded
+    ml_worker_health_interval: float = float(os.getenv("ML_WORKER_HEALTH_INTERVAL", "5"))
+    ml_worker_health_timeout: float = float(os.getenv("ML_WORKER_HEALTH_TIMEOUT", "30"))
+    ml_worker_start_timeout: float = float(os.getenv("ML_WORKER_START_TIMEOUT", "120"))
+    # Redémarrages d'un processus qui échoue: délai exponentiel, puis abandon après ML_WORKER_MAX_RESTARTS
+    ml_worker_max_restarts: int = int(os.getenv("ML_WORKER_MAX_RESTARTS", "5"))
+    ml_worker_restart_backoff_seconds: float = float(os.getenv("ML_WORKER_RESTART_BACKOFF_SECONDS", "1"))
+    ml_worker_restart_backoff_max_seconds: float = float(os.getenv("ML_WORKER_RESTART_BACKOFF_MAX_SECONDS", "60"))
+    # Transport des tenseurs vers les processus par mémoire partagée (sans pickling)
+    ml_shared_memory_transport: bool = os.getenv("ML_SHARED_MEMORY_TRANSPORT", "true").lower() == "true"
+    ml_shared_memory_slots: int = int(os.getenv("ML_SHARED_MEMORY_SLOTS", "64"))
+    # Pool de tableaux réutilisés pour les entrées du modèle (images et batches)
+    ml_buffer_pool_enabled: bool = os.getenv("ML_BUFFER_POOL_ENABLED", "true").lower() == "true"
+    ml_buffer_pool_max_per_shape: int = int(os.getenv("ML_BUFFER_POOL_MAX_PER_SHAPE", "16"))
+    ml_buffer_pool_max_mb: int = int(os.getenv("ML_BUFFER_POOL_MAX_MB", "256"))
+    ml_buffer_pool_preallocate: int = int(os.getenv("ML_BUFFER_POOL_PREALLOCATE", "8"))
+
+    # Taille du threadpool anyio utilisé par les routes synchrones (def)
+    api_threadpool_size: int = int(os.getenv("API_THREADPOOL_SIZE", "20"))
 
     # Supabase Storage
     supabase_url: str = os.getenv("SUPABASE_URL", "")
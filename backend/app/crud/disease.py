@@ -9,6 +9,23 @@ def get_disease(db: Session, disease_id: int) -> Optional[Disease]:
 def get_disease_by_name(db: Session, name: str) -> Optional[Disease]:
     return db.query(Disease).filter(Disease.name == name).first()
 
+def get_disease_for_class(db: Session, class_name: str) -> Optional[Disease]:
+    """
+    Maladie correspondant exactement à une classe du modèle (ex: 'Tomato___Late_blight'):
+    même nom, ou même culture et même maladie une fois normalisés. Jamais la maladie seule,
+    présente sur plusieurs cultures.
+    """
+    from app.ml.recommendation_providers import class_name_keys, normalize_disease_name
+
+    disease = get_disease_by_name(db, class_name)
+    if disease:
+        return disease
+    keys = class_name_keys(class_name)
+    by_key = {}
+    for candidate in db.query(Disease).all():
+        by_key.setdefault(normalize_disease_name(candidate.name or ""), candidate)
+    return next((by_key[key] for key in keys if key in by_key), None)
+
 def get_diseases(db: Session, skip: int = 0, limit: int = 100) -> List[Disease]:
     return db.query(Disease).offset(skip).limit(limit).all()
 
@@ -0,0 +1,34 @@
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from app.models.recommendation import CachedRecommendation
+
+def get_cached_recommendation(db: Session, disease_class: str, language: str,
+                              prompt_version: str) -> Optional[CachedRecommendation]:
+    return db.query(CachedRecommendation).filter(
+        CachedRecommendation.disease_class == disease_class,
+        CachedRecommendation.language == language,
+        CachedRecommendation.prompt_version == prompt_version
+    ).first()
+
+def get_cached_recommendations(db: Session, language: str, prompt_version: str) -> List[CachedRecommendation]:
+    return db.query(CachedRecommendation).filter(
+        CachedRecommendation.language == language,
+        CachedRecommendation.prompt_version == prompt_version
+    ).all()
+
+def upsert_cached_recommendation(db: Session, disease_class: str, language: str,
+                                 prompt_version: str, content: str) -> CachedRecommendation:
+    db_entry = get_cached_recommendation(db, disease_class, language, prompt_version)
+    if db_entry:
+        db_entry.content = content
+    else:
+        db_entry = CachedRecommendation(
+            disease_class=disease_class,
+            language=language,
+            prompt_version=prompt_version,
+            content=content
+        )
+        db.add(db_entry)
+    db.commit()
+    db.refresh(db_entry)
+    return db_entry
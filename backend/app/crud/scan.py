@@ -1,3 +1,5 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from app.models.scan import PlantScan, ScanDisease
@@ -37,6 +39,51 @@ def delete_scan(db: Session, scan_id: int) -> bool:
         return True
     return False
 
+def claim_recommendation_scans(db: Session, limit: int = 16, max_attempts: int = 5,
+                               lease_seconds: float = 300.0) -> List[PlantScan]:
+    """
+    Réserve des scans à compléter: en attente, en échec dont la nouvelle tentative est due, ou
+    réservés par un worker dont la réservation a expiré. Les lignes passent au statut `processing`;
+    l'appelant valide aussitôt la transaction (SKIP LOCKED: les autres processus les ignorent d'ici là).
+    """
+    now = datetime.now(timezone.utc)
+    # Réservation expirée à la dernière tentative: échec définitif
+    db.query(PlantScan).filter(
+        PlantScan.recommendations_status == "processing",
+        PlantScan.recommendations_attempts >= max_attempts,
+        PlantScan.recommendations_retry_at <= now,
+    ).update({"recommendations_status": "failed", "recommendations_retry_at": None}, synchronize_session=False)
+
+    scans = db.query(PlantScan).filter(or_(
+        PlantScan.recommendations_status == "pending",
+        and_(
+            PlantScan.recommendations_status.in_(("processing", "failed")),
+            PlantScan.recommendations_attempts < max_attempts,
+            PlantScan.recommendations_retry_at <= now,
+        ),
+    )).order_by(PlantScan.id).limit(limit).with_for_update(skip_locked=True).all()
+    for scan in scans:
+        scan.recommendations_status = "processing"
+        scan.recommendations_attempts = (scan.recommendations_attempts or 0) + 1
+        scan.recommendations_retry_at = now + timedelta(seconds=lease_seconds)
+    return scans
+
+def save_scan_recommendations(db: Session, scan_id: int, attempt: int, recommendations: str,
+                              status: str, retry_at: Optional[datetime] = None) -> bool:
+    """
+    Enregistre les recommandations d'un scan réservé; sans effet si la réservation a expiré
+    et que le scan a été repris entre-temps (tentative différente). L'appelant valide la transaction.
+    """
+    return db.query(PlantScan).filter(
+        PlantScan.id == scan_id,
+        PlantScan.recommendations_status == "processing",
+        PlantScan.recommendations_attempts == attempt,
+    ).update({
+        "recommendations": recommendations,
+        "recommendations_status": status,
+        "recommendations_retry_at": retry_at,
+    }, synchronize_session=False) > 0
+
 def create_scan_disease(db: Session, scan_disease: ScanDiseaseCreate, scan_id: int) -> ScanDisease:
     db_scan_disease = ScanDisease(**scan_disease, scan_id=scan_id)
     db.add(db_scan_disease)
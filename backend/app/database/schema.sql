@@ -64,4 +64,30 @@ $$ language 'plpgsql';
 CREATE TRIGGER update_activities_updated_at 
     BEFORE UPDATE ON activities 
     FOR EACH ROW 
-    EXECUTE FUNCTION update_updated_at_column();
\ No newline at end of file
+    EXECUTE FUNCTION update_updated_at_column();
+
+-- Cache persistant des recommandations générées par maladie
+CREATE TABLE IF NOT EXISTS recommendation_cache (
+    id SERIAL PRIMARY KEY,
+    disease_class VARCHAR(255) NOT NULL,
+    language VARCHAR(10) NOT NULL,
+    prompt_version VARCHAR(20) NOT NULL,
+    content TEXT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    CONSTRAINT uq_recommendation_cache_key UNIQUE (disease_class, language, prompt_version)
+);
+
+CREATE TRIGGER update_recommendation_cache_updated_at 
+    BEFORE UPDATE ON recommendation_cache 
+    FOR EACH ROW 
+    EXECUTE FUNCTION update_updated_at_column();
+
+
+
+-- Enrichissement asynchrone des recommandations des scans
+ALTER TABLE plant_scans ADD COLUMN IF NOT EXISTS recommendations_status VARCHAR(20) DEFAULT 'ready' NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_plant_scans_recommendations_pending ON plant_scans(id) WHERE recommendations_status = 'pending';
+ALTER TABLE plant_scans ADD COLUMN IF NOT EXISTS recommendations_attempts INTEGER DEFAULT 0 NOT NULL;
+ALTER TABLE plant_scans ADD COLUMN IF NOT EXISTS recommendations_retry_at TIMESTAMP WITH TIME ZONE;
+CREATE INDEX IF NOT EXISTS idx_plant_scans_recommendations_retry ON plant_scans(recommendations_retry_at) WHERE recommendations_status IN ('processing', 'failed');
@@ -1,4 +1,5 @@
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.middleware.cors import CORSMiddleware
@@ -7,13 +8,32 @@ from app.database import get_db, engine, Base
 from app.routes import auth, user, plants, diseases, scans, files,ml,stats,activity,push_token
 from app.core.config import settings # Importez les paramètres de configuration
 from app.core.security import get_current_user
+from app.services.ml_service import ml_service, configure_api_threadpool
+from app.services.recommendation_worker import recommendation_worker
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Borne le threadpool des routes synchrones pour que les endpoints
+    # orientés base de données ne puissent pas affamer l'inférence
+    configure_api_threadpool(settings.api_threadpool_size)
+    # Le modèle se charge en arrière-plan: les endpoints hors ML répondent
+    # immédiatement et /api/ml/ready passe à 200 une fois le modèle prêt
+    ml_service.start_background_initialization()
+    # Complète les recommandations des scans en attente, y compris ceux d'avant un redémarrage
+    if settings.ml_async_recommendations:
+        recommendation_worker.start()
+    yield
+    recommendation_worker.stop()
+    ml_service.shutdown()
 
 
 app = FastAPI(
     title="PhytoVigil API",
     description="API pour la détection de maladies des plantes et la gestion des utilisateurs.",
     version="0.1.0",
-    debug=settings.debug # Utilise le paramètre de débogage
+    debug=settings.debug, # Utilise le paramètre de débogage
+    lifespan=lifespan
 )
 
 # Configuration CORS
@@ -44,6 +64,11 @@ async def root():
         "version": "1.0.0"
         }
 
+@app.get("/health")
+async def health():
+    """Sonde de vivacité: le processus répond, indépendamment de l'état du modèle"""
+    return {"status": "alive"}
+
 # Exemple de route protégée pour tester
 @app.get("/protected-route")
 async def protected_route(current_user: user = Depends(get_current_user)):
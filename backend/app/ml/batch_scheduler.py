@@ -0,0 +1,299 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Dict, List, Optional
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingItem:
+    """Élément en attente dans la file du scheduler"""
+
+    __slots__ = ("tensor", "key", "future", "enqueued_at")
+
+    def __init__(self, tensor: Any, key: Any = None):
+        self.tensor = tensor
+        self.key = key
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+def concatenate_batch(tensors: List[np.ndarray]) -> np.ndarray:
+    """Assemblage par défaut: concaténation des images (1, H, W, C) en (N, H, W, C)"""
+    return np.concatenate(tensors, axis=0)
+
+
+class BatchScheduler:
+    """
+    Ordonnanceur de micro-batching dynamique pour l'inférence.
+
+    Les images prétraitées soumises de façon concurrente sont regroupées en un
+    seul tenseur (N, H, W, C) jusqu'à `max_batch_size` éléments ou `max_wait_ms`
+    d'attente, puis une seule passe avant est effectuée et chaque ligne du
+    résultat est renvoyée à l'appelant correspondant.
+
+    Aucune attente n'est ajoutée lorsque le modèle est libre: si aucune passe
+    avant n'est en cours, le batch part immédiatement avec les éléments déjà en
+    file. Les éléments ne sont retenus (jusqu'à `max_wait_ms`) que pendant
+    qu'une autre passe avant s'exécute, le modèle étant de toute façon occupé.
+
+    Sans `executor`, les batches sont exécutés un par un par le thread du
+    scheduler. Avec un `executor`, jusqu'à `max_concurrent_batches` batches
+    peuvent être en cours simultanément; pendant ce temps la file continue de
+    se remplir et le batch suivant sera plus gros.
+
+    `collate_fn` transforme la liste des éléments soumis en entrée de
+    `predict_fn` (par défaut une concaténation NumPy).
+
+    Chaque élément peut porter une clé (ex: la version du modèle acquise par la
+    requête): un batch ne regroupe que des éléments de même clé, transmise à
+    `predict_fn(batch, key)`.
+    """
+
+    def __init__(
+        self,
+        predict_fn: Callable[[Any, Any], np.ndarray],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        name: str = "inference",
+        executor: Optional[Executor] = None,
+        max_concurrent_batches: int = 1,
+        collate_fn: Callable[[List[Any]], Any] = concatenate_batch,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size doit être supérieur ou égal à 1")
+        if max_wait_ms < 0:
+            raise ValueError("max_wait_ms doit être positif")
+        if max_concurrent_batches < 1:
+            raise ValueError("max_concurrent_batches doit être supérieur ou égal à 1")
+
+        self.predict_fn = predict_fn
+        self.collate_fn = collate_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.name = name
+        self.executor = executor
+        self.max_concurrent_batches = max_concurrent_batches
+
+        self._inflight = threading.BoundedSemaphore(max_concurrent_batches)
+        # Batches soumis et non terminés (passes avant en cours)
+        self._active_batches = 0
+        self._active_lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[_PendingItem]]" = queue.Queue()
+        # Éléments d'une autre clé écartés du batch en cours (thread du scheduler uniquement)
+        self._held: "deque[_PendingItem]" = deque()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._total_requests = 0
+        self._total_batches = 0
+        self._failed_batches = 0
+        self._max_batch_seen = 0
+        self._batch_size_histogram: Dict[int, int] = {}
+        self._total_queue_wait = 0.0
+        self._max_queue_wait = 0.0
+        self._total_inference_time = 0.0
+        self._immediate_batches = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Démarre le thread de traitement (idempotent)"""
+        with self._start_lock:
+            if self.running:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name=f"batch-scheduler-{self.name}", daemon=True
+            )
+            self._thread.start()
+            logger.info(
+                f"🚀 Scheduler de batch '{self.name}' démarré "
+                f"(max_batch_size={self.max_batch_size}, max_wait_ms={self.max_wait_ms})"
+            )
+
+    def stop(self, timeout: Optional[float] = 5.0):
+        """Arrête le thread de traitement après avoir vidé la file"""
+        with self._start_lock:
+            if not self.running:
+                return
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+            logger.info(f"Scheduler de batch '{self.name}' arrêté")
+
+    def submit(self, tensor: Any, key: Any = None) -> Future:
+        """Soumet une image prétraitée de forme (1, H, W, C) et retourne un Future"""
+        if len(tensor.shape) != 4 or tensor.shape[0] != 1:
+            raise ValueError(f"Forme d'entrée inattendue pour le scheduler: {tensor.shape}")
+
+        self.start()
+        item = _PendingItem(tensor, key)
+        self._queue.put(item)
+        return item.future
+
+    def predict(self, tensor: Any, key: Any = None, timeout: Optional[float] = None) -> np.ndarray:
+        """Soumet une image et attend le vecteur de probabilités correspondant"""
+        return self.submit(tensor, key).result(timeout)
+
+    def _collect_batch(self, first: _PendingItem) -> List[_PendingItem]:
+        """
+        Collecte les éléments suivants de même clé: ceux déjà en file si le modèle est
+        libre, sinon jusqu'à la taille ou l'attente maximale
+        """
+        batch = [first]
+
+        # Reprendre d'abord les éléments écartés qui partagent la clé de ce batch
+        if self._held:
+            remaining = deque()
+            for item in self._held:
+                if item.key == first.key and len(batch) < self.max_batch_size:
+                    batch.append(item)
+                else:
+                    remaining.append(item)
+            self._held = remaining
+
+        deadline = first.enqueued_at + self.max_wait_ms / 1000.0
+
+        while len(batch) < self.max_batch_size:
+            with self._active_lock:
+                idle = self._active_batches == 0
+            # Modèle libre: attendre d'autres éléments ne ferait qu'ajouter de la latence
+            remaining = 0.0 if idle else deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    # Attente écoulée: prendre seulement ce qui est déjà en file
+                    item = self._queue.get_nowait()
+                else:
+                    item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+
+            if item is None:
+                # Signal d'arrêt: le remettre pour la boucle principale
+                self._queue.put(None)
+                break
+            if item.key != first.key:
+                # Jamais deux clés dans un même batch: l'élément ouvrira un batch suivant
+                self._held.append(item)
+                continue
+            batch.append(item)
+
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._held.popleft() if self._held else self._queue.get()
+            if first is None:
+                while self._held:
+                    self._held.popleft().future.set_exception(RuntimeError("Scheduler de batch arrêté"))
+                break
+
+            if self.executor is None:
+                batch = self._collect_batch(first)
+                self._batch_started()
+                try:
+                    self._execute(batch)
+                finally:
+                    self._batch_finished()
+                continue
+
+            # Attendre une place libre avant de fermer le batch: les requêtes
+            # arrivées entre-temps rejoignent ce batch
+            self._inflight.acquire()
+            batch = self._collect_batch(first)
+            self._batch_started()
+            try:
+                self.executor.submit(self._execute_and_release, batch)
+            except Exception as e:
+                self._batch_finished()
+                self._inflight.release()
+                logger.error(f"Impossible de soumettre le batch à l'executor: {str(e)}")
+                for item in batch:
+                    item.future.set_exception(e)
+
+    def _batch_started(self):
+        with self._active_lock:
+            immediate = self._active_batches == 0
+            self._active_batches += 1
+        if immediate:
+            with self._stats_lock:
+                self._immediate_batches += 1
+
+    def _batch_finished(self):
+        with self._active_lock:
+            self._active_batches -= 1
+
+    def _execute_and_release(self, batch: List[_PendingItem]):
+        try:
+            self._execute(batch)
+        finally:
+            self._batch_finished()
+            self._inflight.release()
+
+    def _execute(self, batch: List[_PendingItem]):
+        started_at = time.perf_counter()
+        waits = [started_at - item.enqueued_at for item in batch]
+
+        try:
+            inputs = self.collate_fn([item.tensor for item in batch])
+            outputs = self.predict_fn(inputs, batch[0].key)
+
+            if outputs.shape[0] != len(batch):
+                raise ValueError(
+                    f"Le modèle a retourné {outputs.shape[0]} lignes pour un batch de {len(batch)}"
+                )
+
+            for index, item in enumerate(batch):
+                item.future.set_result(outputs[index])
+            failed = False
+        except Exception as e:
+            logger.error(f"Erreur lors de l'exécution du batch ({len(batch)} images): {str(e)}")
+            for item in batch:
+                item.future.set_exception(e)
+            failed = True
+
+        inference_time = time.perf_counter() - started_at
+        with self._stats_lock:
+            size = len(batch)
+            self._total_requests += size
+            self._total_batches += 1
+            self._failed_batches += int(failed)
+            self._max_batch_seen = max(self._max_batch_seen, size)
+            self._batch_size_histogram[size] = self._batch_size_histogram.get(size, 0) + 1
+            self._total_queue_wait += sum(waits)
+            self._max_queue_wait = max(self._max_queue_wait, max(waits))
+            self._total_inference_time += inference_time
+
+    def get_stats(self) -> dict:
+        """Retourne les statistiques de taille de batch et d'attente en file"""
+        with self._stats_lock:
+            batches = self._total_batches
+            requests = self._total_requests
+            return {
+                "running": self.running,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "max_concurrent_batches": self.max_concurrent_batches,
+                "queue_size": self._queue.qsize() + len(self._held),
+                "active_batches": self._active_batches,
+                "immediate_batches": self._immediate_batches,
+                "total_requests": requests,
+                "total_batches": batches,
+                "failed_batches": self._failed_batches,
+                "avg_batch_size": round(requests / batches, 3) if batches else 0.0,
+                "max_batch_size_seen": self._max_batch_seen,
+                "batch_size_histogram": dict(sorted(self._batch_size_histogram.items())),
+                "avg_queue_wait_ms": round(self._total_queue_wait / requests * 1000, 3) if requests else 0.0,
+                "max_queue_wait_ms": round(self._max_queue_wait * 1000, 3),
+                "avg_batch_inference_ms": round(self._total_inference_time / batches * 1000, 3) if batches else 0.0,
+            }
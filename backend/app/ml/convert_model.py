@@ -0,0 +1,208 @@
+"""
+Conversion de best_model.keras vers les artefacts des autres moteurs d'inférence.
+
+Produit best_model_fp16.tflite, best_model_int8.tflite et/ou best_model.onnx à côté
+du modèle Keras, puis vérifie l'accord top-1 de chaque artefact avec le modèle
+d'origine sur un échantillon d'images et mesure sa latence. Usage, depuis le dossier backend:
+
+    python -m app.ml.convert_model --targets tflite_fp16 tflite_int8 onnx --samples chemin/vers/images
+
+L'export ONNX nécessite tf2onnx (pip install tf2onnx onnxruntime); le serveur
+n'a ensuite besoin que d'onnxruntime.
+
+Sans --samples, la conversion int8 se limite à la quantification dynamique des
+poids et l'accord est mesuré sur des entrées aléatoires (indicatif seulement).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .image_preprocessor import image_preprocessor
+from .inference_engines import KerasEngine, artifact_path_for, create_engine
+from .model_loader import DEFAULT_CLASS_NAMES_PATH, DEFAULT_MODEL_PATH
+
+SAMPLE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+
+
+def load_samples(samples_dir: Optional[str], max_samples: int) -> np.ndarray:
+    """Prétraite les images d'échantillon (N, H, W, 3); entrées aléatoires à défaut"""
+    batches: List[np.ndarray] = []
+    if samples_dir:
+        for root, _, files in os.walk(samples_dir):
+            for file_name in sorted(files):
+                if os.path.splitext(file_name)[1].lower() not in SAMPLE_EXTENSIONS:
+                    continue
+                with open(os.path.join(root, file_name), "rb") as f:
+                    try:
+                        batch = image_preprocessor.preprocess(f.read())
+                        # Le modèle Keras converti attend des entrées 0-1, même avec ML_UINT8_INPUT
+                        batches.append(image_preprocessor.normalize_image(batch) if batch.dtype == np.uint8 else batch)
+                    except ValueError as e:
+                        print(f"⚠️ Image ignorée {file_name}: {e}")
+                if len(batches) >= max_samples:
+                    return np.concatenate(batches, axis=0)
+    if batches:
+        return np.concatenate(batches, axis=0)
+
+    print("⚠️ Aucun échantillon fourni: accord mesuré sur des entrées aléatoires (indicatif)")
+    rng = np.random.default_rng(0)
+    height, width = image_preprocessor.target_size
+    return rng.random((min(max_samples, 32), height, width, 3), dtype=np.float32)
+
+
+def convert_tflite(keras_engine: KerasEngine, target: str, samples: Optional[np.ndarray]) -> bytes:
+    """Convertit le modèle Keras en TFLite float16 ou int8"""
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_engine.model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if target == "tflite_fp16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif samples is not None:
+        # Quantification entière complète calibrée sur les échantillons;
+        # entrées/sorties float32 pour garder la même interface predict(batch)
+        def representative_dataset():
+            for index in range(len(samples)):
+                yield [samples[index:index + 1]]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [
+            tf.lite.OpsSet.TFLITE_BUILTINS_INT8,
+            tf.lite.OpsSet.TFLITE_BUILTINS,
+        ]
+    # Sinon: quantification dynamique des poids (int8) uniquement
+
+    return converter.convert()
+
+
+def export_onnx(keras_engine: KerasEngine, artifact_path: str, opset: int):
+    """Exporte le modèle Keras en ONNX avec une dimension batch libre"""
+    import tensorflow as tf
+    import tf2onnx
+
+    input_signature = (
+        tf.TensorSpec((None, *keras_engine.input_shape[1:]), tf.float32, name="input"),
+    )
+    tf2onnx.convert.from_keras(
+        keras_engine.model, input_signature=input_signature, opset=opset, output_path=artifact_path
+    )
+
+
+def measure_latency(engine, samples: np.ndarray, batch_sizes: List[int], repeats: int = 20) -> Dict:
+    """Latence médiane d'un moteur par taille de batch (après un appel de chauffe)"""
+    latencies = {}
+    for batch_size in batch_sizes:
+        batch = np.resize(samples, (batch_size, *samples.shape[1:])).astype(np.float32)
+        engine.predict(batch)
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            engine.predict(batch)
+            timings.append((time.perf_counter() - start) * 1000)
+        latencies[str(batch_size)] = round(float(np.median(timings)), 3)
+    return latencies
+
+
+def top1_agreement(reference: np.ndarray, candidate: np.ndarray) -> float:
+    return float(np.mean(np.argmax(reference, axis=1) == np.argmax(candidate, axis=1)))
+
+
+def predict_in_batches(engine, samples: np.ndarray, batch_size: int = 16) -> np.ndarray:
+    return np.concatenate(
+        [engine.predict(samples[start:start + batch_size]) for start in range(0, len(samples), batch_size)],
+        axis=0,
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="Chemin de best_model.keras")
+    parser.add_argument("--class-names", default=DEFAULT_CLASS_NAMES_PATH, help="Chemin de class_names.json")
+    parser.add_argument("--targets", nargs="+", default=["tflite_fp16", "tflite_int8"],
+                        choices=["tflite_fp16", "tflite_int8", "onnx"])
+    parser.add_argument("--samples", help="Dossier d'images pour la calibration et la vérification")
+    parser.add_argument("--max-samples", type=int, default=200)
+    parser.add_argument("--min-agreement", type=float, default=0.98,
+                        help="Accord top-1 minimal avec le modèle Keras")
+    parser.add_argument("--onnx-opset", type=int, default=17)
+    parser.add_argument("--latency-batch-sizes", type=int, nargs="+", default=[1, 8],
+                        help="Tailles de batch pour la mesure de latence de chaque moteur")
+    args = parser.parse_args(argv)
+
+    with open(args.class_names, "r", encoding="utf-8") as f:
+        class_names = json.load(f)
+
+    keras_engine = KerasEngine(args.model)
+    keras_engine.load()
+    if keras_engine.output_shape[-1] != len(class_names):
+        print(f"❌ Le modèle produit {keras_engine.output_shape[-1]} classes, "
+              f"class_names.json en contient {len(class_names)}")
+        return 1
+
+    samples = load_samples(args.samples, args.max_samples)
+    reference = predict_in_batches(keras_engine, samples)
+
+    report: Dict = {
+        "source_model": args.model,
+        "class_names": args.class_names,
+        "classes_count": len(class_names),
+        "samples": int(len(samples)),
+        "samples_are_real_images": bool(args.samples),
+        "latency_ms": {"keras": measure_latency(keras_engine, samples, args.latency_batch_sizes)},
+        "artifacts": {},
+    }
+    success = True
+
+    for target in args.targets:
+        calibration = samples if (target == "tflite_int8" and args.samples) else None
+        artifact_path = artifact_path_for(target, args.model)
+        if target == "onnx":
+            export_onnx(keras_engine, artifact_path, args.onnx_opset)
+        else:
+            with open(artifact_path, "wb") as f:
+                f.write(convert_tflite(keras_engine, target, calibration))
+
+        engine = create_engine(target, artifact_path)
+        engine.load()
+        candidate = predict_in_batches(engine, samples)
+        agreement = top1_agreement(reference, candidate)
+        disagreements = np.flatnonzero(np.argmax(reference, axis=1) != np.argmax(candidate, axis=1))
+        report["latency_ms"][target] = measure_latency(engine, samples, args.latency_batch_sizes)
+
+        report["artifacts"][target] = {
+            "path": artifact_path,
+            "size_bytes": os.path.getsize(artifact_path),
+            "top1_agreement": round(agreement, 4),
+            "max_abs_probability_diff": float(np.max(np.abs(reference - candidate))),
+            "disagreements": [
+                {
+                    "sample": int(index),
+                    "keras": class_names[int(np.argmax(reference[index]))],
+                    target: class_names[int(np.argmax(candidate[index]))],
+                }
+                for index in disagreements[:20]
+            ],
+        }
+        passed = agreement >= args.min_agreement
+        success = success and passed
+        print(f"{'✅' if passed else '❌'} {target}: {artifact_path} "
+              f"({os.path.getsize(artifact_path) / 1e6:.1f} MB), accord top-1 {agreement:.2%}, "
+              f"latence {report['latency_ms'][target]} ms (keras: {report['latency_ms']['keras']} ms)")
+        engine.close()
+
+    report_path = os.path.splitext(args.model)[0] + "_conversion_report.json"
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Rapport écrit dans {report_path}")
+
+    return 0 if success else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,156 @@
 import numpy as np
 from PIL import Image, ImageOps
 import io
-from typing import Tuple, Optional
+from typing import Dict, Tuple, Optional, Union
 import logging
 
+from app.core.config import settings
+from .near_duplicate_index import compute_dhash
+
 logger = logging.getLogger(__name__)
 
+# Profils de décodage: (taille de décodage JPEG demandée, en multiple de la cible, filtre de redimensionnement).
+# Le décodage réduit (DCT à 1/2, 1/4 ou 1/8) donne la plus petite taille supérieure ou égale à la demande.
+DECODE_PROFILES = {
+    "exact": (None, Image.Resampling.LANCZOS),
+    "quality": (2, Image.Resampling.LANCZOS),
+    "speed": (1, Image.Resampling.BILINEAR),
+}
+
+PREPROCESS_BACKENDS = ("pil", "opencv")
+INPUT_DTYPES = ("float32", "uint8")
+
+class DecodedImage:
+    """
+    Image d'une requête décodée une seule fois (orientation EXIF corrigée, RGB),
+    partagée par le prétraitement ML et l'envoi vers le stockage. Les variantes
+    dérivées (entrée du modèle, fichier encodé) sont calculées à la demande et conservées.
+    Décodée par le backend OpenCV, l'image est gardée en pixels BGR (`pixels`):
+    l'entrée du modèle en est dérivée directement, l'image PIL seulement pour le stockage.
+    """
+    
+    def __init__(self, image: Optional[Image.Image], source_format: Optional[str], reduced: bool = False,
+                 pixels: Optional[np.ndarray] = None, stored: Optional[Image.Image] = None):
+        self._image = image
+        self.source_format = source_format
+        # Décodée en résolution réduite (JPEG): réservée à l'entrée du modèle
+        self.reduced = reduced
+        self.pixels = pixels
+        # Image RGBA d'origine: le fichier stocké perd la transparence sans composition
+        # sur fond blanc (réservée à l'entrée du modèle), comme avant le décodage partagé
+        self._stored = stored
+        self._resized: Dict[Tuple, Image.Image] = {}
+        self._encoded: Dict[Tuple, bytes] = {}
+    
+    @property
+    def image(self) -> Image.Image:
+        if self._image is None:
+            self._image = Image.fromarray(np.ascontiguousarray(self.pixels[:, :, ::-1]))
+        return self._image
+    
+    @property
+    def size(self) -> Tuple[int, int]:
+        if self._image is None:
+            return self.pixels.shape[1], self.pixels.shape[0]
+        return self._image.size
+    
+    def resized(self, size: Tuple[int, int], resample=Image.Resampling.LANCZOS) -> Image.Image:
+        """Variante redimensionnée (entrée du modèle)"""
+        key = (size, resample)
+        resized = self._resized.get(key)
+        if resized is None:
+            resized = self.image.resize(size, resample)
+            self._resized[key] = resized
+        return resized
+    
+    def encoded(self, image_format: str = "WEBP", quality: int = 80) -> bytes:
+        """Variante encodée (fichier envoyé vers le stockage)"""
+        key = (image_format, quality)
+        data = self._encoded.get(key)
+        if data is None:
+            image = self.image if self._stored is None else self._stored.convert('RGB')
+            buffer = io.BytesIO()
+            image.save(buffer, format=image_format, quality=quality)
+            data = buffer.getvalue()
+            self._encoded[key] = data
+        return data
+
 class ImagePreprocessor:
     """Gestionnaire de prétraitement des images pour le modèle ML"""
     
-    def __init__(self, target_size: Tuple[int, int] = (224, 224)):
+    def __init__(self, target_size: Tuple[int, int] = (224, 224), decode_profile: str = "exact",
+                 backend: str = "pil", input_dtype: str = "float32"):
+        if decode_profile not in DECODE_PROFILES:
+            raise ValueError(f"Profil de décodage inconnu: {decode_profile} (attendu: {', '.join(DECODE_PROFILES)})")
+        if backend not in PREPROCESS_BACKENDS:
+            raise ValueError(f"Backend de prétraitement inconnu: {backend} (attendu: {', '.join(PREPROCESS_BACKENDS)})")
+        if input_dtype not in INPUT_DTYPES:
+            raise ValueError(f"Type d'entrée inconnu: {input_dtype} (attendu: {', '.join(INPUT_DTYPES)})")
         self.target_size = target_size
+        self.decode_profile = decode_profile
+        # uint8: pixels 0-255 sans normalisation (mise à l'échelle intégrée au modèle)
+        self.input_dtype = np.dtype(input_dtype)
         self.supported_formats = {'JPEG', 'PNG', 'JPG', 'WEBP', 'BMP'}
+        
+        # Backend OpenCV/NumPy pour les octets bruts (import différé, PIL à défaut)
+        self.backend = backend
+        self._opencv = None
+        if backend == "opencv":
+            try:
+                from .opencv_preprocessor import OpenCVPreprocessor
+                
+                self._opencv = OpenCVPreprocessor(
+                    target_size,
+                    self.supported_formats,
+                    draft_factor=DECODE_PROFILES[decode_profile][0],
+                    fast_resize=decode_profile == "speed",
+                    output_dtype=self.input_dtype,
+                )
+            except ImportError as e:
+                logger.error(f"❌ OpenCV indisponible, prétraitement PIL utilisé: {e}")
+                self.backend = "pil"
+    
+    def decode(self, image_bytes: bytes, reduced: bool = False) -> DecodedImage:
+        """
+        Décode l'image une seule fois: validation du format, orientation EXIF et
+        conversion RGB. Lève ValueError si le format n'est pas supporté.
+        Avec `reduced`, un JPEG est décodé directement à taille réduite selon le profil
+        de décodage: l'image ne sert alors qu'à l'entrée du modèle. Sans `reduced`, le
+        backend OpenCV, s'il est configuré, décode l'image (pixels BGR).
+        """
+        if self._opencv is not None and not reduced:
+            # Image partagée par la requête: décodée par le backend configuré
+            image_format, pixels = self._opencv.read(image_bytes, reduced=False)
+            stored = None
+            if pixels.shape[2] == 4:
+                stored = Image.fromarray(np.ascontiguousarray(pixels[:, :, [2, 1, 0, 3]]), 'RGBA')
+            return DecodedImage(None, image_format, pixels=self._opencv.compose(pixels), stored=stored)
+        
+        try:
+            image = Image.open(io.BytesIO(image_bytes))
+        except Exception as e:
+            raise ValueError(f"Image illisible: {str(e)}")
+        if image.format not in self.supported_formats:
+            raise ValueError("Format d'image non supporté")
+        source_format = image.format
+        logger.debug(f"Image originale: {image.size}, mode: {image.mode}")
+        
+        draft_factor = DECODE_PROFILES[self.decode_profile][0]
+        if reduced and draft_factor is not None and source_format == 'JPEG':
+            # Cible carrée: la taille demandée ne dépend pas de l'orientation EXIF
+            side = max(self.target_size) * draft_factor
+            image.draft('RGB', (side, side))
+            logger.debug(f"Décodage réduit: {image.size}")
+        else:
+            reduced = False
+        
+        # Amélioration (orientation, etc.) puis conversion en RGB
+        image = self.enhance_image(image)
+        stored = image if image.mode == 'RGBA' and not reduced else None
+        image = self.convert_to_rgb(image)
+        # Pixels chargés dès maintenant: les variantes peuvent être dérivées depuis plusieurs threads
+        image.load()
+        return DecodedImage(image, source_format, reduced=reduced, stored=stored)
     
     def validate_image(self, image_bytes: bytes) -> bool:
         """Valide qu'un fichier est une image supportée"""
@@ -31,11 +170,14 @@ class ImagePreprocessor:
             logger.error(f"Erreur lors du redimensionnement: {str(e)}")
             raise ValueError(f"Impossible de redimensionner l'image: {str(e)}")
     
-    def normalize_image(self, image_array: np.ndarray) -> np.ndarray:
-        """Normalise les valeurs des pixels (0-255 -> 0-1)"""
+    def normalize_image(self, image_array: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Normalise les valeurs des pixels (0-255 -> 0-1), éventuellement dans un buffer fourni"""
         try:
             # Convertir en float32 et normaliser
-            normalized = image_array.astype(np.float32) / 255.0
+            if out is None:
+                normalized = image_array.astype(np.float32) / 255.0
+            else:
+                normalized = np.divide(image_array, np.float32(255.0), out=out, dtype=np.float32)
             
             # Vérifier les valeurs
             if np.any(normalized < 0) or np.any(normalized > 1):
@@ -77,6 +219,13 @@ class ImagePreprocessor:
             logger.warning(f"Amélioration d'image échouée: {str(e)}")
             return image  # Retourner l'image originale en cas d'erreur
     
+    def compute_dhash(self, image: Image.Image, hash_size: int = 8) -> int:
+        """
+        Empreinte perceptuelle (dHash) de l'image RGB redimensionnée (voir near_duplicate_index.compute_dhash).
+        Des photos quasi identiques donnent des empreintes proches en distance de Hamming.
+        """
+        return compute_dhash(np.asarray(image), hash_size)
+    
     def add_batch_dimension(self, image_array: np.ndarray) -> np.ndarray:
         """Ajoute la dimension batch pour la prédiction"""
         try:
@@ -90,38 +239,60 @@ class ImagePreprocessor:
             logger.error(f"Erreur lors de l'ajout de la dimension batch: {str(e)}")
             raise ValueError(f"Impossible d'ajouter la dimension batch: {str(e)}")
     
-    def preprocess(self, image_bytes: bytes) -> np.ndarray:
-        """Pipeline complet de prétraitement d'image"""
+    def preprocess(self, image: Union[bytes, DecodedImage], out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Pipeline complet de prétraitement d'image (octets bruts ou image déjà décodée).
+        Si `out` (forme (1, H, W, C), du type `input_dtype`) est fourni, le résultat y est écrit
+        directement, par exemple dans un emplacement de mémoire partagée.
+        """
+        return self._preprocess(image, out)[0]
+    
+    def preprocess_with_hash(self, image: Union[bytes, DecodedImage],
+                             out: Optional[np.ndarray] = None) -> Tuple[np.ndarray, int]:
+        """Prétraitement complet et empreinte dHash calculée sur l'image déjà redimensionnée"""
+        return self._preprocess(image, out, with_hash=True)
+    
+    def _preprocess(self, image: Union[bytes, DecodedImage], out: Optional[np.ndarray] = None,
+                    with_hash: bool = False) -> Tuple[np.ndarray, Optional[int]]:
         try:
-            # Étape 1: Validation
-            if not self.validate_image(image_bytes):
-                raise ValueError("Format d'image non supporté")
-            
-            # Étape 2: Ouverture de l'image
-            image = Image.open(io.BytesIO(image_bytes))
-            logger.debug(f"Image originale: {image.size}, mode: {image.mode}")
+            if self._opencv is not None and not isinstance(image, DecodedImage):
+                return self._opencv.preprocess(image, out, with_hash)
+            if self._opencv is not None and image.pixels is not None:
+                return self._opencv.preprocess_pixels(image.pixels, out, with_hash)
             
-            # Étape 3: Amélioration (orientation, etc.)
-            image = self.enhance_image(image)
+            # Étapes 1 à 4: validation, ouverture, orientation et RGB, en un seul décodage
+            # (à taille réduite pour un JPEG dont seul le modèle a besoin)
+            decoded = image if isinstance(image, DecodedImage) else self.decode(image, reduced=True)
             
-            # Étape 4: Conversion en RGB
-            image = self.convert_to_rgb(image)
-            
-            # Étape 5: Redimensionnement
-            image = self.resize_image(image)
+            # Étape 5: Redimensionnement (filtre du profil après un décodage réduit, LANCZOS sinon)
+            resample = DECODE_PROFILES[self.decode_profile][1] if decoded.reduced else Image.Resampling.LANCZOS
+            try:
+                image = decoded.resized(self.target_size, resample)
+            except Exception as e:
+                logger.error(f"Erreur lors du redimensionnement: {str(e)}")
+                raise ValueError(f"Impossible de redimensionner l'image: {str(e)}")
+            image_hash = self.compute_dhash(image) if with_hash else None
             
             # Étape 6: Conversion en array numpy
             image_array = np.array(image)
             logger.debug(f"Array shape après conversion: {image_array.shape}")
             
-            # Étape 7: Normalisation
-            image_array = self.normalize_image(image_array)
+            # Étape 7: Normalisation (entrée uint8: copie telle quelle, l'échelle est appliquée par le modèle)
+            if self.input_dtype == np.uint8:
+                if out is not None:
+                    np.copyto(out[0], image_array)
+                    image_array = out
+            elif out is not None:
+                self.normalize_image(image_array, out=out[0])
+                image_array = out
+            else:
+                image_array = self.normalize_image(image_array)
             
             # Étape 8: Ajout de la dimension batch
             image_array = self.add_batch_dimension(image_array)
             
             logger.debug(f"Image prétraitée: {image_array.shape}, dtype: {image_array.dtype}")
-            return image_array
+            return image_array, image_hash
             
         except Exception as e:
             logger.error(f"Erreur dans le pipeline de prétraitement: {str(e)}")
@@ -132,9 +303,16 @@ class ImagePreprocessor:
         return {
             "target_size": self.target_size,
             "supported_formats": list(self.supported_formats),
-            "normalization": "0-255 -> 0-1",
+            "normalization": "dans le modèle (uint8)" if self.input_dtype == np.uint8 else "0-255 -> 0-1",
+            "input_dtype": self.input_dtype.name,
+            "decode_profile": self.decode_profile,
+            "backend": self.backend,
             "color_mode": "RGB"
         }
 
 # Instance globale du préprocesseur
-image_preprocessor = ImagePreprocessor()
+image_preprocessor = ImagePreprocessor(
+    decode_profile=settings.ml_decode_profile,
+    backend=settings.ml_preprocess_backend,
+    input_dtype="uint8" if settings.ml_uint8_input else "float32",
+)
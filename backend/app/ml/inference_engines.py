@@ -0,0 +1,342 @@
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceEngine:
+    """
+    Interface commune des moteurs d'inférence.
+    Chaque moteur charge un artefact et expose predict(batch) -> probabilités (N, C),
+    ce qui rend PredictionService indépendant du moteur utilisé.
+    """
+
+    name = "base"
+    # Suffixe de l'artefact à côté de best_model.keras (ex: best_model_fp16.tflite)
+    artifact_suffix = ".keras"
+
+    def __init__(self, model_path: str, **options):
+        self.model_path = model_path
+        self.options = options
+        # Type des batches attendus; uint8 lorsque la mise à l'échelle 0-255 -> 0-1 est intégrée au moteur
+        self.input_dtype = np.dtype(np.float32)
+        # Facteur appliqué par le moteur aux entrées uint8 (None: aucun, ou intégré au graphe)
+        self.input_scale: Optional[float] = None
+
+    @property
+    def input_shape(self) -> Tuple:
+        raise NotImplementedError
+
+    @property
+    def output_shape(self) -> Tuple:
+        raise NotImplementedError
+
+    def load(self):
+        """Charge l'artefact; lève une exception en cas d'échec"""
+        raise NotImplementedError
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def fold_input_scaling(self, scale: float):
+        """
+        Accepte des batches uint8 et leur applique `scale` (1/255) dans le moteur:
+        le prétraitement et le transport restent en uint8. Par défaut, la conversion
+        a lieu juste avant l'appel au runtime; KerasEngine l'intègre au graphe.
+        """
+        self.input_scale = scale
+        self.input_dtype = np.dtype(np.uint8)
+
+    def _scale_input(self, batch: np.ndarray) -> np.ndarray:
+        if self.input_scale is None or batch.dtype != np.uint8:
+            return batch
+        return np.multiply(batch, np.float32(self.input_scale), dtype=np.float32)
+
+    def close(self):
+        """Libère les ressources du moteur"""
+
+    def get_info(self) -> Dict:
+        return {
+            "engine": self.name,
+            "artifact_path": self.model_path,
+            "artifact_size_bytes": os.path.getsize(self.model_path) if os.path.exists(self.model_path) else None,
+            "input_shape": str(self.input_shape),
+            "output_shape": str(self.output_shape),
+            "input_scaling": (
+                "graph" if self.input_dtype == np.uint8 and self.input_scale is None
+                else "engine" if self.input_scale is not None
+                else None
+            ),
+        }
+
+
+class KerasEngine(InferenceEngine):
+    """Modèle Keras pleine précision avec fonction d'inférence compilée"""
+
+    name = "keras"
+    artifact_suffix = ".keras"
+
+    def __init__(self, model_path: str, **options):
+        super().__init__(model_path, **options)
+        self.model: Optional[Any] = None
+        # Fonction d'inférence compilée (tf.function à signature fixe)
+        self.inference_fn: Optional[Any] = None
+
+    @property
+    def input_shape(self) -> Tuple:
+        return tuple(self.model.input_shape)
+
+    @property
+    def output_shape(self) -> Tuple:
+        return tuple(self.model.output_shape)
+
+    def load(self):
+        import tensorflow as tf
+
+        # Charger le modèle avec gestion des erreurs TensorFlow
+        self.model = tf.keras.models.load_model(
+            self.model_path,
+            compile=False  # Évite les erreurs de compilation
+        )
+        self.build_inference_function()
+
+    def build_inference_function(self):
+        """
+        Compile un appel direct au modèle avec une signature d'entrée fixe.
+        Contrairement à model.predict, aucun pipeline tf.data ni callback n'est
+        reconstruit à chaque appel; la dimension batch libre évite les retraçages.
+        """
+        import tensorflow as tf
+
+        input_spec = tf.TensorSpec(shape=(None, *self.model.input_shape[1:]), dtype=tf.as_dtype(self.input_dtype))
+        model = self.model
+
+        @tf.function(input_signature=[input_spec])
+        def inference_fn(batch):
+            return model(batch, training=False)
+
+        self.inference_fn = inference_fn
+
+    def fold_input_scaling(self, scale: float):
+        """Ajoute une couche Rescaling devant le modèle: l'entrée du graphe devient uint8"""
+        import tensorflow as tf
+
+        inputs = tf.keras.Input(shape=self.model.input_shape[1:], dtype="uint8", name="image_uint8")
+        scaled = tf.keras.layers.Rescaling(scale, name="input_rescaling")(inputs)
+        self.model = tf.keras.Model(inputs, self.model(scaled), name=f"{self.model.name}_uint8")
+        self.input_dtype = np.dtype(np.uint8)
+        self.build_inference_function()
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        if self.inference_fn is None:
+            return self.model.predict(batch, verbose=0)
+        return self.inference_fn(batch).numpy()
+
+    def close(self):
+        self.model = None
+        self.inference_fn = None
+
+    def get_info(self) -> Dict:
+        info = super().get_info()
+        info["inference_mode"] = "compiled" if self.inference_fn is not None else "predict"
+        return info
+
+
+class TFLiteEngine(InferenceEngine):
+    """
+    Modèle TFLite (float16 ou quantifié int8/dynamic-range).
+    Utilise tflite_runtime s'il est installé, sinon tf.lite. L'interpréteur
+    n'étant pas thread-safe, les appels sont sérialisés par un verrou.
+    """
+
+    name = "tflite"
+    artifact_suffix = ".tflite"
+
+    def __init__(self, model_path: str, num_threads: Optional[int] = None, **options):
+        super().__init__(model_path, **options)
+        self.num_threads = num_threads
+        self.interpreter = None
+        self._input_detail: Dict = {}
+        self._output_detail: Dict = {}
+        self._current_batch_size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def input_shape(self) -> Tuple:
+        return (None, *self._input_detail["shape"][1:])
+
+    @property
+    def output_shape(self) -> Tuple:
+        return (None, *self._output_detail["shape"][1:])
+
+    def load(self):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+        self.interpreter = Interpreter(model_path=self.model_path, num_threads=self.num_threads)
+        self.interpreter.allocate_tensors()
+        self._input_detail = self.interpreter.get_input_details()[0]
+        self._output_detail = self.interpreter.get_output_details()[0]
+        self._current_batch_size = int(self._input_detail["shape"][0])
+
+    def _resize(self, batch_size: int):
+        if batch_size == self._current_batch_size:
+            return
+        shape = [batch_size, *self._input_detail["shape"][1:]]
+        self.interpreter.resize_tensor_input(self._input_detail["index"], shape)
+        self.interpreter.allocate_tensors()
+        self._input_detail = self.interpreter.get_input_details()[0]
+        self._output_detail = self.interpreter.get_output_details()[0]
+        self._current_batch_size = batch_size
+
+    def _quantize_input(self, batch: np.ndarray) -> np.ndarray:
+        dtype = self._input_detail["dtype"]
+        if dtype == np.float32:
+            return batch.astype(np.float32, copy=False)
+        scale, zero_point = self._input_detail["quantization"]
+        info = np.iinfo(dtype)
+        return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+
+    def _dequantize_output(self, output: np.ndarray) -> np.ndarray:
+        if output.dtype == np.float32:
+            return output
+        scale, zero_point = self._output_detail["quantization"]
+        return (output.astype(np.float32) - zero_point) * scale
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        with self._lock:
+            self._resize(batch.shape[0])
+            self.interpreter.set_tensor(self._input_detail["index"], self._quantize_input(self._scale_input(batch)))
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self._output_detail["index"])
+            return self._dequantize_output(output).copy()
+
+    def close(self):
+        self.interpreter = None
+
+    def get_info(self) -> Dict:
+        info = super().get_info()
+        info["input_dtype"] = np.dtype(self._input_detail["dtype"]).name if self._input_detail else None
+        info["num_threads"] = self.num_threads
+        return info
+
+
+class TFLiteFloat16Engine(TFLiteEngine):
+    name = "tflite_fp16"
+    artifact_suffix = "_fp16.tflite"
+
+
+class TFLiteInt8Engine(TFLiteEngine):
+    name = "tflite_int8"
+    artifact_suffix = "_int8.tflite"
+
+
+class OnnxEngine(InferenceEngine):
+    """
+    Modèle exporté en ONNX, exécuté par ONNX Runtime sans importer TensorFlow.
+    InferenceSession.run est thread-safe: aucun verrou n'est nécessaire.
+    """
+
+    name = "onnx"
+    artifact_suffix = ".onnx"
+
+    def __init__(
+        self,
+        model_path: str,
+        intra_op_threads: int = 0,
+        inter_op_threads: int = 0,
+        profile: bool = False,
+        profile_dir: str = "",
+        **options,
+    ):
+        super().__init__(model_path, **options)
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.session = None
+        self._input_name = ""
+        self._output_name = ""
+        self._input_shape: Tuple = ()
+        self._output_shape: Tuple = ()
+        self.profile_path: Optional[str] = None
+
+    @property
+    def input_shape(self) -> Tuple:
+        return self._input_shape
+
+    @property
+    def output_shape(self) -> Tuple:
+        return self._output_shape
+
+    def load(self):
+        import onnxruntime as ort
+
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # 0 laisse ONNX Runtime choisir selon le nombre de cœurs
+        session_options.intra_op_num_threads = self.intra_op_threads
+        session_options.inter_op_num_threads = self.inter_op_threads
+        if self.profile:
+            # Profil JSON (chrome://tracing) écrit à la fermeture de la session
+            session_options.enable_profiling = True
+            session_options.profile_file_prefix = os.path.join(self.profile_dir or ".", "onnx_profile")
+
+        self.session = ort.InferenceSession(
+            self.model_path, sess_options=session_options, providers=["CPUExecutionProvider"]
+        )
+        model_input = self.session.get_inputs()[0]
+        model_output = self.session.get_outputs()[0]
+        self._input_name = model_input.name
+        self._output_name = model_output.name
+        # Les dimensions symboliques (batch) sont renvoyées comme chaînes
+        self._input_shape = tuple(dim if isinstance(dim, int) else None for dim in model_input.shape)
+        self._output_shape = tuple(dim if isinstance(dim, int) else None for dim in model_output.shape)
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return self.session.run(
+            [self._output_name], {self._input_name: self._scale_input(batch).astype(np.float32, copy=False)}
+        )[0]
+
+    def close(self):
+        if self.session is not None and self.profile:
+            self.profile_path = self.session.end_profiling()
+            logger.info(f"Profil ONNX Runtime écrit dans {self.profile_path}")
+        self.session = None
+
+    def get_info(self) -> Dict:
+        info = super().get_info()
+        info.update({
+            "intra_op_threads": self.intra_op_threads,
+            "inter_op_threads": self.inter_op_threads,
+            "profiling": self.profile,
+        })
+        return info
+
+
+ENGINES = {
+    engine.name: engine
+    for engine in (KerasEngine, TFLiteFloat16Engine, TFLiteInt8Engine, OnnxEngine)
+}
+
+
+def artifact_path_for(engine_name: str, keras_model_path: str) -> str:
+    """Chemin de l'artefact d'un moteur, dérivé de celui du modèle Keras"""
+    if engine_name not in ENGINES:
+        raise ValueError(f"Moteur d'inférence inconnu: {engine_name} (disponibles: {sorted(ENGINES)})")
+    base, _ = os.path.splitext(keras_model_path)
+    return base + ENGINES[engine_name].artifact_suffix
+
+
+def create_engine(engine_name: str, model_path: str, **options) -> InferenceEngine:
+    """Instancie le moteur demandé (sans le charger)"""
+    if engine_name not in ENGINES:
+        raise ValueError(f"Moteur d'inférence inconnu: {engine_name} (disponibles: {sorted(ENGINES)})")
+    return ENGINES[engine_name](model_path, **options)
@@ -0,0 +1,379 @@
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Sequence
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ROUTING_STRATEGIES = {"round_robin", "least_loaded"}
+
+
+def _worker_main(worker_id: int, engine_name: str, model_path: str, intra_op_threads: int,
+                 request_queue, response_queue, tensor_ring_spec: Optional[Dict] = None,
+                 warmup_batch_sizes: Sequence[int] = (1,)):
+    """
+    Point d'entrée d'un processus d'inférence.
+    Charge le modèle une seule fois puis traite les batches reçus jusqu'au signal d'arrêt.
+    Les batches arrivent soit sous forme de tableau (pickle), soit sous forme
+    d'indices d'emplacements dans l'anneau de mémoire partagée.
+    """
+    tensor_ring = None
+    try:
+        from app.core.config import settings
+        from app.ml.model_loader import ModelLoader, engine_options_from_settings
+        from app.ml.shared_tensor_ring import SharedBatch, SharedTensorRing
+
+        if tensor_ring_spec is not None:
+            tensor_ring = SharedTensorRing.attach(tensor_ring_spec)
+
+        if engine_name == "keras" and intra_op_threads > 0:
+            import tensorflow as tf
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+
+        # Sauf configuration explicite, chaque processus reçoit sa part des cœurs
+        engine_options = engine_options_from_settings()
+        engine_options["num_threads"] = engine_options["num_threads"] or intra_op_threads
+        engine_options["intra_op_threads"] = engine_options["intra_op_threads"] or intra_op_threads
+        loader = ModelLoader(engine_name, engine_options, uint8_input=settings.ml_uint8_input)
+        loader.configure_paths(model_path=model_path)
+        handle = loader.build_handle(warmup_batch_sizes)
+        loader.swap(handle)
+
+        response_queue.put(("ready", worker_id, None, {"pid": os.getpid(), **handle.get_info()}))
+    except Exception as e:
+        response_queue.put(("failed", worker_id, None, str(e)))
+        return
+
+    while True:
+        message = request_queue.get()
+        if message is None:
+            if tensor_ring is not None:
+                tensor_ring.close()
+            break
+
+        kind, request_id, payload = message
+        if kind == "ping":
+            response_queue.put(("pong", worker_id, request_id, None))
+            continue
+
+        try:
+            if isinstance(payload, SharedBatch):
+                payload = tensor_ring.batch_view(payload.indices)
+            predictions = loader.predict(payload)
+            response_queue.put(("result", worker_id, request_id, np.asarray(predictions)))
+        except Exception as e:
+            response_queue.put(("error", worker_id, request_id, str(e)))
+
+
+class _WorkerHandle:
+    """État d'un processus d'inférence côté processus API"""
+
+    def __init__(self, worker_id: int):
+        self.worker_id = worker_id
+        self.process = None
+        self.request_queue = None
+        self.ready = False
+        self.info: Dict = {}
+        self.inflight: Dict[int, Future] = {}
+        self.processed = 0
+        self.errors = 0
+        self.restarts = 0
+        # Redémarrages successifs sans atteindre l'état prêt, et date du prochain redémarrage autorisé
+        self.consecutive_failures = 0
+        self.next_restart_at = 0.0
+        # Abandonné après trop d'échecs successifs: plus aucun redémarrage automatique
+        self.failed = False
+        self.last_error: Optional[str] = None
+        self.started_at = 0.0
+        self.last_pong = 0.0
+        self.pending_ping: Optional[float] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+
+class InferenceWorkerPool:
+    """
+    Pool de processus d'inférence.
+
+    Chaque processus charge l'artefact du modèle une fois (moteur Keras, TFLite ou ONNX); les batches prétraités
+    leur sont envoyés par une file locale selon un routage round-robin ou
+    moins-chargé. Un thread de supervision vérifie la santé des processus
+    (ping/pong) et redémarre automatiquement ceux qui ont planté, en faisant
+    échouer les requêtes qu'ils avaient en cours.
+
+    Les redémarrages successifs d'un processus qui n'atteint pas l'état prêt
+    (ex: modèle invalide) sont espacés exponentiellement à partir de
+    `restart_backoff_seconds` (au plus `restart_backoff_max_seconds`); après
+    `max_restarts` échecs successifs, le processus est marqué en échec et n'est
+    plus relancé (visible dans get_stats et la sonde de readiness).
+    """
+
+    def __init__(
+        self,
+        num_workers: int,
+        model_path: str,
+        engine_name: str = "keras",
+        routing: str = "least_loaded",
+        health_check_interval: float = 5.0,
+        health_check_timeout: float = 30.0,
+        tensor_ring_spec: Optional[Dict] = None,
+        warmup_batch_sizes: Sequence[int] = (1,),
+        max_restarts: int = 5,
+        restart_backoff_seconds: float = 1.0,
+        restart_backoff_max_seconds: float = 60.0,
+    ):
+        if num_workers < 1:
+            raise ValueError("num_workers doit être supérieur ou égal à 1")
+        if routing not in ROUTING_STRATEGIES:
+            raise ValueError(f"Stratégie de routage inconnue: {routing}")
+
+        self.num_workers = num_workers
+        self.model_path = model_path
+        self.engine_name = engine_name
+        self.routing = routing
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self.tensor_ring_spec = tensor_ring_spec
+        self.warmup_batch_sizes = list(warmup_batch_sizes)
+        self.max_restarts = max_restarts
+        self.restart_backoff_seconds = restart_backoff_seconds
+        self.restart_backoff_max_seconds = restart_backoff_max_seconds
+        # Répartit les cœurs entre les processus pour éviter la sursouscription
+        self.intra_op_threads = max(1, (os.cpu_count() or 1) // num_workers)
+
+        self._context = multiprocessing.get_context("spawn")
+        self._response_queue = None
+        self._workers: List[_WorkerHandle] = []
+        self._lock = threading.Lock()
+        self._ready_event = threading.Event()
+        self._request_ids = itertools.count()
+        self._round_robin = itertools.count()
+        self._collector: Optional[threading.Thread] = None
+        self._monitor: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return any(worker.ready and worker.alive for worker in self._workers)
+
+    def start(self, wait_timeout: Optional[float] = None) -> bool:
+        """Démarre les processus et attend qu'au moins l'un d'eux soit prêt"""
+        self._stopping.clear()
+        self._response_queue = self._context.Queue()
+        self._workers = [_WorkerHandle(worker_id) for worker_id in range(self.num_workers)]
+        for worker in self._workers:
+            self._spawn(worker)
+
+        self._collector = threading.Thread(target=self._collect, name="inference-collector", daemon=True)
+        self._collector.start()
+        self._monitor = threading.Thread(target=self._supervise, name="inference-monitor", daemon=True)
+        self._monitor.start()
+
+        logger.info(f"🚀 {self.num_workers} processus d'inférence en démarrage (routage: {self.routing})")
+        # Réveillé au premier processus prêt, ou lorsque tous sont en échec
+        self._ready_event.wait(wait_timeout)
+        return self.ready
+
+    def stop(self, timeout: float = 10.0):
+        """Arrête proprement les processus d'inférence"""
+        self._stopping.set()
+        with self._lock:
+            workers = list(self._workers)
+        for worker in workers:
+            if worker.alive:
+                worker.request_queue.put(None)
+        for worker in workers:
+            if worker.process is not None:
+                worker.process.join(timeout)
+                if worker.process.is_alive():
+                    worker.process.terminate()
+            self._fail_inflight(worker, RuntimeError("Pool d'inférence arrêté"))
+        if self._response_queue is not None:
+            self._response_queue.put(None)
+        logger.info("Processus d'inférence arrêtés")
+
+    def _spawn(self, worker: _WorkerHandle):
+        worker.request_queue = self._context.Queue()
+        worker.ready = False
+        worker.pending_ping = None
+        worker.started_at = time.monotonic()
+        worker.process = self._context.Process(
+            target=_worker_main,
+            args=(worker.worker_id, self.engine_name, self.model_path, self.intra_op_threads,
+                  worker.request_queue, self._response_queue, self.tensor_ring_spec,
+                  self.warmup_batch_sizes),
+            name=f"inference-worker-{worker.worker_id}",
+            daemon=True,
+        )
+        worker.process.start()
+
+    def _fail_inflight(self, worker: _WorkerHandle, error: Exception):
+        with self._lock:
+            inflight = list(worker.inflight.values())
+            worker.inflight.clear()
+        for future in inflight:
+            if not future.done():
+                future.set_exception(error)
+
+    def _restart(self, worker: _WorkerHandle, reason: str):
+        if worker.process is not None and worker.process.is_alive():
+            worker.process.terminate()
+            worker.process.join(5)
+        self._fail_inflight(worker, RuntimeError(f"Processus d'inférence indisponible: {reason}"))
+        with self._lock:
+            worker.last_error = worker.last_error or reason
+            if worker.consecutive_failures >= self.max_restarts:
+                worker.failed = True
+                all_failed = all(candidate.failed for candidate in self._workers)
+            else:
+                worker.restarts += 1
+                worker.consecutive_failures += 1
+                backoff = min(
+                    self.restart_backoff_max_seconds,
+                    self.restart_backoff_seconds * 2 ** (worker.consecutive_failures - 1),
+                )
+                worker.next_restart_at = time.monotonic() + backoff
+        if worker.failed:
+            logger.error(
+                f"❌ Processus d'inférence {worker.worker_id} abandonné après {self.max_restarts} "
+                f"redémarrages sans succès: {worker.last_error}"
+            )
+            if all_failed:
+                self._ready_event.set()
+            return
+        logger.error(
+            f"❌ Processus d'inférence {worker.worker_id} redémarré "
+            f"(tentative {worker.consecutive_failures}/{self.max_restarts}): {reason}"
+        )
+        self._spawn(worker)
+
+    def _select_worker(self) -> _WorkerHandle:
+        candidates = [worker for worker in self._workers if worker.ready and worker.alive]
+        if not candidates:
+            raise RuntimeError("Aucun processus d'inférence disponible")
+        if self.routing == "round_robin":
+            return candidates[next(self._round_robin) % len(candidates)]
+        return min(candidates, key=lambda worker: len(worker.inflight))
+
+    def submit(self, batch) -> Future:
+        """
+        Envoie un batch à un processus et retourne un Future de probabilités.
+        `batch` est un tableau (N, H, W, C) ou un SharedBatch d'indices en mémoire partagée.
+        """
+        future: Future = Future()
+        request_id = next(self._request_ids)
+        with self._lock:
+            worker = self._select_worker()
+            worker.inflight[request_id] = future
+        worker.request_queue.put(("predict", request_id, batch))
+        return future
+
+    def predict(self, batch, timeout: Optional[float] = None) -> np.ndarray:
+        """Envoie un batch et attend les probabilités"""
+        return self.submit(batch).result(timeout)
+
+    def _collect(self):
+        while True:
+            message = self._response_queue.get()
+            if message is None:
+                break
+
+            kind, worker_id, request_id, payload = message
+            worker = self._workers[worker_id]
+
+            if kind == "ready":
+                with self._lock:
+                    worker.ready = True
+                    worker.info = payload
+                    worker.last_pong = time.monotonic()
+                    worker.consecutive_failures = 0
+                    worker.last_error = None
+                self._ready_event.set()
+                logger.info(f"✅ Processus d'inférence {worker_id} prêt (pid {payload['pid']})")
+            elif kind == "failed":
+                with self._lock:
+                    worker.last_error = payload
+                logger.error(f"❌ Échec du démarrage du processus d'inférence {worker_id}: {payload}")
+            elif kind == "pong":
+                with self._lock:
+                    worker.last_pong = time.monotonic()
+                    worker.pending_ping = None
+            else:
+                with self._lock:
+                    future = worker.inflight.pop(request_id, None)
+                    if kind == "result":
+                        worker.processed += 1
+                    else:
+                        worker.errors += 1
+                if future is None or future.done():
+                    continue
+                if kind == "result":
+                    future.set_result(payload)
+                else:
+                    future.set_exception(RuntimeError(payload))
+
+    def _supervise(self):
+        while not self._stopping.wait(self.health_check_interval):
+            now = time.monotonic()
+            for worker in self._workers:
+                if self._stopping.is_set():
+                    return
+                if worker.failed:
+                    continue
+                if not worker.alive:
+                    # Délai croissant entre deux redémarrages d'un processus qui échoue
+                    if now >= worker.next_restart_at:
+                        self._restart(worker, f"processus terminé (code {worker.process.exitcode})")
+                    continue
+                if not worker.ready:
+                    continue
+                if worker.pending_ping is not None:
+                    if now - worker.pending_ping > self.health_check_timeout:
+                        self._restart(worker, "pas de réponse au contrôle de santé")
+                    continue
+                worker.pending_ping = now
+                worker.request_queue.put(("ping", None, None))
+
+    def get_stats(self) -> Dict:
+        """Retourne l'état de chaque processus d'inférence"""
+        now = time.monotonic()
+        with self._lock:
+            workers = [
+                {
+                    "worker_id": worker.worker_id,
+                    "pid": worker.process.pid if worker.process is not None else None,
+                    "alive": worker.alive,
+                    "ready": worker.ready,
+                    "inflight": len(worker.inflight),
+                    "processed_batches": worker.processed,
+                    "errors": worker.errors,
+                    "restarts": worker.restarts,
+                    "consecutive_failures": worker.consecutive_failures,
+                    "failed": worker.failed,
+                    "last_error": worker.last_error,
+                    "uptime_seconds": round(now - worker.started_at, 1),
+                    "last_health_check_age_seconds": round(now - worker.last_pong, 1) if worker.last_pong else None,
+                }
+                for worker in self._workers
+            ]
+        return {
+            "num_workers": self.num_workers,
+            "routing": self.routing,
+            "intra_op_threads": self.intra_op_threads,
+            "shared_memory_transport": self.tensor_ring_spec is not None,
+            "ready": any(worker["ready"] and worker["alive"] for worker in workers),
+            "ready_workers": sum(worker["ready"] and worker["alive"] for worker in workers),
+            "failed_workers": sum(worker["failed"] for worker in workers),
+            "max_restarts": self.max_restarts,
+            "model_info": next((worker.info for worker in self._workers if worker.ready), None),
+            "workers": workers,
+        }
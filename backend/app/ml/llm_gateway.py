@@ -0,0 +1,312 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from typing import Callable, Dict, Iterator, List, Optional, TypeVar
+import logging
+
+from app.utils.metrics import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Le circuit est ouvert (ou la file d'attente pleine): l'appel au LLM n'est pas tenté"""
+
+
+class LLMTimeoutError(TimeoutError):
+    """L'appel au LLM n'a pas répondu dans le temps imparti"""
+
+
+class LLMGateway:
+    """
+    Point de passage unique des appels sortants vers le LLM.
+
+    - concurrence bornée: au plus `max_concurrency` appels en cours; au-delà, un
+      appelant attend `queue_timeout_seconds` puis échoue sans appeler l'API;
+    - délai par appel: l'appelant est libéré après `timeout_seconds`, même si
+      l'appel bloquant n'est pas encore revenu (il garde sa place jusqu'à sa fin);
+    - disjoncteur: après `failure_threshold` échecs consécutifs (erreurs, délais
+      dépassés ou appels plus lents que `slow_call_seconds`), le circuit s'ouvre et
+      les appels échouent immédiatement pendant `reset_seconds`; un appel d'essai
+      (semi-ouvert) décide ensuite de sa fermeture;
+    - relance couverte (optionnelle): sans réponse après `hedge_after_seconds`, un
+      second appel identique est lancé et la première réponse est retenue.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        timeout_seconds: float = 10.0,
+        queue_timeout_seconds: float = 2.0,
+        failure_threshold: int = 5,
+        slow_call_seconds: float = 6.0,
+        reset_seconds: float = 30.0,
+        hedge_after_seconds: float = 0.0,
+    ):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency doit être supérieur ou égal à 1")
+        if failure_threshold < 1:
+            raise ValueError("failure_threshold doit être supérieur ou égal à 1")
+
+        self.max_concurrency = max_concurrency
+        self.timeout_seconds = timeout_seconds
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_seconds = reset_seconds
+        self.hedge_after_seconds = hedge_after_seconds
+
+        # Une place par appel réellement en cours, libérée à la fin de l'appel bloquant
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm-call")
+        self._lock = threading.Lock()
+
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+        self.latency = LatencyTracker()
+        self._in_flight = 0
+        self._counts = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "timeouts": 0,
+            "slow_calls": 0,
+            "rejected_open": 0,
+            "rejected_saturated": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "opened": 0,
+        }
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+            self._state = HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def _admit(self):
+        """Vérifie le disjoncteur avant un appel; en semi-ouvert, un seul appel d'essai passe"""
+        with self._lock:
+            self._counts["calls"] += 1
+            state = self._current_state()
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            self._counts["rejected_open"] += 1
+        raise CircuitOpenError("Service de recommandation momentanément suspendu (disjoncteur ouvert)")
+
+    def _record(self, success: bool, seconds: float, timed_out: bool = False):
+        slow = success and seconds > self.slow_call_seconds
+        self.latency.record(seconds)
+        with self._lock:
+            if success:
+                self._counts["successes"] += 1
+            else:
+                self._counts["failures"] += 1
+            if timed_out:
+                self._counts["timeouts"] += 1
+            if slow:
+                self._counts["slow_calls"] += 1
+
+            if success and not slow:
+                if self._state != CLOSED:
+                    logger.info("✅ Disjoncteur du LLM refermé")
+                self._state = CLOSED
+                self._consecutive_failures = 0
+                self._trial_in_flight = False
+                return
+
+            self._consecutive_failures += 1
+            if self._state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self._counts["opened"] += 1
+                    logger.warning(
+                        f"⚠️ Disjoncteur du LLM ouvert pour {self.reset_seconds:g}s "
+                        f"({self._consecutive_failures} échecs ou appels lents consécutifs)"
+                    )
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def _launch(self, func: Callable[[], T], block: bool) -> Optional[Future]:
+        """Lance l'appel sur une place libre (None si aucune place dans le délai d'attente)"""
+        if not self._slots.acquire(timeout=self.queue_timeout_seconds if block else 0):
+            return None
+        with self._lock:
+            self._in_flight += 1
+        try:
+            future = self._executor.submit(func)
+        except Exception:
+            self._release_slot()
+            raise
+        future.add_done_callback(lambda _: self._release_slot())
+        return future
+
+    def _release_slot(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def call(self, func: Callable[[], T]) -> T:
+        """Exécute `func` sous le contrôle de la passerelle; lève CircuitOpenError ou LLMTimeoutError"""
+        self._admit()
+        start = time.perf_counter()
+        attempts: List[Future] = []
+        try:
+            first = self._launch(func, block=True)
+            if first is None:
+                with self._lock:
+                    self._counts["rejected_saturated"] += 1
+                    self._trial_in_flight = False
+                raise CircuitOpenError("Trop d'appels au service de recommandation en cours")
+            attempts.append(first)
+            result = self._wait_first(func, attempts, start)
+        except CircuitOpenError:
+            raise
+        except LLMTimeoutError:
+            self._record(False, time.perf_counter() - start, timed_out=True)
+            raise
+        except Exception:
+            self._record(False, time.perf_counter() - start)
+            raise
+        self._record(True, time.perf_counter() - start)
+        return result
+
+    def _wait_first(self, func: Callable[[], T], attempts: List[Future], start: float) -> T:
+        """Première réponse réussie parmi l'appel initial et son éventuelle relance couverte"""
+        deadline = start + self.timeout_seconds
+        hedge_at = start + self.hedge_after_seconds if self.hedge_after_seconds > 0 else None
+        last_error: Optional[BaseException] = None
+        pending = set(attempts)
+
+        while True:
+            now = time.perf_counter()
+            wake_at = deadline if hedge_at is None else min(deadline, hedge_at)
+            done, pending = wait(pending, timeout=max(0.0, wake_at - now), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not attempts[0]:
+                        with self._lock:
+                            self._counts["hedge_wins"] += 1
+                    return future.result()
+                last_error = future.exception()
+
+            if hedge_at is not None and time.perf_counter() >= hedge_at:
+                hedge_at = None
+                hedge = self._launch(func, block=False)
+                if hedge is not None:
+                    with self._lock:
+                        self._counts["hedges"] += 1
+                    attempts.append(hedge)
+                    pending.add(hedge)
+                continue
+
+            if not pending:
+                raise last_error
+            if time.perf_counter() >= deadline:
+                raise LLMTimeoutError(f"Pas de réponse du LLM en {self.timeout_seconds:.1f}s")
+
+    def stream(self, open_stream: Callable[[], Iterator[T]]) -> Iterator[T]:
+        """
+        Réponse en flux sous le contrôle du disjoncteur et de la limite de concurrence.
+        L'ouverture du flux et le premier morceau doivent arriver en moins de
+        `timeout_seconds` (sinon LLMTimeoutError); la suite est lue telle qu'elle arrive.
+        Un flux abandonné par le consommateur (ex: client SSE déconnecté) ne compte ni
+        comme un succès ni comme un échec, et libère l'éventuel appel d'essai.
+        """
+        self._admit()
+        if not self._slots.acquire(timeout=self.queue_timeout_seconds):
+            with self._lock:
+                self._counts["rejected_saturated"] += 1
+                self._trial_in_flight = False
+            raise CircuitOpenError("Trop d'appels au service de recommandation en cours")
+        with self._lock:
+            self._in_flight += 1
+        start = time.perf_counter()
+        release_slot = True
+        recorded = False
+        try:
+            # Ouverture et premier morceau sur le pool de la passerelle, pour borner leur attente
+            first = self._executor.submit(self._open_first_chunk, open_stream)
+            try:
+                iterator, chunk = first.result(timeout=self.timeout_seconds)
+            except FuturesTimeoutError:
+                # La place reste occupée jusqu'au retour effectif de l'appel bloquant
+                release_slot = False
+                first.add_done_callback(lambda _: self._release_slot())
+                recorded = True
+                self._record(False, time.perf_counter() - start, timed_out=True)
+                raise LLMTimeoutError(f"Pas de réponse du LLM en {self.timeout_seconds:.1f}s")
+            if iterator is not None:
+                yield chunk
+                for chunk in iterator:
+                    yield chunk
+        except GeneratorExit:
+            recorded = True
+            with self._lock:
+                self._trial_in_flight = False
+            raise
+        except Exception:
+            if not recorded:
+                recorded = True
+                self._record(False, time.perf_counter() - start)
+            raise
+        finally:
+            if release_slot:
+                self._release_slot()
+        self._record(True, time.perf_counter() - start)
+
+    @staticmethod
+    def _open_first_chunk(open_stream: Callable[[], Iterator[T]]):
+        """Ouvre le flux et lit son premier morceau: (itérateur, morceau), ou (None, None) si vide"""
+        iterator = iter(open_stream())
+        for chunk in iterator:
+            return iterator, chunk
+        return None, None
+
+    def reset(self):
+        """Referme le disjoncteur (ex: après correction de la configuration)"""
+        with self._lock:
+            self._state = CLOSED
+            self._consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def get_stats(self) -> Dict:
+        """État du disjoncteur, compteurs et latence des appels (p95/p99 inclus)"""
+        with self._lock:
+            state = self._current_state()
+            stats = {
+                "state": state,
+                "consecutive_failures": self._consecutive_failures,
+                "open_for_seconds": round(time.monotonic() - self._opened_at, 1) if state == OPEN else 0.0,
+                "in_flight": self._in_flight,
+                "max_concurrency": self.max_concurrency,
+                "timeout_seconds": self.timeout_seconds,
+                "slow_call_seconds": self.slow_call_seconds,
+                "failure_threshold": self.failure_threshold,
+                "reset_seconds": self.reset_seconds,
+                "hedge_after_seconds": self.hedge_after_seconds,
+                **self._counts,
+            }
+        stats["latency"] = self.latency.snapshot()
+        return stats
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Hashable, Optional, Tuple
+import logging
+
+import numpy as np
+
+from app.utils.metrics import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+
+def hamming_distance(first: int, second: int) -> int:
+    """Nombre de bits différents entre deux empreintes perceptuelles"""
+    return (first ^ second).bit_count()
+
+
+# Poids de luminance ITU-R 601 (conversion RGB -> niveaux de gris de PIL)
+_LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def compute_dhash(pixels: np.ndarray, hash_size: int = 8) -> int:
+    """
+    Empreinte perceptuelle (dHash) d'une image RGB uint8 (H, W, 3): signe du gradient
+    horizontal sur une vignette en niveaux de gris de (hash_size + 1) x hash_size pixels,
+    obtenue par moyenne de blocs. Implémentation unique pour tous les backends de
+    prétraitement: une même image donne la même empreinte quel que soit le backend actif.
+    """
+    gray = pixels[:, :, :3].astype(np.float32) @ _LUMA_WEIGHTS
+    height, width = gray.shape
+    rows = np.linspace(0, height, hash_size + 1).astype(np.intp)
+    cols = np.linspace(0, width, hash_size + 2).astype(np.intp)
+    sums = np.add.reduceat(np.add.reduceat(gray, rows[:-1], axis=0), cols[:-1], axis=1)
+    thumbnail = sums / np.outer(np.diff(rows), np.diff(cols))
+    bits = (thumbnail[:, 1:] > thumbnail[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class NearDuplicateIndex:
+    """
+    Index en mémoire des scans récents de chaque utilisateur, par empreinte perceptuelle.
+
+    Les photos prises en rafale d'une même feuille diffèrent de quelques octets et
+    échappent au cache par contenu exact; leurs empreintes dHash, elles, ne diffèrent
+    que de quelques bits. Une nouvelle image à une distance de Hamming inférieure ou
+    égale à `max_distance` d'un scan récent (même utilisateur, même version du modèle)
+    réutilise sa prédiction. Chaque utilisateur conserve au plus `history_size`
+    scans, expirés après `ttl_seconds`; les utilisateurs les moins récents sont
+    évincés au-delà de `max_users`.
+    """
+
+    def __init__(
+        self,
+        max_distance: int = 6,
+        history_size: int = 20,
+        ttl_seconds: float = 600.0,
+        max_users: int = 10000,
+    ):
+        if max_distance < 0:
+            raise ValueError("max_distance doit être positif")
+        if history_size < 1:
+            raise ValueError("history_size doit être supérieur ou égal à 1")
+
+        self.max_distance = max_distance
+        self.history_size = history_size
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+
+        # utilisateur -> deque de (empreinte, enregistrée le, version du modèle, résultat)
+        self._users: "OrderedDict[Hashable, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.lookup_latency = LatencyTracker()
+        self._lookups = 0
+        self._reuses = 0
+
+    def find(self, user_id: Hashable, image_hash: int, model_version: str) -> Optional[Tuple[Dict, int]]:
+        """Retourne (résultat, distance) du scan récent le plus proche, ou None"""
+        start = time.perf_counter()
+        now = time.time()
+        best: Optional[Tuple[Dict, int]] = None
+        with self._lock:
+            self._lookups += 1
+            entries = self._users.get(user_id)
+            if entries is not None:
+                self._users.move_to_end(user_id)
+                while entries and now - entries[0][1] > self.ttl_seconds:
+                    entries.popleft()
+                for entry_hash, _, entry_version, result in entries:
+                    if entry_version != model_version:
+                        continue
+                    distance = hamming_distance(image_hash, entry_hash)
+                    if distance <= self.max_distance and (best is None or distance < best[1]):
+                        best = (result, distance)
+                if best is not None:
+                    self._reuses += 1
+        self.lookup_latency.record(time.perf_counter() - start)
+        return best
+
+    def add(self, user_id: Hashable, image_hash: int, model_version: str, result: Dict):
+        """Mémorise le scan d'un utilisateur"""
+        with self._lock:
+            entries = self._users.get(user_id)
+            if entries is None:
+                entries = deque(maxlen=self.history_size)
+                self._users[user_id] = entries
+            self._users.move_to_end(user_id)
+            entries.append((image_hash, time.time(), model_version, result))
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+    def get_stats(self) -> Dict:
+        """Retourne la taille de l'index, le taux de réutilisation et la latence de recherche"""
+        with self._lock:
+            stats = {
+                "enabled": True,
+                "max_distance": self.max_distance,
+                "history_size": self.history_size,
+                "ttl_seconds": self.ttl_seconds,
+                "users": len(self._users),
+                "entries": sum(len(entries) for entries in self._users.values()),
+                "lookups": self._lookups,
+                "reuses": self._reuses,
+                "reuse_rate": round(self._reuses / self._lookups, 4) if self._lookups else 0.0,
+            }
+        stats["lookup_latency"] = self.lookup_latency.snapshot()
+        return stats
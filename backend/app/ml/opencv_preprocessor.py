@@ -0,0 +1,153 @@
+import io
+from typing import Optional, Tuple
+import logging
+
+import numpy as np
+from PIL import Image
+
+from .near_duplicate_index import compute_dhash
+
+logger = logging.getLogger(__name__)
+
+# Tag EXIF de l'orientation
+EXIF_ORIENTATION = 0x0112
+
+class OpenCVPreprocessor:
+    """
+    Prétraitement des octets d'une image avec OpenCV/NumPy, équivalent au pipeline PIL:
+    décodage (orientation EXIF appliquée par OpenCV, ou ici pour une image avec
+    transparence, JPEG à taille réduite selon le profil), transparence composée sur
+    fond blanc, redimensionnement et normalisation.
+
+    Seul l'en-tête est lu par PIL (format, taille, transparence). La normalisation
+    convertit BGR -> RGB et 0-255 -> 0-1 en une seule passe, directement dans le
+    buffer de sortie; les valeurs sont dans [0, 1] par construction, sans contrôle a posteriori.
+    """
+
+    def __init__(self, target_size: Tuple[int, int], supported_formats, draft_factor: Optional[int] = None,
+                 fast_resize: bool = False, output_dtype=np.float32):
+        import cv2
+
+        self._cv2 = cv2
+        self.target_size = target_size
+        self.supported_formats = supported_formats
+        self.draft_factor = draft_factor
+        self.fast_resize = fast_resize
+        self.output_dtype = np.dtype(output_dtype)
+
+    def _read_header(self, image_bytes: bytes) -> Tuple[str, Tuple[int, int], bool, int]:
+        """Format, taille, présence de transparence et orientation EXIF, sans décoder les pixels"""
+        try:
+            header = Image.open(io.BytesIO(image_bytes))
+        except Exception as e:
+            raise ValueError(f"Image illisible: {str(e)}")
+        if header.format not in self.supported_formats:
+            raise ValueError("Format d'image non supporté")
+        # Comme ImagePreprocessor.convert_to_rgb, seule une image RGBA est composée sur fond blanc
+        has_alpha = header.mode == "RGBA"
+        # IMREAD_UNCHANGED (transparence) ignore l'orientation EXIF: elle est alors appliquée ici
+        orientation = header.getexif().get(EXIF_ORIENTATION, 1) if has_alpha else 1
+        return header.format, header.size, has_alpha, orientation
+
+    def _read_flag(self, image_format: str, size: Tuple[int, int], has_alpha: bool, reduced: bool) -> int:
+        cv2 = self._cv2
+        if has_alpha:
+            return cv2.IMREAD_UNCHANGED
+        if reduced and image_format == "JPEG" and self.draft_factor is not None:
+            # Plus forte réduction DCT gardant les deux côtés au-dessus de la taille demandée
+            side = max(self.target_size) * self.draft_factor
+            for scale, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                                (2, cv2.IMREAD_REDUCED_COLOR_2)):
+                if min(size) // scale >= side:
+                    return flag
+        return cv2.IMREAD_COLOR
+
+    def _apply_orientation(self, image: np.ndarray, orientation: int) -> np.ndarray:
+        """Orientation EXIF appliquée comme ImageOps.exif_transpose"""
+        cv2 = self._cv2
+        if orientation == 2:
+            return cv2.flip(image, 1)
+        if orientation == 3:
+            return cv2.rotate(image, cv2.ROTATE_180)
+        if orientation == 4:
+            return cv2.flip(image, 0)
+        if orientation == 5:
+            return cv2.transpose(image)
+        if orientation == 6:
+            return cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
+        if orientation == 7:
+            return cv2.flip(cv2.transpose(image), -1)
+        if orientation == 8:
+            return cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE)
+        return image
+
+    def read(self, image_bytes: bytes, reduced: bool = True) -> Tuple[str, np.ndarray]:
+        """
+        Format et image décodée en uint8, orientation corrigée: BGR (H, W, 3), ou BGRA (H, W, 4)
+        pour une image RGBA. Sans `reduced`, un JPEG est décodé en pleine résolution.
+        """
+        cv2 = self._cv2
+        image_format, size, has_alpha, orientation = self._read_header(image_bytes)
+        image = cv2.imdecode(
+            np.frombuffer(image_bytes, dtype=np.uint8), self._read_flag(image_format, size, has_alpha, reduced)
+        )
+        if image is None:
+            raise ValueError("Décodage OpenCV impossible")
+
+        if image.dtype != np.uint8:
+            # PNG 16 bits décodé tel quel (IMREAD_UNCHANGED)
+            image = (image >> 8).astype(np.uint8)
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        return image_format, self._apply_orientation(image, orientation)
+
+    def compose(self, image: np.ndarray) -> np.ndarray:
+        """Image BGR: fond blanc sous les zones transparentes, comme ImagePreprocessor.convert_to_rgb"""
+        if image.shape[2] != 4:
+            return image
+        # Calcul entier sur 16 bits: couleur * alpha + 255 * (255 - alpha), ramené à 0-255
+        alpha = image[:, :, 3:4].astype(np.uint16)
+        composed = image[:, :, :3] * alpha
+        composed += (255 - alpha) * 255
+        composed += 127
+        composed //= 255
+        return composed.astype(np.uint8)
+
+    def decode(self, image_bytes: bytes, reduced: bool = True) -> np.ndarray:
+        """Image décodée en BGR uint8 (H, W, 3), orientation corrigée et transparence composée"""
+        return self.compose(self.read(image_bytes, reduced)[1])
+
+    def resize(self, image: np.ndarray) -> np.ndarray:
+        cv2 = self._cv2
+        width, height = self.target_size
+        if image.shape[1] == width and image.shape[0] == height:
+            return image
+        downscale = image.shape[1] > width and image.shape[0] > height
+        interpolation = cv2.INTER_AREA if downscale and not self.fast_resize else cv2.INTER_LINEAR
+        return cv2.resize(image, (width, height), interpolation=interpolation)
+
+    def compute_dhash(self, image: np.ndarray, hash_size: int = 8) -> int:
+        """dHash de l'image BGR redimensionnée, même implémentation que le backend PIL (vue RGB, sans copie)"""
+        return compute_dhash(image[:, :, ::-1], hash_size)
+
+    def preprocess(self, image_bytes: bytes, out: Optional[np.ndarray] = None,
+                   with_hash: bool = False) -> Tuple[np.ndarray, Optional[int]]:
+        """Tableau (1, H, W, 3) float32 dans [0, 1] (ou uint8 brut), écrit dans `out` s'il est fourni"""
+        return self.preprocess_pixels(self.decode(image_bytes), out, with_hash)
+
+    def preprocess_pixels(self, pixels: np.ndarray, out: Optional[np.ndarray] = None,
+                          with_hash: bool = False) -> Tuple[np.ndarray, Optional[int]]:
+        """Comme preprocess, depuis une image BGR déjà décodée (decode)"""
+        image = self.resize(pixels)
+        image_hash = self.compute_dhash(image) if with_hash else None
+
+        width, height = self.target_size
+        if out is None:
+            out = np.empty((1, height, width, 3), dtype=self.output_dtype)
+        if self.output_dtype == np.uint8:
+            # BGR -> RGB uniquement, l'échelle est appliquée par le modèle
+            np.copyto(out[0], image[:, :, ::-1])
+            return out, image_hash
+        # BGR -> RGB (vue inversée, sans copie) et 0-255 -> 0-1 en une seule passe
+        np.multiply(image[:, :, ::-1], np.float32(1 / 255), out=out[0], dtype=np.float32)
+        return out, image_hash
@@ -0,0 +1,198 @@
+"""
+Précalcul des recommandations spécifiques pour chaque classe malade du modèle.
+
+Le modèle ne connaît que les classes de class_names.json: le texte de chaque maladie
+peut donc être produit hors ligne et stocké dans la table recommendation_cache, pour
+la langue et la version du prompt courantes. Avec ML_RECOMMENDATION_LOOKUP_ONLY=true,
+generate_recommendations devient alors une simple lecture. Usage, depuis le dossier backend:
+
+    python -m app.ml.precompute_recommendations --source auto --llm gemini --rate 10
+
+Sources:
+- table: colonnes treatment/prevention de la table diseases;
+- llm: génération par le LLM;
+- auto: table si la maladie y est renseignée, LLM sinon.
+
+LLM:
+- gemini: l'API Gemini configurée (GEMINI_API_KEY);
+- local: un serveur local compatible OpenAI (Ollama, llama.cpp...), voir --llm-url;
+- stub: texte déterministe sans appel réseau (essais, CI), enregistré sous une version
+  de prompt distincte (STUB_PROMPT_VERSION) jamais lue par l'application.
+
+La source table n'est utilisée que pour la langue du catalogue
+(ML_RECOMMENDATION_CATALOGUE_LANGUAGE). Le job est reprenable: les classes déjà présentes pour (langue, version du prompt)
+sont ignorées, sauf avec --force. Les appels LLM sont espacés selon --rate (par minute).
+"""
+import argparse
+import json
+import sys
+import time
+import urllib.request
+from typing import Callable, List, Optional
+
+from .model_loader import DEFAULT_CLASS_NAMES_PATH, model_loader
+from .prediction_service import RECOMMENDATION_PROMPT_VERSION, prediction_service
+from app.core.config import settings
+
+SOURCES = ["auto", "table", "llm"]
+LLM_BACKENDS = ["gemini", "local", "stub"]
+# Le texte factice ne doit jamais être servi: il est rangé sous sa propre version de prompt
+STUB_PROMPT_VERSION = f"{RECOMMENDATION_PROMPT_VERSION}-stub"
+
+
+def is_disease_class(class_name: str) -> bool:
+    """Les classes saines n'ont pas de recommandations spécifiques"""
+    return "healthy" not in class_name.lower()
+
+
+def format_from_disease(class_name: str, disease) -> Optional[str]:
+    """Texte de recommandations à partir des colonnes treatment/prevention, ou None si vides"""
+    if disease is None or not (disease.treatment or disease.prevention):
+        return None
+    sections = [f"Recommandations spécifiques pour: {class_name}"]
+    if disease.treatment:
+        sections.append(f"1. **Traitements suggérés**\n{disease.treatment.strip()}")
+    if disease.prevention:
+        sections.append(f"2. **Mesures préventives**\n{disease.prevention.strip()}")
+    return "\n\n".join(sections)
+
+
+def build_generator(backend: str, language: str, llm_url: str, llm_model: str) -> Callable[[str], str]:
+    """Retourne une fonction classe -> texte pour le LLM choisi"""
+    if backend == "gemini":
+        return lambda class_name: prediction_service._generate_disease_recommendations(class_name, language)
+
+    if backend == "stub":
+        def generate_stub(class_name: str) -> str:
+            return (
+                f"Recommandations spécifiques pour: {class_name}\n\n"
+                "1. **Traitements suggérés**\n• Texte de remplacement (LLM local factice)\n\n"
+                "2. **Mesures préventives**\n• Texte de remplacement (LLM local factice)"
+            )
+        return generate_stub
+
+    def generate_local(class_name: str) -> str:
+        payload = {
+            "model": llm_model,
+            "messages": [{"role": "user", "content": prediction_service._build_recommendation_prompt(class_name, language)}],
+        }
+        request = urllib.request.Request(
+            f"{llm_url.rstrip('/')}/v1/chat/completions",
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=120) as response:
+            text = json.loads(response.read())["choices"][0]["message"]["content"]
+        if not text:
+            raise ValueError(f"Réponse vide pour '{class_name}'")
+        return f"Recommandations spécifiques pour: {class_name}\n\n{text}"
+    return generate_local
+
+
+class RateLimiter:
+    """Espace les appels pour ne pas dépasser `per_minute` appels par minute (0 = illimité)"""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._last = 0.0
+
+    def wait(self):
+        delay = self._last + self.interval - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._last = time.monotonic()
+
+
+def generate_with_retries(generate: Callable[[str], str], class_name: str, limiter: RateLimiter,
+                          max_retries: int) -> str:
+    """Appelle le LLM avec des reprises à délai exponentiel"""
+    for attempt in range(max_retries + 1):
+        limiter.wait()
+        try:
+            return generate(class_name)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = 2 ** attempt
+            print(f"⚠️ {class_name}: {e} (nouvel essai dans {delay}s)")
+            time.sleep(delay)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--class-names", default=DEFAULT_CLASS_NAMES_PATH, help="Chemin de class_names.json")
+    parser.add_argument("--source", choices=SOURCES, default="auto")
+    parser.add_argument("--llm", choices=LLM_BACKENDS, default="gemini")
+    parser.add_argument("--llm-url", default="http://localhost:11434", help="Serveur local compatible OpenAI")
+    parser.add_argument("--llm-model", default="llama3.1", help="Modèle du serveur local")
+    parser.add_argument("--language", default=settings.ml_recommendation_language)
+    parser.add_argument("--rate", type=float, default=10.0, help="Appels LLM maximum par minute (0 = illimité)")
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--force", action="store_true", help="Régénère les classes déjà précalculées")
+    parser.add_argument("--dry-run", action="store_true", help="Affiche le plan sans rien générer")
+    args = parser.parse_args(argv)
+
+    from app.database import SessionLocal
+    from app.crud.disease import get_disease_for_class
+    from app.crud.recommendation import get_cached_recommendation, upsert_cached_recommendation
+
+    class_names = [name for name in model_loader.read_class_names(args.class_names) if is_disease_class(name)]
+    generate = build_generator(args.llm, args.language, args.llm_url, args.llm_model)
+    limiter = RateLimiter(args.rate)
+    counts = {"table": 0, "llm": 0, "skipped": 0, "failed": 0}
+    prompt_version = STUB_PROMPT_VERSION if args.llm == "stub" else RECOMMENDATION_PROMPT_VERSION
+    # Le catalogue est rédigé dans une seule langue: pour les autres, seul le LLM est utilisé
+    use_table = args.source in ("auto", "table") and args.language == settings.ml_recommendation_catalogue_language
+    if args.source == "table" and not use_table:
+        print(f"❌ Le catalogue est rédigé en {settings.ml_recommendation_catalogue_language}, pas en {args.language}")
+        return 1
+
+    print(f"🚀 {len(class_names)} classes malades, langue {args.language}, prompt {prompt_version}")
+    db = SessionLocal()
+    try:
+        for position, class_name in enumerate(class_names, start=1):
+            prefix = f"[{position}/{len(class_names)}] {class_name}"
+            if not args.force and get_cached_recommendation(db, class_name, args.language, prompt_version):
+                counts["skipped"] += 1
+                print(f"{prefix}: déjà précalculée")
+                continue
+
+            text, origin = None, None
+            if use_table:
+                text = format_from_disease(class_name, get_disease_for_class(db, class_name))
+                origin = "table"
+            if text is None and args.source in ("auto", "llm"):
+                origin = "llm"
+                if not args.dry_run:
+                    try:
+                        text = generate_with_retries(generate, class_name, limiter, args.max_retries)
+                    except Exception as e:
+                        counts["failed"] += 1
+                        print(f"❌ {prefix}: {e}")
+                        continue
+
+            if args.dry_run:
+                planned = origin if text is not None or origin == "llm" else "aucune"
+                print(f"{prefix}: source {planned}")
+                continue
+            if text is None:
+                counts["failed"] += 1
+                print(f"❌ {prefix}: aucune donnée dans la table diseases")
+                continue
+
+            # Enregistrée classe par classe: une interruption ne perd que la classe en cours
+            upsert_cached_recommendation(db, class_name, args.language, prompt_version, text)
+            counts[origin] += 1
+            print(f"✅ {prefix}: {origin}")
+    finally:
+        db.close()
+
+    print(
+        f"Terminé: {counts['table']} depuis la table, {counts['llm']} générées, "
+        f"{counts['skipped']} déjà présentes, {counts['failed']} échecs"
+    )
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PredictionCache:
+    """
+    Cache des résultats de prédiction par empreinte du contenu de l'image.
+
+    La clé combine le SHA-256 des octets de l'image, la version du modèle et le
+    seuil de confiance: un renvoi ou un nouveau scan de la même photo évite le
+    décodage, l'inférence et l'appel Gemini. Deux niveaux:
+    - mémoire: LRU borné en nombre d'entrées;
+    - disque (optionnel): base SQLite locale, partagée entre redémarrages.
+    Les entrées expirent après `ttl_seconds`; celles d'une version du modèle
+    remplacée sont invalidées par `invalidate(model_version)`. Le niveau disque
+    n'est purgé (entrées expirées, puis au-delà de `persistent_max_entries`)
+    qu'une fois toutes les `prune_interval_seconds`, pas à chaque écriture.
+    Le calcul de la clé et les accès disque sont bloquants: depuis la boucle
+    d'événements, ils sont exécutés sur un pool de threads.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 86400.0,
+        persistent_path: Optional[str] = None,
+        persistent_max_entries: int = 100000,
+        prune_interval_seconds: float = 60.0,
+    ):
+        if max_entries < 1:
+            raise ValueError("max_entries doit être supérieur ou égal à 1")
+
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persistent_path = persistent_path or None
+        self.persistent_max_entries = persistent_max_entries
+        self.prune_interval_seconds = prune_interval_seconds
+        self._last_prune = 0.0
+
+        # clé -> (enregistrée le, version du modèle, résultat)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expired = 0
+        self._invalidations = 0
+
+        if self.persistent_path:
+            self._open_database()
+
+    @staticmethod
+    def make_key(image_bytes: bytes, model_version: str, confidence_threshold: float) -> str:
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        return f"{digest}:{model_version}:{confidence_threshold:g}"
+
+    def _open_database(self):
+        try:
+            directory = os.path.dirname(self.persistent_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.persistent_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS prediction_cache ("
+                "key TEXT PRIMARY KEY, model_version TEXT NOT NULL, "
+                "result TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_prediction_cache_created ON prediction_cache (created_at)"
+            )
+            self._db.commit()
+            logger.info(f"✅ Cache de prédictions persistant: {self.persistent_path}")
+        except Exception as e:
+            logger.error(f"❌ Cache de prédictions persistant indisponible: {str(e)}")
+            self._db = None
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Retourne le résultat en cache (mémoire puis disque) ou None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, _, result = entry
+                if now - stored_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return result
+                del self._entries[key]
+                self._expired += 1
+
+        result = self._get_persistent(key, now)
+        with self._lock:
+            if result is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._disk_hits += 1
+        self._put_memory(key, result[0], result[1], result[2])
+        return result[2]
+
+    def _get_persistent(self, key: str, now: float) -> Optional[tuple]:
+        if self._db is None:
+            return None
+        try:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT model_version, result, created_at FROM prediction_cache WHERE key = ?", (key,)
+                ).fetchone()
+            if row is None:
+                return None
+            model_version, result, created_at = row
+            if now - created_at > self.ttl_seconds:
+                return None
+            return created_at, model_version, json.loads(result)
+        except Exception as e:
+            logger.error(f"Erreur de lecture du cache de prédictions: {str(e)}")
+            return None
+
+    def put(self, key: str, model_version: str, result: Dict):
+        """Enregistre un résultat dans les deux niveaux du cache"""
+        now = time.time()
+        self._put_memory(key, now, model_version, result)
+
+        if self._db is None:
+            return
+        try:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO prediction_cache (key, model_version, result, created_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, model_version, json.dumps(result), now),
+                )
+                if now - self._last_prune >= self.prune_interval_seconds:
+                    self._last_prune = now
+                    # Éviction: entrées expirées puis les plus anciennes au-delà de la taille maximale
+                    self._db.execute("DELETE FROM prediction_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+                    self._db.execute(
+                        "DELETE FROM prediction_cache WHERE key IN (SELECT key FROM prediction_cache "
+                        "ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                        (self.persistent_max_entries,),
+                    )
+                self._db.commit()
+        except Exception as e:
+            logger.error(f"Erreur d'écriture du cache de prédictions: {str(e)}")
+
+    def _put_memory(self, key: str, stored_at: float, model_version: str, result: Dict):
+        with self._lock:
+            self._entries[key] = (stored_at, model_version, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, model_version: Optional[str] = None) -> int:
+        """Supprime les entrées d'une version du modèle (toutes si None); retourne le nombre supprimé"""
+        with self._lock:
+            if model_version is None:
+                removed = len(self._entries)
+                self._entries.clear()
+            else:
+                keys = [key for key, entry in self._entries.items() if entry[1] == model_version]
+                for key in keys:
+                    del self._entries[key]
+                removed = len(keys)
+            self._invalidations += 1
+
+        if self._db is not None:
+            try:
+                with self._db_lock:
+                    if model_version is None:
+                        cursor = self._db.execute("DELETE FROM prediction_cache")
+                    else:
+                        cursor = self._db.execute(
+                            "DELETE FROM prediction_cache WHERE model_version = ?", (model_version,)
+                        )
+                    self._db.commit()
+                removed += cursor.rowcount
+            except Exception as e:
+                logger.error(f"Erreur d'invalidation du cache de prédictions: {str(e)}")
+
+        logger.info(f"Cache de prédictions invalidé ({model_version or 'toutes versions'}): {removed} entrées")
+        return removed
+
+    def close(self):
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
+
+    def get_stats(self) -> Dict:
+        """Retourne la taille et les compteurs de succès/échecs du cache"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            stats = {
+                "enabled": True,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "expired": self._expired,
+                "invalidations": self._invalidations,
+                "persistent_path": self.persistent_path if self._db is not None else None,
+            }
+        if self._db is not None:
+            try:
+                with self._db_lock:
+                    stats["persistent_entries"] = self._db.execute(
+                        "SELECT COUNT(*) FROM prediction_cache"
+                    ).fetchone()[0]
+            except Exception:
+                stats["persistent_entries"] = None
+        return stats
@@ -1,30 +1,165 @@
 import numpy as np
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
 import logging
+import threading
+import time
+from concurrent.futures import Executor, Future
 from datetime import datetime
 
-from .model_loader import model_loader
-from .image_preprocessor import image_preprocessor
-import google.generativeai as genai
+from .model_loader import ModelHandle, model_loader
+from .image_preprocessor import DecodedImage, image_preprocessor
+from .batch_scheduler import BatchScheduler
+from .shared_tensor_ring import SharedBatch, SharedTensorRing, TensorSlot
+from .tensor_buffer_pool import PooledBuffer, TensorBufferPool
+from .prediction_cache import PredictionCache
+from .near_duplicate_index import NearDuplicateIndex
+from .recommendation_cache import RecommendationCache
+from .recommendation_providers import CatalogueProvider, LLMProvider, RecommendationProviderChain
+from .llm_gateway import CircuitOpenError, LLMGateway, LLMTimeoutError
 from app.core.config import settings
+from app.utils.metrics import LatencyTracker
 logger = logging.getLogger(__name__)
 
+# Version du prompt de recommandations: l'incrémenter invalide les entrées en cache
+RECOMMENDATION_PROMPT_VERSION = "v1"
+RECOMMENDATION_LANGUAGES = {"fr": "français", "en": "anglais", "ar": "arabe"}
+
+# Texte servi lorsque le LLM est suspendu (disjoncteur ouvert) ou ne répond pas à temps
+STATIC_RECOMMENDATIONS = (
+    "Les recommandations spécifiques sont momentanément indisponibles.\n"
+    "• Appliquez les mesures immédiates ci-dessus\n"
+    "• Consultez un conseiller agricole ou un technicien phytosanitaire pour le traitement adapté\n"
+    "• Relancez un scan plus tard pour obtenir des recommandations détaillées"
+)
+
 class PredictionService:
     """Service de prédiction utilisant le modèle ML chargé"""
     
     def __init__(self):
-        """Initialise le service avec la clé API de Gemini."""
+        """Initialise le service; le modèle Gemini est créé au premier usage."""
+        self._gemini_model = None
+        self._gemini_initialized = False
+        self._gemini_lock = threading.Lock()
+        self.confidence_threshold = 0.7
+        self.top_k_predictions = 3
+
+        # Pool de processus d'inférence et anneau de mémoire partagée (optionnels, voir MLService)
+        self.worker_pool = None
+        self.tensor_ring: Optional[SharedTensorRing] = None
+
+        # Tableaux réutilisés pour les images prétraitées et les batches assemblés
+        self.buffer_pool: Optional[TensorBufferPool] = None
+        if settings.ml_buffer_pool_enabled:
+            self.buffer_pool = TensorBufferPool(
+                image_shape=(*image_preprocessor.target_size, 3),
+                max_buffers_per_key=settings.ml_buffer_pool_max_per_shape,
+                max_total_bytes=settings.ml_buffer_pool_max_mb * 1024 * 1024,
+            )
+
+        # Latence mesurée des passes avant du moteur actif (par batch)
+        self.inference_latency = LatencyTracker()
+        
+        # Résultats déjà calculés pour une image identique avec la même version du modèle
+        self.prediction_cache: Optional[PredictionCache] = None
+        if settings.ml_prediction_cache_enabled:
+            self.prediction_cache = PredictionCache(
+                max_entries=settings.ml_prediction_cache_size,
+                ttl_seconds=settings.ml_prediction_cache_ttl,
+                persistent_path=settings.ml_prediction_cache_path,
+                persistent_max_entries=settings.ml_prediction_cache_disk_max_entries,
+                prune_interval_seconds=settings.ml_prediction_cache_disk_prune_seconds,
+            )
+        
+        # Scans récents de chaque utilisateur par empreinte perceptuelle (photos en rafale)
+        self.near_duplicate_index: Optional[NearDuplicateIndex] = None
+        if settings.ml_near_duplicate_enabled:
+            self.near_duplicate_index = NearDuplicateIndex(
+                max_distance=settings.ml_near_duplicate_max_distance,
+                history_size=settings.ml_near_duplicate_history,
+                ttl_seconds=settings.ml_near_duplicate_ttl,
+            )
+
+        # Recommandations Gemini déjà générées par maladie (mémoire + table recommendation_cache)
+        self.recommendation_cache: Optional[RecommendationCache] = None
+        if settings.ml_recommendation_cache_enabled:
+            self.recommendation_cache = RecommendationCache(
+                max_entries=settings.ml_recommendation_cache_size,
+                ttl_seconds=settings.ml_recommendation_cache_ttl,
+                persistent=settings.ml_recommendation_cache_persistent,
+            )
+
+        # Appels sortants vers Gemini: concurrence bornée, délai par appel et disjoncteur
+        self.llm_gateway = LLMGateway(
+            max_concurrency=settings.ml_llm_max_concurrency,
+            timeout_seconds=settings.ml_llm_timeout_seconds,
+            queue_timeout_seconds=settings.ml_llm_queue_timeout_seconds,
+            failure_threshold=settings.ml_llm_breaker_failures,
+            slow_call_seconds=settings.ml_llm_slow_call_seconds,
+            reset_seconds=settings.ml_llm_breaker_reset_seconds,
+            hedge_after_seconds=settings.ml_llm_hedge_after_seconds,
+        )
+
+        # Sources des recommandations spécifiques: catalogue des maladies en mémoire, puis LLM
+        self.catalogue: Optional[CatalogueProvider] = None
+        providers = []
+        if settings.ml_recommendation_catalogue_enabled:
+            self.catalogue = CatalogueProvider(
+                refresh_seconds=settings.ml_recommendation_catalogue_refresh_seconds,
+                language=settings.ml_recommendation_catalogue_language,
+            )
+            providers.append(self.catalogue)
+        providers.append(LLMProvider(self._llm_recommendations))
+        self.recommendation_providers = RecommendationProviderChain(providers)
+
+        # Regroupe les requêtes concurrentes en un seul passage du modèle
+        self.batch_scheduler: Optional[BatchScheduler] = None
+        if settings.ml_batching_enabled:
+            self.batch_scheduler = BatchScheduler(
+                self.predict_batch_raw,
+                max_batch_size=settings.ml_max_batch_size,
+                max_wait_ms=settings.ml_batch_max_wait_ms,
+                collate_fn=self.collate_inputs,
+            )
+        
+    @property
+    def model(self):
+        """Modèle Gemini, initialisé au premier accès (import de google.generativeai différé)"""
+        if not self._gemini_initialized:
+            with self._gemini_lock:
+                if not self._gemini_initialized:
+                    self._gemini_model = self._initialize_gemini()
+                    self._gemini_initialized = True
+        return self._gemini_model
+
+    def _initialize_gemini(self):
+        """Configure l'API Gemini avec la clé de l'application"""
         try:
+            import google.generativeai as genai
+
             # Configurez l'API Gemini avec votre clé
             genai.configure(api_key=settings.gemini_api_key)
             # Créez le modèle
-            self.model = genai.GenerativeModel('gemini-1.5-flash-latest')
+            model = genai.GenerativeModel('gemini-1.5-flash-latest')
             logger.info("Service de recommandation initialisé avec succès.")
+            return model
         except Exception as e:
             logger.error(f"Erreur lors de l'initialisation du modèle Gemini: {e}")
-            self.model = None
-        self.confidence_threshold = 0.7
-        self.top_k_predictions = 3
+            return None
+
+    def attach_inference_executor(self, executor: Executor, max_concurrent_batches: int):
+        """Exécute les batches du scheduler sur le pool d'inférence dédié"""
+        if self.batch_scheduler is None:
+            return
+        
+        self.batch_scheduler.stop()
+        self.batch_scheduler = BatchScheduler(
+            self.predict_batch_raw,
+            max_batch_size=settings.ml_max_batch_size,
+            max_wait_ms=settings.ml_batch_max_wait_ms,
+            executor=executor,
+            max_concurrent_batches=max_concurrent_batches,
+            collate_fn=self.collate_inputs,
+        )
         
     def set_confidence_threshold(self, threshold: float):
         """Définit le seuil de confiance minimum"""
@@ -33,36 +168,141 @@ class PredictionService:
         else:
             raise ValueError("Le seuil de confiance doit être entre 0 et 1")
     
-    def predict_raw(self, processed_image: np.ndarray) -> np.ndarray:
+    def preallocate_buffers(self):
+        """Alloue d'avance les tableaux des images prétraitées (au démarrage du service)"""
+        if self.buffer_pool is None or settings.ml_buffer_pool_preallocate <= 0:
+            return
+        count = self.buffer_pool.preallocate(1, image_preprocessor.input_dtype, settings.ml_buffer_pool_preallocate)
+        logger.info(f"✅ {count} tableaux d'entrée préalloués ({image_preprocessor.input_dtype.name})")
+    
+    def preprocess_input(self, image_bytes: Union[bytes, DecodedImage]):
+        """
+        Prétraite une image (octets ou image déjà décodée) pour l'inférence. Si l'anneau de mémoire partagée est
+        actif, l'image est écrite directement dans un emplacement (TensorSlot); sinon, avec le
+        pool de tableaux, dans un tableau emprunté (PooledBuffer). Dans les deux cas l'entrée est
+        à libérer avec `release_input`; sans l'un ni l'autre, un tableau NumPy est retourné.
+        """
+        return self._preprocess_input(image_bytes, image_preprocessor.preprocess)
+    
+    def preprocess_input_with_hash(self, image_bytes: Union[bytes, DecodedImage]) -> Tuple[object, int]:
+        """Comme `preprocess_input`, avec l'empreinte dHash de l'image redimensionnée"""
+        return self._preprocess_input(image_bytes, image_preprocessor.preprocess_with_hash)
+    
+    def _preprocess_input(self, image_bytes: Union[bytes, DecodedImage], preprocess: Callable):
+        if self.tensor_ring is not None:
+            slot = self.tensor_ring.acquire()
+            if slot is not None:
+                try:
+                    output = preprocess(image_bytes, out=slot.array)
+                except Exception:
+                    slot.release()
+                    raise
+                return (slot, output[1]) if isinstance(output, tuple) else slot
+        if self.buffer_pool is not None:
+            buffer = self.buffer_pool.acquire(1, image_preprocessor.input_dtype)
+            try:
+                output = preprocess(image_bytes, out=buffer.array)
+            except Exception:
+                buffer.release()
+                raise
+            return (buffer, output[1]) if isinstance(output, tuple) else buffer
+        return preprocess(image_bytes)
+    
+    def release_input(self, processed_image):
+        """Libère l'emplacement de mémoire partagée ou le tableau du pool éventuellement utilisé par l'entrée"""
+        if isinstance(processed_image, (TensorSlot, PooledBuffer)):
+            processed_image.release()
+    
+    def copy_input(self, processed_image) -> np.ndarray:
+        """Copie indépendante d'une entrée prétraitée (ex: pour une inférence shadow différée)"""
+        return np.array(self._input_array(processed_image))
+    
+    @staticmethod
+    def _input_array(processed_image) -> np.ndarray:
+        return processed_image.array if isinstance(processed_image, (TensorSlot, PooledBuffer)) else processed_image
+    
+    def collate_inputs(self, inputs: List) -> object:
+        """
+        Assemble les entrées d'un batch: indices d'emplacements partagés, l'entrée elle-même
+        pour une seule image, ou tableau (N, H, W, C), emprunté au pool s'il est actif
+        (rendu par `predict_batch_raw` après la passe avant)
+        """
+        if self.worker_pool is not None and all(isinstance(item, TensorSlot) for item in inputs):
+            return SharedBatch([item.index for item in inputs])
+        arrays = [self._input_array(item) for item in inputs]
+        if len(arrays) == 1:
+            return arrays[0]
+        if self.buffer_pool is None:
+            return np.concatenate(arrays, axis=0)
+        batch = self.buffer_pool.acquire(sum(array.shape[0] for array in arrays), arrays[0].dtype)
+        try:
+            np.concatenate(arrays, axis=0, out=batch.array)
+        except Exception:
+            batch.release()
+            raise
+        return batch
+    
+    def predict_batch_raw(self, batch, handle: Optional[ModelHandle] = None) -> np.ndarray:
+        """
+        Effectue une passe avant sur un batch (N, H, W, C) ou un SharedBatch avec le
+        modèle acquis par la requête (par défaut le modèle actif, le temps de l'appel).
+        Un batch emprunté au pool (PooledBuffer) lui est rendu après la passe avant.
+        """
+        if isinstance(batch, PooledBuffer):
+            try:
+                return self.predict_batch_raw(batch.array, handle)
+            finally:
+                batch.release()
+        if handle is None:
+            handle = model_loader.acquire()
+            try:
+                return self.predict_batch_raw(batch, handle)
+            finally:
+                handle.release()
+        
+        start = time.perf_counter()
+        if isinstance(batch, SharedBatch) and self.worker_pool is None:
+            batch = self.tensor_ring.batch_view(batch.indices)
+        
+        # Prédiction avec le moteur du modèle (Keras, TFLite, ONNX ou processus dédiés)
+        predictions = handle.predict(batch)
+        elapsed = time.perf_counter() - start
+        self.inference_latency.record(elapsed, len(predictions))
+        handle.latency.record(elapsed, len(predictions))
+        
+        # Vérifier la forme de sortie
+        if len(predictions.shape) != 2:
+            raise ValueError(f"Forme de prédiction inattendue: {predictions.shape}")
+        
+        return predictions
+    
+    def predict_raw(self, processed_image: np.ndarray, handle: Optional[ModelHandle] = None) -> np.ndarray:
         """Effectue la prédiction brute avec le modèle"""
         try:
-            if not model_loader.model_loaded or model_loader.model is None:
-                raise RuntimeError("Le modèle n'est pas chargé")
-            
-            # Prédiction avec le modèle TensorFlow
-            predictions = model_loader.model.predict(processed_image, verbose=0)
-            
-            # Vérifier la forme de sortie
-            if len(predictions.shape) != 2:
-                raise ValueError(f"Forme de prédiction inattendue: {predictions.shape}")
+            if self.batch_scheduler is not None:
+                # Passage par le scheduler de micro-batching (batches d'une seule version du modèle)
+                return self.batch_scheduler.predict(processed_image, handle)
             
+            predictions = self.predict_batch_raw(self.collate_inputs([processed_image]), handle)
             return predictions[0]  # Retourner les probabilités pour le premier (et seul) échantillon
             
         except Exception as e:
             logger.error(f"Erreur lors de la prédiction brute: {str(e)}")
             raise RuntimeError(f"Échec de la prédiction: {str(e)}")
     
-    def get_top_predictions(self, probabilities: np.ndarray) -> List[Dict]:
+    def get_top_predictions(self, probabilities: np.ndarray, class_names: Optional[List[str]] = None) -> List[Dict]:
         """Extrait les top K prédictions"""
         try:
+            if class_names is None:
+                class_names = model_loader.class_names
             top_predictions = []
             
             # Obtenir les indices triés par probabilité décroissante
             top_indices = np.argsort(probabilities)[::-1][:self.top_k_predictions]
             
             for rank, idx in enumerate(top_indices):
-                if idx < len(model_loader.class_names):
-                    class_name = model_loader.class_names[idx]
+                if idx < len(class_names):
+                    class_name = class_names[idx]
                     confidence = float(probabilities[idx])
                     
                     top_predictions.append({
@@ -78,6 +318,44 @@ class PredictionService:
             logger.error(f"Erreur lors de l'extraction des top prédictions: {str(e)}")
             return []
     
+    def get_top_predictions_batch(self, probabilities: np.ndarray, class_names: Optional[List[str]] = None) -> List[List[Dict]]:
+        """Extrait les top K prédictions pour une matrice de probabilités (N, C) en une passe"""
+        try:
+            if probabilities.ndim != 2:
+                raise ValueError(f"Matrice de probabilités attendue, forme reçue: {probabilities.shape}")
+            if class_names is None:
+                class_names = model_loader.class_names
+            
+            n_classes = min(probabilities.shape[1], len(class_names))
+            k = min(self.top_k_predictions, n_classes)
+            if k == 0:
+                return [[] for _ in range(probabilities.shape[0])]
+            
+            # Sélection partielle des K meilleurs indices puis tri de ces seuls K
+            scores = probabilities[:, :n_classes]
+            candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+            order = np.argsort(-candidate_scores, axis=1, kind="stable")
+            top_indices = np.take_along_axis(candidates, order, axis=1)
+            top_scores = np.take_along_axis(candidate_scores, order, axis=1)
+            
+            return [
+                [
+                    {
+                        "class_name": class_names[idx],
+                        "confidence": float(score),
+                        "rank": rank + 1,
+                        "class_index": int(idx)
+                    }
+                    for rank, (idx, score) in enumerate(zip(row_indices, row_scores))
+                ]
+                for row_indices, row_scores in zip(top_indices.tolist(), top_scores.tolist())
+            ]
+            
+        except Exception as e:
+            logger.error(f"Erreur lors de l'extraction des top prédictions (batch): {str(e)}")
+            return [[] for _ in range(len(probabilities))]
+    
     def determine_result_type(self, predicted_class: str, confidence: float) -> str:
         """Détermine le type de résultat basé sur la prédiction"""
         try:
@@ -98,40 +376,151 @@ class PredictionService:
             logger.error(f"Erreur lors de la détermination du type de résultat: {str(e)}")
             return "unknown"
     
-    def _get_disease_specific_recommendations(self, disease_name: str) -> str:
-        """
-        Génère des recommandations spécifiques pour une maladie en utilisant l'API Gemini.
-        """
-        if not self.model:
-            return "Le service de recommandation n'est pas disponible pour le moment."
-
-        # 1. Créer un prompt clair et détaillé pour l'API
-        prompt = (
+    def _build_recommendation_prompt(self, disease_name: str, language: str) -> str:
+        """Prompt de recommandations (toute modification incrémente RECOMMENDATION_PROMPT_VERSION)"""
+        language_name = RECOMMENDATION_LANGUAGES.get(language, language)
+        return (
             f"Fournis des recommandations concises pour un agriculteur afin de traiter et prévenir la maladie '{disease_name}'. "
             "Organise la réponse en deux sections claires et distinctes :\n"
             "1. **Traitements suggérés** (incluant des options biologiques et chimiques si possible).\n"
             "2. **Mesures préventives** (actions pour éviter de futures infections).\n"
-            "La réponse doit être en français, directe et facile à comprendre."
+            f"La réponse doit être en {language_name}, directe et facile à comprendre."
         )
-
+    
+    def _generate_disease_recommendations(self, disease_name: str, language: str) -> str:
+        """
+        Appelle l'API Gemini via la passerelle LLM; lève une exception si le service est
+        indisponible, suspendu par le disjoncteur, trop lent ou si la réponse est vide.
+        """
+        if not self.model:
+            raise RuntimeError("Service de recommandation indisponible")
+        
+        prompt = self._build_recommendation_prompt(disease_name, language)
+        response = self.llm_gateway.call(lambda: self.model.generate_content(
+            prompt, request_options={"timeout": settings.ml_llm_timeout_seconds}
+        ))
+        if not response or not response.text:
+            logger.warning(f"Aucune recommandation générée par l'API pour '{disease_name}'.")
+            raise ValueError(f"Réponse vide pour '{disease_name}'")
+        return f"Recommandations spécifiques pour: {disease_name}\n\n{response.text}"
+    
+    def get_disease_recommendations(self, disease_name: str, language: Optional[str] = None) -> str:
+        """
+        Recommandations spécifiques pour une maladie: catalogue des maladies d'abord,
+        LLM seulement si le catalogue n'a pas d'entrée. Lève une exception si aucun texte n'est disponible.
+        """
+        language = language or settings.ml_recommendation_language
+        text, _ = self.recommendation_providers.get(disease_name, language)
+        return text
+    
+    def _llm_recommendations(self, disease_name: str, language: str) -> str:
+        """
+        Recommandations générées par l'API Gemini. Avec le cache, un seul appel est effectué
+        par (classe, langue, version du prompt), y compris pour des requêtes concurrentes.
+        """
+        if settings.ml_recommendation_lookup_only:
+            # Recommandations précalculées (app.ml.precompute_recommendations): aucun appel sur le chemin critique
+            text = None
+            if self.recommendation_cache is not None:
+                text = self.recommendation_cache.lookup((disease_name, language, RECOMMENDATION_PROMPT_VERSION))
+            if text is None:
+                raise LookupError(f"Aucune recommandation précalculée pour '{disease_name}' ({language})")
+            return text
+        
+        if self.recommendation_cache is None:
+            return self._generate_disease_recommendations(disease_name, language)
+        return self.recommendation_cache.get_or_generate(
+            (disease_name, language, RECOMMENDATION_PROMPT_VERSION),
+            lambda: self._generate_disease_recommendations(disease_name, language),
+        )
+    
+    def _get_disease_specific_recommendations(self, disease_name: str, language: Optional[str] = None) -> str:
+        """Recommandations spécifiques, ou un message d'erreur (jamais mis en cache) en cas d'échec"""
         try:
-            # 2. Appeler l'API Gemini pour générer le contenu
-            response = self.model.generate_content(prompt)
-            
-            if response and response.text:
-                # 3. Retourner la réponse formatée
-                return f"Recommandations spécifiques pour: {disease_name}\n\n{response.text}"
-            else:
-                # 4. Gérer une réponse vide
-                logger.warning(f"Aucune recommandation générée par l'API pour '{disease_name}'.")
-                return f"Aucune recommandation spécifique n'a pu être trouvée pour '{disease_name}'."
-
+            return self.get_disease_recommendations(disease_name, language)
+        except (CircuitOpenError, LLMTimeoutError) as e:
+            logger.warning(f"⚠️ Recommandations statiques servies pour '{disease_name}': {str(e)}")
+            return STATIC_RECOMMENDATIONS
+        except (LookupError, ValueError) as e:
+            logger.warning(f"⚠️ {str(e)}")
+            return f"Aucune recommandation spécifique n'a pu être trouvée pour '{disease_name}'."
         except Exception as e:
-            # 4. Gérer les erreurs de l'API
+            if not self.model:
+                return "Le service de recommandation n'est pas disponible pour le moment."
             logger.error(f"Erreur lors de l'appel à l'API Gemini pour '{disease_name}': {str(e)}")
             return "Erreur lors de la récupération des recommandations spécifiques."
 
-    def generate_recommendations(self, predicted_class: str, confidence: float, result_type: str, top_predictions:list) -> str:
+    def load_recommendation_catalogue(self) -> int:
+        """Indexe en mémoire le catalogue des maladies; un échec laisse le LLM comme seule source"""
+        if self.catalogue is None:
+            return 0
+        try:
+            return self.catalogue.load()
+        except Exception as e:
+            logger.error(f"❌ Catalogue des maladies non chargé: {str(e)}")
+            return 0
+    
+    def preload_recommendations(self) -> int:
+        """Charge en mémoire les recommandations précalculées de la langue et du prompt courants"""
+        if self.recommendation_cache is None:
+            return 0
+        return self.recommendation_cache.preload(settings.ml_recommendation_language, RECOMMENDATION_PROMPT_VERSION)
+    
+    def stream_disease_recommendations(self, disease_name: str, language: Optional[str] = None) -> Iterator[str]:
+        """
+        Recommandations spécifiques par morceaux, au fil de la génération Gemini.
+        Un texte déjà en cache est renvoyé en un seul morceau; un texte généré est mis en cache.
+        """
+        language = language or settings.ml_recommendation_language
+        if self.catalogue is not None:
+            text = self.catalogue.get(disease_name, language)
+            if text is not None:
+                yield text
+                return
+        key = (disease_name, language, RECOMMENDATION_PROMPT_VERSION)
+        if self.recommendation_cache is not None:
+            text = self.recommendation_cache.lookup(key)
+            if text is not None:
+                yield text
+                return
+        if settings.ml_recommendation_lookup_only:
+            raise LookupError(f"Aucune recommandation précalculée pour '{disease_name}' ({language})")
+        if not self.model:
+            raise RuntimeError("Service de recommandation indisponible")
+        
+        header = f"Recommandations spécifiques pour: {disease_name}\n\n"
+        chunks = [header]
+        yield header
+        prompt = self._build_recommendation_prompt(disease_name, language)
+        for chunk in self.llm_gateway.stream(lambda: self.model.generate_content(
+            prompt, stream=True, request_options={"timeout": settings.ml_llm_timeout_seconds}
+        )):
+            if chunk.text:
+                chunks.append(chunk.text)
+                yield chunk.text
+        if len(chunks) == 1:
+            raise ValueError(f"Réponse vide pour '{disease_name}'")
+        if self.recommendation_cache is not None:
+            self.recommendation_cache.put(key, "".join(chunks))
+    
+    def base_disease_recommendations(self, predicted_class: str, confidence: float) -> str:
+        """Mesures immédiates communes à toutes les maladies (sans appel LLM)"""
+        return (
+            f"Maladie détectée: {predicted_class} (confiance: {confidence:.1%})\n\n"
+            "Mesures immédiates:\n"
+            "• Isolez la plante pour éviter la propagation\n"
+            "• Retirez les parties visiblement affectées avec des outils désinfectés\n"
+            "• Améliorez la ventilation autour de la plante\n\n"
+        )
+    
+    def degraded_recommendations(self, predicted_class: str, confidence: float) -> str:
+        """Recommandations de base, sans attendre la source des recommandations spécifiques"""
+        return (
+            self.base_disease_recommendations(predicted_class, confidence)
+            + "Les recommandations spécifiques à cette maladie seront disponibles lors d'un prochain scan."
+        )
+    
+    def generate_recommendations(self, predicted_class: str, confidence: float, result_type: str, top_predictions:list, disease_specific: Optional[str] = None) -> str:
         """Génère des recommandations personnalisées basées sur le résultat de la détection."""
         try:
             if result_type == "unknown":
@@ -152,16 +541,11 @@ class PredictionService:
                 )
             
             if result_type == "diseased":
-                base_recommendations = (
-                    f"Maladie détectée: {predicted_class} (confiance: {confidence:.1%})\n\n"
-                    "Mesures immédiates:\n"
-                    "• Isolez la plante pour éviter la propagation\n"
-                    "• Retirez les parties visiblement affectées avec des outils désinfectés\n"
-                    "• Améliorez la ventilation autour de la plante\n\n"
-                )
+                base_recommendations = self.base_disease_recommendations(predicted_class, confidence)
                 
-                # Appel à la fonction dynamique
-                disease_specific = self._get_disease_specific_recommendations(predicted_class)
+                # Appel à la fonction dynamique (sauf si déjà calculé pour cette classe)
+                if disease_specific is None:
+                    disease_specific = self._get_disease_specific_recommendations(predicted_class)
                 
                 return base_recommendations + disease_specific
             
@@ -172,64 +556,328 @@ class PredictionService:
             return "Erreur critique lors de la génération des recommandations."
         
 
-    def predict(self, image_bytes: bytes) -> Dict:
+    def submit_inference(self, processed_image: np.ndarray, executor: Optional[Executor] = None,
+                         handle: Optional[ModelHandle] = None) -> Future:
+        """
+        Soumet l'inférence sans bloquer l'appelant.
+        Avec le scheduler de micro-batching, le Future est résolu par son thread;
+        sinon la prédiction brute est exécutée sur l'executor fourni.
+        """
+        if self.batch_scheduler is not None:
+            return self.batch_scheduler.submit(processed_image, handle)
+        if executor is None:
+            raise ValueError("Un executor est requis lorsque le micro-batching est désactivé")
+        return executor.submit(self.predict_raw, processed_image, handle)
+    
+    def analyze_probabilities(self, probabilities: np.ndarray, class_names: Optional[List[str]] = None) -> Dict:
+        """Extrait la classe prédite, la confiance, les top prédictions et le type de résultat"""
+        if class_names is None:
+            class_names = model_loader.class_names
+        predicted_class_index = np.argmax(probabilities)
+        confidence = float(probabilities[predicted_class_index])
+        
+        if predicted_class_index < len(class_names):
+            predicted_class = class_names[predicted_class_index]
+        else:
+            predicted_class = "Classe inconnue"
+        
+        top_predictions = self.get_top_predictions(probabilities, class_names)
+        result_type = self.determine_result_type(predicted_class, confidence)
+        
+        return {
+            "predicted_class": predicted_class,
+            "confidence": confidence,
+            "result_type": result_type,
+            "top_predictions": top_predictions,
+        }
+    
+    def build_result(self, analysis: Dict, recommendations: Optional[str], start_time: datetime,
+                     model_version: Optional[str] = None) -> Dict:
+        """Assemble le résultat final de la prédiction"""
+        processing_time = (datetime.now() - start_time).total_seconds()
+        
+        logger.info(
+            f"Prédiction terminée: {analysis['predicted_class']} "
+            f"({analysis['confidence']:.3f}) en {processing_time:.2f}s"
+        )
+        
+        return {
+            **analysis,
+            "recommendations": recommendations,
+            "processing_time": processing_time,
+            "model_version": model_version or model_loader.model_version or "unknown",
+            "timestamp": datetime.now().isoformat(),
+        }
+
+    def cache_key(self, image_bytes: bytes, model_version: str) -> Optional[str]:
+        """Clé de cache de l'image pour une version du modèle (None si le cache est désactivé)"""
+        if self.prediction_cache is None:
+            return None
+        return PredictionCache.make_key(image_bytes, model_version, self.confidence_threshold)
+    
+    def _reused_result(self, result: Dict, start_time: datetime, **extra) -> Dict:
+        """Résultat réutilisé, avec un temps de traitement et un horodatage propres à la requête"""
+        return {
+            **result,
+            "processing_time": (datetime.now() - start_time).total_seconds(),
+            "timestamp": datetime.now().isoformat(),
+            "cached": True,
+            **extra,
+        }
+    
+    def _reusable_fields(self, result: Dict) -> Dict:
+        """Champs d'un résultat réutilisables par une autre requête"""
+        return {
+            key: value for key, value in result.items()
+            if key not in ("processing_time", "timestamp", "cached", "near_duplicate_distance")
+        }
+    
+    def get_cached_result(self, cache_key: Optional[str], start_time: datetime) -> Optional[Dict]:
+        """Résultat déjà calculé pour cette clé, avec un temps de traitement et un horodatage à jour"""
+        if cache_key is None:
+            return None
+        cached = self.prediction_cache.get(cache_key)
+        if cached is None:
+            return None
+        return self._reused_result(cached, start_time)
+    
+    def cache_result(self, cache_key: Optional[str], result: Dict):
+        """Met en cache un résultat (sans ses champs propres à la requête)"""
+        if cache_key is None:
+            return
+        self.prediction_cache.put(cache_key, result["model_version"], self._reusable_fields(result))
+    
+    def lookup_cached_result(self, image_bytes: bytes, model_version: str,
+                             start_time: datetime) -> Tuple[Optional[str], Optional[Dict]]:
+        """Clé de cache de l'image et résultat déjà calculé (bloquant: empreinte SHA-256 et lecture disque)"""
+        cache_key = self.cache_key(image_bytes, model_version)
+        return cache_key, self.get_cached_result(cache_key, start_time)
+    
+    def cache_image_result(self, image_bytes: bytes, result: Dict):
+        """Met en cache le résultat d'une image dont la clé n'a pas encore été calculée (bloquant)"""
+        self.cache_result(self.cache_key(image_bytes, result["model_version"]), result)
+    
+    def complete_recommendations(self, result: Dict) -> Dict:
+        """
+        Résultat réutilisé enregistré sans recommandations (scan d'une maladie dont les
+        recommandations sont complétées en arrière-plan): elles sont générées pour cette requête
+        """
+        if result["recommendations"] is not None:
+            return result
+        return {**result, "recommendations": self.generate_recommendations(
+            result["predicted_class"], result["confidence"], result["result_type"], result["top_predictions"]
+        )}
+    
+    def use_near_duplicates(self, user_id: Optional[int]) -> bool:
+        """La recherche de quasi-doublons nécessite l'index et un utilisateur identifié"""
+        return self.near_duplicate_index is not None and user_id is not None
+    
+    def find_near_duplicate(self, user_id: Optional[int], image_hash: Optional[int],
+                            model_version: str, start_time: datetime) -> Optional[Dict]:
+        """Prédiction d'un scan récent quasi identique du même utilisateur, ou None"""
+        if image_hash is None or not self.use_near_duplicates(user_id):
+            return None
+        match = self.near_duplicate_index.find(user_id, image_hash, model_version)
+        if match is None:
+            return None
+        result, distance = match
+        logger.debug(f"Quasi-doublon d'un scan récent (distance {distance}): inférence évitée")
+        return self._reused_result(result, start_time, near_duplicate_distance=distance)
+    
+    def remember_scan(self, user_id: Optional[int], image_hash: Optional[int], result: Dict):
+        """Ajoute le scan à l'index des quasi-doublons de l'utilisateur"""
+        if image_hash is None or not self.use_near_duplicates(user_id):
+            return
+        self.near_duplicate_index.add(user_id, image_hash, result["model_version"], self._reusable_fields(result))
+    
+    def predict(self, image_bytes: bytes, user_id: Optional[int] = None) -> Dict:
         """Pipeline complet de prédiction"""
         try:
             start_time = datetime.now()
             
-            # Étape 1: Prétraitement de l'image
-            logger.debug("Début du prétraitement de l'image")
-            processed_image = image_preprocessor.preprocess(image_bytes)
+            # La requête utilise le modèle actif à son arrivée, même si un rechargement survient
+            handle = model_loader.acquire()
+            try:
+                # Image déjà analysée par cette version du modèle: aucun calcul
+                cache_key = self.cache_key(image_bytes, handle.version)
+                cached = self.get_cached_result(cache_key, start_time)
+                if cached is not None:
+                    return self.complete_recommendations(cached)
+                
+                # Étape 1: Prétraitement de l'image
+                logger.debug("Début du prétraitement de l'image")
+                image_hash = None
+                if self.use_near_duplicates(user_id):
+                    processed_image, image_hash = self.preprocess_input_with_hash(image_bytes)
+                else:
+                    processed_image = self.preprocess_input(image_bytes)
+                
+                # Étape 2: Prédiction brute, sauf pour un quasi-doublon d'un scan récent
+                logger.debug("Début de la prédiction")
+                try:
+                    duplicate = self.find_near_duplicate(user_id, image_hash, handle.version, start_time)
+                    if duplicate is not None:
+                        return self.complete_recommendations(duplicate)
+                    probabilities = self.predict_raw(processed_image, handle)
+                finally:
+                    self.release_input(processed_image)
+            finally:
+                handle.release()
             
-            # Étape 2: Prédiction brute
-            logger.debug("Début de la prédiction")
-            probabilities = self.predict_raw(processed_image)
+            # Étapes 3 à 5: Classe prédite, top prédictions et type de résultat
+            analysis = self.analyze_probabilities(probabilities, handle.class_names)
             
-            # Étape 3: Extraction des résultats
-            predicted_class_index = np.argmax(probabilities)
-            confidence = float(probabilities[predicted_class_index])
+            # Étape 6: Génération des recommandations
+            recommendations = self.generate_recommendations(
+                analysis["predicted_class"], analysis["confidence"],
+                analysis["result_type"], analysis["top_predictions"]
+            )
+            
+            result = self.build_result(analysis, recommendations, start_time, handle.version)
+            self.cache_result(cache_key, result)
+            self.remember_scan(user_id, image_hash, result)
+            return result
             
-            if predicted_class_index < len(model_loader.class_names):
-                predicted_class = model_loader.class_names[predicted_class_index]
+        except Exception as e:
+            logger.error(f"Erreur dans le pipeline de prédiction: {str(e)}")
+            raise RuntimeError(f"Échec de la prédiction: {str(e)}")
+    
+    def _preprocess_safe(self, image_bytes: bytes):
+        """Prétraite une image et retourne l'exception au lieu de la lever"""
+        try:
+            return self.preprocess_input(image_bytes)
+        except Exception as e:
+            return e
+    
+    def predict_batch(self, images: List[bytes], executors=None) -> List[Dict]:
+        """
+        Pipeline de prédiction pour plusieurs images.
+        Chaque élément du résultat contient soit `result`, soit `error_code`/`error_message`,
+        une image invalide ne fait donc pas échouer tout le batch.
+        `executors` (voir MLExecutors) répartit le prétraitement, l'inférence et les
+        appels Gemini sur leurs pools dédiés; sans lui tout s'exécute dans l'appelant.
+        """
+        start_time = datetime.now()
+        items: List[Dict] = [{"success": False} for _ in images]
+        
+        # Étape 0: Images déjà analysées par la version principale du modèle
+        cache_keys: List[Optional[str]] = [None] * len(images)
+        pending_indices = list(range(len(images)))
+        model_version = model_loader.model_version
+        if self.prediction_cache is not None and model_version is not None:
+            pending_indices = []
+            for index, image_bytes in enumerate(images):
+                cache_keys[index] = self.cache_key(image_bytes, model_version)
+                cached = self.get_cached_result(cache_keys[index], start_time)
+                if cached is not None:
+                    items[index] = {"success": True, "result": self.complete_recommendations(cached)}
+                else:
+                    pending_indices.append(index)
+        
+        # Étape 1: Prétraitement parallèle
+        pending_images = [images[index] for index in pending_indices]
+        if executors is not None:
+            pending_processed = list(executors.image.map(self._preprocess_safe, pending_images))
+        else:
+            pending_processed = [self._preprocess_safe(image_bytes) for image_bytes in pending_images]
+        processed: List = [None] * len(images)
+        for index, result in zip(pending_indices, pending_processed):
+            processed[index] = result
+        
+        valid_indices = []
+        for index in pending_indices:
+            if isinstance(processed[index], Exception):
+                items[index].update(error_code="preprocessing_failed", error_message=str(processed[index]))
+            else:
+                valid_indices.append(index)
+        
+        if not valid_indices:
+            return items
+        
+        # Étape 2: Une seule passe avant sur le batch complet, avec le modèle actif
+        handle = None
+        try:
+            handle = model_loader.acquire()
+            batch = self.collate_inputs([processed[index] for index in valid_indices])
+            if executors is not None:
+                probabilities = executors.inference.submit(self.predict_batch_raw, batch, handle).result()
+            else:
+                probabilities = self.predict_batch_raw(batch, handle)
+        except Exception as e:
+            logger.error(f"Erreur lors de la prédiction batch: {str(e)}")
+            for index in valid_indices:
+                items[index].update(error_code="inference_failed", error_message=str(e))
+            return items
+        finally:
+            for index in valid_indices:
+                self.release_input(processed[index])
+            if handle is not None:
+                handle.release()
+        
+        # Étape 3: Top prédictions vectorisées
+        top_predictions_batch = self.get_top_predictions_batch(probabilities, handle.class_names)
+        
+        # Étape 4: Type de résultat pour chaque image
+        analyses = []
+        for row in range(len(valid_indices)):
+            top_predictions = top_predictions_batch[row]
+            if top_predictions:
+                predicted_class = top_predictions[0]["class_name"]
+                confidence = top_predictions[0]["confidence"]
             else:
                 predicted_class = "Classe inconnue"
-            
-            # Étape 4: Top prédictions
-            top_predictions = self.get_top_predictions(probabilities)
-            
-            # Étape 5: Détermination du type de résultat
+                confidence = float(np.max(probabilities[row]))
             result_type = self.determine_result_type(predicted_class, confidence)
+            analyses.append((predicted_class, confidence, result_type, top_predictions))
+        
+        # Étape 5: Une seule requête Gemini par maladie détectée, en parallèle si possible
+        diseases = sorted({analysis[0] for analysis in analyses if analysis[2] == "diseased"})
+        if executors is not None:
+            disease_texts = list(executors.io.map(self._get_disease_specific_recommendations, diseases))
+        else:
+            disease_texts = [self._get_disease_specific_recommendations(disease) for disease in diseases]
+        disease_specific_cache: Dict[str, str] = dict(zip(diseases, disease_texts))
+        
+        for row, index in enumerate(valid_indices):
+            predicted_class, confidence, result_type, top_predictions = analyses[row]
+            disease_specific = disease_specific_cache.get(predicted_class) if result_type == "diseased" else None
             
-            # Étape 6: Génération des recommandations
             recommendations = self.generate_recommendations(
-                predicted_class, confidence, result_type, top_predictions
+                predicted_class, confidence, result_type, top_predictions, disease_specific
             )
             
-            # Calcul du temps de traitement
-            processing_time = (datetime.now() - start_time).total_seconds()
-            
-            logger.info(f"Prédiction terminée: {predicted_class} ({confidence:.3f}) en {processing_time:.2f}s")
-            
-            return {
-                "predicted_class": predicted_class,
-                "confidence": confidence,
-                "result_type": result_type,
-                "top_predictions": top_predictions,
-                "recommendations": recommendations,
-                "processing_time": processing_time,
-                "model_version": "1.0",
-                "timestamp": datetime.now().isoformat(),
+            items[index] = {
+                "success": True,
+                "result": {
+                    "predicted_class": predicted_class,
+                    "confidence": confidence,
+                    "result_type": result_type,
+                    "top_predictions": top_predictions,
+                    "recommendations": recommendations,
+                    "model_version": handle.version,
+                    "timestamp": datetime.now().isoformat(),
+                }
             }
-            
-        except Exception as e:
-            logger.error(f"Erreur dans le pipeline de prédiction: {str(e)}")
-            raise RuntimeError(f"Échec de la prédiction: {str(e)}")
+        
+        total_time = (datetime.now() - start_time).total_seconds()
+        for index in valid_indices:
+            items[index]["result"]["processing_time"] = total_time
+            if cache_keys[index] is not None and handle.version == model_version:
+                self.cache_result(cache_keys[index], items[index]["result"])
+        logger.info(f"Prédiction batch terminée: {len(valid_indices)}/{len(images)} images en {total_time:.2f}s")
+        return items
     
     def get_service_info(self) -> Dict:
         """Retourne les informations sur le service de prédiction"""
         return {
             "confidence_threshold": self.confidence_threshold,
             "top_k_predictions": self.top_k_predictions,
+            "batching_enabled": self.batch_scheduler is not None,
+            "prediction_cache_enabled": self.prediction_cache is not None,
+            "near_duplicate_enabled": self.near_duplicate_index is not None,
+            "recommendation_cache_enabled": self.recommendation_cache is not None,
+            "recommendation_prompt_version": RECOMMENDATION_PROMPT_VERSION,
+            "llm_circuit_state": self.llm_gateway.state,
             "model_info": model_loader.get_model_info(),
             "preprocessor_info": image_preprocessor.get_preprocessing_info()
         }
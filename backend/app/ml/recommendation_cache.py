@@ -0,0 +1,238 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+RecommendationKey = Tuple[str, str, str]  # (classe de maladie, langue, version du prompt)
+
+
+class RecommendationCache:
+    """
+    Cache des recommandations spécifiques par (classe de maladie, langue, version du prompt).
+
+    - mémoire: LRU borné, consulté en premier;
+    - persistant (optionnel): table `recommendation_cache`, pour survivre aux redémarrages;
+    - rafraîchissement: une entrée plus vieille que `ttl_seconds` est régénérée; si la
+      génération échoue, l'ancienne valeur reste servie;
+    - single-flight: N requêtes concurrentes pour la même clé ne déclenchent qu'un seul
+      appel au générateur, les autres attendent son résultat.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 604800.0, persistent: bool = True):
+        if max_entries < 1:
+            raise ValueError("max_entries doit être supérieur ou égal à 1")
+
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persistent = persistent
+
+        # clé -> (générée le, texte)
+        self._entries: "OrderedDict[RecommendationKey, Tuple[float, str]]" = OrderedDict()
+        self._inflight: Dict[RecommendationKey, Future] = {}
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._persistent_hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._refreshes = 0
+        self._generation_errors = 0
+        self._stale_served = 0
+
+    def get_or_generate(self, key: RecommendationKey, generate: Callable[[], str]) -> str:
+        """
+        Retourne la recommandation en cache ou la génère une seule fois pour toutes
+        les requêtes concurrentes de la même clé. Lève l'exception du générateur si
+        aucune valeur (même expirée) n'est disponible.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[1]
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = Future()
+                self._inflight[key] = flight
+            else:
+                self._coalesced += 1
+
+        if not leader:
+            return flight.result()
+
+        try:
+            value = self._resolve(key, entry, now, generate)
+            flight.set_result(value)
+            return value
+        except Exception as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def lookup(self, key: RecommendationKey) -> Optional[str]:
+        """Recherche seule (mémoire puis table), sans génération ni contrôle d'âge"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[1]
+
+        stored = self._load_persistent(key)
+        with self._lock:
+            if stored is None:
+                self._misses += 1
+                return None
+            self._persistent_hits += 1
+        self._put_memory(key, stored[0], stored[1])
+        return stored[1]
+
+    def put(self, key: RecommendationKey, value: str):
+        """Enregistre un texte généré hors de `get_or_generate` (ex: génération en streaming)"""
+        self._put_memory(key, time.time(), value)
+        self._store_persistent(key, value)
+
+    def preload(self, language: str, prompt_version: str) -> int:
+        """Charge en mémoire les recommandations précalculées d'une langue et version du prompt"""
+        if not self.persistent:
+            return 0
+        try:
+            from app.database import SessionLocal
+            from app.crud.recommendation import get_cached_recommendations
+
+            db = SessionLocal()
+            try:
+                db_entries = get_cached_recommendations(db, language, prompt_version)
+            finally:
+                db.close()
+        except Exception as e:
+            logger.error(f"Erreur de préchargement des recommandations: {str(e)}")
+            return 0
+
+        for db_entry in db_entries[-self.max_entries:]:
+            updated_at = db_entry.updated_at or db_entry.created_at
+            self._put_memory(
+                (db_entry.disease_class, language, prompt_version),
+                updated_at.timestamp() if updated_at is not None else 0.0,
+                db_entry.content,
+            )
+        logger.info(f"✅ {len(db_entries)} recommandations précalculées chargées ({language}, {prompt_version})")
+        return len(db_entries)
+
+    def _resolve(self, key: RecommendationKey, entry: Optional[Tuple[float, str]], now: float,
+                 generate: Callable[[], str]) -> str:
+        stale = entry
+        if stale is None:
+            stored = self._load_persistent(key)
+            if stored is not None:
+                if now - stored[0] <= self.ttl_seconds:
+                    with self._lock:
+                        self._persistent_hits += 1
+                    self._put_memory(key, stored[0], stored[1])
+                    return stored[1]
+                stale = stored
+
+        with self._lock:
+            if stale is None:
+                self._misses += 1
+            else:
+                self._refreshes += 1
+
+        try:
+            value = generate()
+        except Exception as e:
+            with self._lock:
+                self._generation_errors += 1
+            if stale is None:
+                raise
+            logger.warning(f"⚠️ Rafraîchissement de la recommandation {key[0]} échoué, ancienne valeur servie: {str(e)}")
+            with self._lock:
+                self._stale_served += 1
+            return stale[1]
+
+        self._put_memory(key, time.time(), value)
+        self._store_persistent(key, value)
+        return value
+
+    def _put_memory(self, key: RecommendationKey, stored_at: float, value: str):
+        with self._lock:
+            self._entries[key] = (stored_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _load_persistent(self, key: RecommendationKey) -> Optional[Tuple[float, str]]:
+        if not self.persistent:
+            return None
+        try:
+            from app.database import SessionLocal
+            from app.crud.recommendation import get_cached_recommendation
+
+            db = SessionLocal()
+            try:
+                db_entry = get_cached_recommendation(db, *key)
+                if db_entry is None:
+                    return None
+                updated_at = db_entry.updated_at or db_entry.created_at
+                return (updated_at.timestamp() if updated_at is not None else 0.0), db_entry.content
+            finally:
+                db.close()
+        except Exception as e:
+            logger.error(f"Erreur de lecture du cache de recommandations: {str(e)}")
+            return None
+
+    def _store_persistent(self, key: RecommendationKey, value: str):
+        if not self.persistent:
+            return
+        try:
+            from app.database import SessionLocal
+            from app.crud.recommendation import upsert_cached_recommendation
+
+            db = SessionLocal()
+            try:
+                upsert_cached_recommendation(db, *key, value)
+            finally:
+                db.close()
+        except Exception as e:
+            logger.error(f"Erreur d'écriture du cache de recommandations: {str(e)}")
+
+    def invalidate(self, disease_class: Optional[str] = None):
+        """Vide le cache mémoire (d'une classe ou entièrement); la table est rafraîchie via le TTL"""
+        with self._lock:
+            if disease_class is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key[0] == disease_class]:
+                    del self._entries[key]
+
+    def get_stats(self) -> Dict:
+        """Retourne la taille et les compteurs du cache de recommandations"""
+        with self._lock:
+            lookups = self._hits + self._persistent_hits + self._misses + self._refreshes + self._coalesced
+            return {
+                "enabled": True,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "persistent": self.persistent,
+                "hits": self._hits,
+                "persistent_hits": self._persistent_hits,
+                "misses": self._misses,
+                "coalesced": self._coalesced,
+                "refreshes": self._refreshes,
+                "generation_errors": self._generation_errors,
+                "stale_served": self._stale_served,
+                "hit_rate": round(
+                    (self._hits + self._persistent_hits + self._coalesced) / lookups, 4
+                ) if lookups else 0.0,
+                "in_flight": len(self._inflight),
+            }
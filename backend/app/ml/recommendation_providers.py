@@ -0,0 +1,204 @@
+import re
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import logging
+
+from app.utils.metrics import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_disease_name(name: str) -> str:
+    """Forme comparable d'un nom de maladie ou de classe ('Tomato___Late_blight' -> 'tomato late blight')"""
+    return re.sub(r"[^0-9a-zà-ÿ]+", " ", name.lower()).strip()
+
+
+def class_name_keys(class_name: str) -> List[str]:
+    """
+    Formes normalisées acceptées pour une classe du modèle: nom complet, puis culture
+    sans précision entre parenthèses et maladie ('Cherry_(including_sour)___Powdery_mildew'
+    -> 'cherry including sour powdery mildew', 'cherry powdery mildew'). Jamais la maladie
+    seule: la même maladie existe sur plusieurs cultures (Bacterial_spot, Late_blight...).
+    """
+    keys = [normalize_disease_name(class_name)]
+    if "___" in class_name:
+        crop, disease = class_name.split("___", 1)
+        short = normalize_disease_name(re.sub(r"\(.*?\)", " ", crop) + " " + disease)
+        if short not in keys:
+            keys.append(short)
+    return keys
+
+
+class RecommendationProvider:
+    """
+    Interface commune des sources de recommandations spécifiques.
+    get() retourne le texte, None si la source ne connaît pas la maladie,
+    ou lève une exception en cas d'échec.
+    """
+
+    name = "base"
+
+    def get(self, disease_name: str, language: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def get_info(self) -> Dict:
+        return {"provider": self.name}
+
+
+class CatalogueProvider(RecommendationProvider):
+    """
+    Recommandations construites à partir du catalogue `diseases` (symptômes,
+    traitement, prévention), indexé en mémoire: aucun appel réseau par requête.
+    L'index est rechargé en arrière-plan lorsqu'il a plus de `refresh_seconds`.
+    Le catalogue est rédigé dans une seule langue (`language`): pour les autres,
+    get() retourne None et le LLM prend le relais.
+    """
+
+    name = "catalogue"
+
+    def __init__(self, refresh_seconds: float = 600.0, language: str = "fr"):
+        self.refresh_seconds = refresh_seconds
+        self.language = language
+        # nom normalisé -> (nom, symptômes, traitement, prévention)
+        self._index: Dict[str, Tuple[str, Optional[str], Optional[str], Optional[str]]] = {}
+        self._loaded_at = 0.0
+        self._refreshing = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return len(self._index)
+
+    def load(self, diseases: Optional[Iterable] = None) -> int:
+        """Indexe les maladies fournies, ou la table `diseases` à défaut; retourne la taille de l'index"""
+        if diseases is None:
+            from app.database import SessionLocal
+            from app.crud.disease import get_diseases
+
+            db = SessionLocal()
+            try:
+                diseases = get_diseases(db, limit=10000)
+            finally:
+                db.close()
+
+        index = {}
+        for disease in diseases:
+            if not disease.name or not (disease.treatment or disease.prevention):
+                continue
+            index[normalize_disease_name(disease.name)] = (
+                disease.name, disease.symptoms, disease.treatment, disease.prevention
+            )
+        self._index = index
+        self._loaded_at = time.time()
+        logger.info(f"✅ Catalogue des maladies indexé: {len(index)} entrées")
+        return len(index)
+
+    def _refresh_in_background(self):
+        if not self._refreshing.acquire(blocking=False):
+            return
+
+        def refresh():
+            try:
+                self.load()
+            except Exception as e:
+                logger.error(f"Erreur de rechargement du catalogue des maladies: {str(e)}")
+                self._loaded_at = time.time()
+            finally:
+                self._refreshing.release()
+
+        threading.Thread(target=refresh, name="disease-catalogue-refresh", daemon=True).start()
+
+    def find(self, class_name: str) -> Optional[Tuple[str, Optional[str], Optional[str], Optional[str]]]:
+        """Entrée du catalogue pour une classe du modèle (culture et maladie, voir class_name_keys), ou None"""
+        if time.time() - self._loaded_at > self.refresh_seconds:
+            self._refresh_in_background()
+
+        for key in class_name_keys(class_name):
+            entry = self._index.get(key)
+            if entry is not None:
+                return entry
+        return None
+
+    def get(self, disease_name: str, language: str) -> Optional[str]:
+        if language != self.language:
+            return None
+        entry = self.find(disease_name)
+        if entry is None:
+            return None
+        _, symptoms, treatment, prevention = entry
+        sections = [f"Recommandations spécifiques pour: {disease_name}"]
+        if symptoms:
+            sections.append(f"**Symptômes**\n{symptoms.strip()}")
+        if treatment:
+            sections.append(f"1. **Traitements suggérés**\n{treatment.strip()}")
+        if prevention:
+            sections.append(f"2. **Mesures préventives**\n{prevention.strip()}")
+        return "\n\n".join(sections)
+
+    def get_info(self) -> Dict:
+        return {
+            "provider": self.name,
+            "entries": self.size,
+            "language": self.language,
+            "loaded_at": self._loaded_at or None,
+            "refresh_seconds": self.refresh_seconds,
+        }
+
+
+class LLMProvider(RecommendationProvider):
+    """Génération par le LLM externe (cache et coalescence gérés par la fonction fournie)"""
+
+    name = "llm"
+
+    def __init__(self, generate: Callable[[str, str], str]):
+        self._generate = generate
+
+    def get(self, disease_name: str, language: str) -> Optional[str]:
+        return self._generate(disease_name, language)
+
+
+class RecommendationProviderChain:
+    """
+    Interroge les sources dans l'ordre et retourne la première réponse.
+    Mesure, pour chaque source, la latence et le nombre de réponses, d'absences et d'erreurs.
+    """
+
+    def __init__(self, providers: List[RecommendationProvider]):
+        self.providers = providers
+        self._latency = {provider.name: LatencyTracker() for provider in providers}
+        self._counts = {provider.name: {"hits": 0, "misses": 0, "errors": 0} for provider in providers}
+        self._lock = threading.Lock()
+
+    def get_provider(self, name: str) -> Optional[RecommendationProvider]:
+        return next((provider for provider in self.providers if provider.name == name), None)
+
+    def get(self, disease_name: str, language: str) -> Tuple[str, str]:
+        """Retourne (texte, source); lève LookupError si aucune source ne connaît la maladie"""
+        last_error: Optional[Exception] = None
+        for provider in self.providers:
+            start = time.perf_counter()
+            try:
+                text = provider.get(disease_name, language)
+                outcome = "hits" if text is not None else "misses"
+            except Exception as e:
+                text, outcome, last_error = None, "errors", e
+            self._latency[provider.name].record(time.perf_counter() - start)
+            with self._lock:
+                self._counts[provider.name][outcome] += 1
+            if text is not None:
+                return text, provider.name
+        if last_error is not None:
+            raise last_error
+        raise LookupError(f"Aucune source de recommandations pour '{disease_name}'")
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            counts = {name: dict(values) for name, values in self._counts.items()}
+        return {
+            provider.name: {
+                **provider.get_info(),
+                **counts[provider.name],
+                "latency": self._latency[provider.name].snapshot(),
+            }
+            for provider in self.providers
+        }
@@ -0,0 +1,163 @@
+import threading
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Sequence, Tuple
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class TensorSlot:
+    """Emplacement d'une image dans l'anneau de mémoire partagée"""
+
+    __slots__ = ("ring", "index", "array")
+
+    def __init__(self, ring: "SharedTensorRing", index: int, array: np.ndarray):
+        self.ring = ring
+        self.index = index
+        # Vue (1, H, W, C) directement sur la mémoire partagée
+        self.array = array
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.array.shape
+
+    def release(self):
+        self.ring.release(self.index)
+
+
+class SharedBatch:
+    """Batch décrit uniquement par les indices de ses emplacements (seul objet envoyé par la file)"""
+
+    __slots__ = ("indices",)
+
+    def __init__(self, indices: Sequence[int]):
+        self.indices = list(indices)
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """Ouvre un segment existant sans que ce processus n'en devienne responsable"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python >= 3.13
+    except TypeError:
+        # Les workers lancés en "spawn" partagent le resource_tracker du processus
+        # API: le segment reste enregistré une seule fois, au nom du propriétaire
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedTensorRing:
+    """
+    Anneau d'emplacements en mémoire partagée pour transporter les images
+    prétraitées du processus API vers les processus d'inférence sans pickling.
+
+    Le processus API écrit chaque image dans un emplacement (1, H, W, C); seuls
+    les indices traversent la file. Les emplacements sont alloués dans l'ordre de
+    l'anneau, de sorte que les images d'un même batch sont le plus souvent
+    contiguës et lues par le worker comme une simple vue, sans copie.
+    """
+
+    def __init__(
+        self,
+        slot_count: int,
+        image_shape: Tuple[int, int, int],
+        dtype=np.float32,
+        name: Optional[str] = None,
+        create: bool = True,
+    ):
+        if slot_count < 1:
+            raise ValueError("slot_count doit être supérieur ou égal à 1")
+
+        self.slot_count = slot_count
+        self.image_shape = tuple(image_shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = create
+
+        nbytes = slot_count * int(np.prod(self.image_shape)) * self.dtype.itemsize
+        if create:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=nbytes)
+        else:
+            self._shm = _attach_shared_memory(name)
+
+        self.buffer = np.ndarray((slot_count, *self.image_shape), dtype=self.dtype, buffer=self._shm.buf)
+
+        self._lock = threading.Lock()
+        self._in_use = [False] * slot_count
+        self._next = 0
+        self._acquired = 0
+        self._exhausted = 0
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def spec(self) -> Dict:
+        """Description permettant à un autre processus de s'attacher à l'anneau"""
+        return {
+            "name": self.name,
+            "slot_count": self.slot_count,
+            "image_shape": self.image_shape,
+            "dtype": self.dtype.str,
+        }
+
+    @classmethod
+    def attach(cls, spec: Dict) -> "SharedTensorRing":
+        """S'attache à un anneau créé par un autre processus"""
+        return cls(
+            slot_count=spec["slot_count"],
+            image_shape=spec["image_shape"],
+            dtype=np.dtype(spec["dtype"]),
+            name=spec["name"],
+            create=False,
+        )
+
+    def acquire(self) -> Optional[TensorSlot]:
+        """Réserve le prochain emplacement libre; None si l'anneau est plein"""
+        with self._lock:
+            for offset in range(self.slot_count):
+                index = (self._next + offset) % self.slot_count
+                if not self._in_use[index]:
+                    self._in_use[index] = True
+                    self._next = (index + 1) % self.slot_count
+                    self._acquired += 1
+                    return TensorSlot(self, index, self.buffer[index:index + 1])
+            self._exhausted += 1
+            return None
+
+    def release(self, index: int):
+        with self._lock:
+            self._in_use[index] = False
+
+    def batch_view(self, indices: List[int]) -> np.ndarray:
+        """Retourne le batch (N, H, W, C): une vue si les indices sont contigus, sinon une copie"""
+        start = indices[0]
+        if indices == list(range(start, start + len(indices))):
+            return self.buffer[start:start + len(indices)]
+        return np.take(self.buffer, indices, axis=0)
+
+    def close(self):
+        """Détache l'anneau; le processus propriétaire supprime aussi le segment"""
+        self.buffer = None
+        self._shm.close()
+        if self.owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            in_use = sum(self._in_use)
+            return {
+                "name": self.name,
+                "slot_count": self.slot_count,
+                "slot_shape": list(self.image_shape),
+                "dtype": self.dtype.name,
+                "total_bytes": self._shm.size,
+                "slots_in_use": in_use,
+                "total_acquired": self._acquired,
+                "exhausted": self._exhausted,
+            }
@@ -0,0 +1,148 @@
+import threading
+from collections import defaultdict
+from typing import Dict, List, Tuple
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class PooledBuffer:
+    """Tableau (N, H, W, C) emprunté au pool, à rendre avec `release` après usage"""
+
+    __slots__ = ("pool", "key", "array", "pooled", "_released")
+
+    def __init__(self, pool: "TensorBufferPool", key: Tuple[int, str], array: np.ndarray, pooled: bool):
+        self.pool = pool
+        self.key = key
+        self.array = array
+        # False pour un tableau alloué hors limites: il n'est pas conservé à son retour
+        self.pooled = pooled
+        self._released = False
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.array.shape
+
+    def release(self):
+        """Rend le tableau au pool (sans effet au second appel)"""
+        if not self._released:
+            self._released = True
+            self.pool.release(self)
+
+
+class TensorBufferPool:
+    """
+    Pool de tableaux préalloués pour les entrées du modèle, par taille de batch et dtype.
+
+    Le prétraitement écrit chaque image dans un tableau (1, H, W, C) emprunté au
+    pool, et l'assemblage d'un batch dans un tableau (N, H, W, C); les tableaux
+    rendus après l'inférence sont réutilisés par les requêtes suivantes au lieu
+    d'être réalloués. Au plus `max_buffers_per_key` tableaux libres sont gardés
+    par (taille de batch, dtype), et `max_total_bytes` borne la mémoire totale
+    gérée par le pool (tableaux libres et empruntés). Au-delà, le tableau est
+    alloué normalement et libéré par le ramasse-miettes: le pool ne bloque jamais.
+    """
+
+    def __init__(self, image_shape: Tuple[int, int, int], max_buffers_per_key: int = 16,
+                 max_total_bytes: int = 256 * 1024 * 1024):
+        if max_buffers_per_key < 1:
+            raise ValueError("max_buffers_per_key doit être supérieur ou égal à 1")
+        if max_total_bytes < 0:
+            raise ValueError("max_total_bytes doit être positif")
+
+        self.image_shape = tuple(image_shape)
+        self.max_buffers_per_key = max_buffers_per_key
+        self.max_total_bytes = max_total_bytes
+
+        self._lock = threading.Lock()
+        self._free: Dict[Tuple[int, str], List[np.ndarray]] = defaultdict(list)
+        self._in_use: Dict[Tuple[int, str], int] = defaultdict(int)
+        # Octets des tableaux du pool, libres ou empruntés
+        self._pooled_bytes = 0
+        self._peak_bytes = 0
+        self._counts = {"acquired": 0, "reused": 0, "allocated": 0, "overflow": 0, "discarded": 0}
+
+    def _nbytes(self, batch_size: int, dtype: np.dtype) -> int:
+        return batch_size * int(np.prod(self.image_shape)) * dtype.itemsize
+
+    def acquire(self, batch_size: int = 1, dtype=np.float32) -> PooledBuffer:
+        """Emprunte un tableau (batch_size, H, W, C) non initialisé du type demandé"""
+        dtype = np.dtype(dtype)
+        key = (batch_size, dtype.str)
+        with self._lock:
+            self._counts["acquired"] += 1
+            self._in_use[key] += 1
+            free = self._free[key]
+            if free:
+                self._counts["reused"] += 1
+                return PooledBuffer(self, key, free.pop(), pooled=True)
+            nbytes = self._nbytes(batch_size, dtype)
+            pooled = self._pooled_bytes + nbytes <= self.max_total_bytes
+            if pooled:
+                self._counts["allocated"] += 1
+                self._pooled_bytes += nbytes
+                self._peak_bytes = max(self._peak_bytes, self._pooled_bytes)
+            else:
+                self._counts["overflow"] += 1
+        # Allocation hors verrou: seule la réservation des octets est protégée
+        return PooledBuffer(self, key, np.empty((batch_size, *self.image_shape), dtype=dtype), pooled=pooled)
+
+    def release(self, buffer: PooledBuffer):
+        with self._lock:
+            self._in_use[buffer.key] -= 1
+            if not buffer.pooled:
+                return
+            free = self._free[buffer.key]
+            if len(free) < self.max_buffers_per_key:
+                free.append(buffer.array)
+            else:
+                # Trop de tableaux libres de cette forme: la mémoire est rendue
+                self._counts["discarded"] += 1
+                self._pooled_bytes -= buffer.array.nbytes
+
+    def preallocate(self, batch_size: int, dtype, count: int) -> int:
+        """Alloue d'avance jusqu'à `count` tableaux libres (ex: au démarrage, avant le premier pic)"""
+        dtype = np.dtype(dtype)
+        key = (batch_size, dtype.str)
+        nbytes = self._nbytes(batch_size, dtype)
+        added = 0
+        with self._lock:
+            free = self._free[key]
+            while (added < count and len(free) < self.max_buffers_per_key
+                   and self._pooled_bytes + nbytes <= self.max_total_bytes):
+                free.append(np.empty((batch_size, *self.image_shape), dtype=dtype))
+                self._pooled_bytes += nbytes
+                added += 1
+            self._peak_bytes = max(self._peak_bytes, self._pooled_bytes)
+        return added
+
+    def clear(self):
+        """Libère les tableaux libres (les tableaux empruntés restent valides)"""
+        with self._lock:
+            for free in self._free.values():
+                self._pooled_bytes -= sum(array.nbytes for array in free)
+                free.clear()
+
+    def get_stats(self) -> Dict:
+        """Taux de réutilisation, mémoire gérée (courante et pic) et tableaux par forme"""
+        with self._lock:
+            acquired = self._counts["acquired"]
+            keys = sorted(set(self._free) | set(self._in_use))
+            return {
+                "image_shape": list(self.image_shape),
+                "max_buffers_per_key": self.max_buffers_per_key,
+                "max_total_bytes": self.max_total_bytes,
+                **self._counts,
+                "reuse_rate": round(self._counts["reused"] / acquired, 4) if acquired else 0.0,
+                "pooled_bytes": self._pooled_bytes,
+                "peak_bytes": self._peak_bytes,
+                "buffers": {
+                    f"{batch_size}x{np.dtype(dtype).name}": {
+                        "free": len(self._free.get((batch_size, dtype), [])),
+                        "in_use": self._in_use.get((batch_size, dtype), 0),
+                    }
+                    for batch_size, dtype in keys
+                },
+            }
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, UniqueConstraint
+from sqlalchemy.sql import func
+from app.database import Base
+
+class CachedRecommendation(Base):
+    __tablename__ = "recommendation_cache"
+    __table_args__ = (
+        UniqueConstraint("disease_class", "language", "prompt_version", name="uq_recommendation_cache_key"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    disease_class = Column(String(255), nullable=False)
+    language = Column(String(10), nullable=False)
+    prompt_version = Column(String(20), nullable=False)
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -14,6 +14,9 @@ class PlantScan(Base):
     confidence_score = Column(Numeric(5, 4))
     detected_diseases = Column(JSON)
     recommendations = Column(Text)
+    recommendations_status = Column(String(20), default="ready", server_default="ready", nullable=False)  # 'pending', 'processing', 'ready', 'failed'
+    recommendations_attempts = Column(Integer, default=0, server_default="0", nullable=False)
+    recommendations_retry_at = Column(DateTime(timezone=True))  # nouvelle tentative ou fin de réservation
     scan_date = Column(DateTime(timezone=True), server_default=func.now())
     location_lat = Column(Numeric(10, 8))
     location_lng = Column(Numeric(11, 8))
@@ -1,9 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from typing import Optional
+from typing import List, Optional, Tuple
 from datetime import datetime
+import io
 import json
+import os
+import zipfile
 
 from app.database import get_db
 from app.models.user import User
@@ -11,17 +16,23 @@ from app.models.scan import PlantScan, ScanDisease
 from app.models.disease import Disease
 from app.schemas.ml import (
     PredictionRequest, PredictionResponse, PredictionError, 
-    ModelStatus, ClassesResponse, ServiceStatus
+    ModelStatus, ClassesResponse, ServiceStatus,
+    BatchPredictionItem, BatchPredictionResponse, ModelRoutingUpdate
 )
 from app.schemas.scan import PlantScanCreate
 from app.services.ml_service import ml_service
 from app.services.file_service import FileService
-from app.core.security import get_current_user
+from app.core.security import get_current_admin_user, get_current_user
+from app.core.config import settings
 from app.crud.scan import create_scan, create_scan_disease
+from app.utils.deadline import Deadline, DeadlineExceeded
+from app.utils.sse import format_sse
 
 router = APIRouter()
 file_service = FileService()
 
+MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10MB
+
 @router.post("/predict", response_model=PredictionResponse)
 async def predict_disease(
     image: UploadFile = File(...),
@@ -57,7 +68,10 @@ async def predict_disease(
             )
         
         # Effectuer la prédiction
-        prediction_result = ml_service.predict(image_bytes)        
+        # Chaque étape est attendue sur son pool dédié, hors de la boucle d'événements
+        prediction_result = await ml_service.predict_async(
+            image_bytes, user_id=current_user.id, deadline=Deadline.from_settings()
+        )
              
         # Préparer la réponse
         response = PredictionResponse(
@@ -69,18 +83,188 @@ async def predict_disease(
             image="",
             scan_date=datetime.now(),
             model_version=prediction_result["model_version"],
-            processing_time=prediction_result.get("processing_time")
+            processing_time=prediction_result.get("processing_time"),
+            degraded_stages=prediction_result.get("degraded_stages", []),
+            stage_timings_ms=prediction_result.get("stage_timings_ms")
         )
         return response
         
     except HTTPException:
         raise
+    except DeadlineExceeded as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=f"Analyse trop longue: {str(e)}"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erreur lors de l'analyse: {str(e)}"
         )
 
+@router.post("/predict/stream")
+async def predict_disease_stream(
+    image: UploadFile = File(...),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Analyse en flux (Server-Sent Events): l'événement `classification` est émis dès la
+    fin de l'inférence, puis les recommandations par morceaux (`recommendation`),
+    leur texte complet (`recommendations`) et enfin `done`.
+    """
+    if not ml_service.model_loaded:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Le service de détection n'est pas disponible"
+        )
+    if not image.content_type or not image.content_type.startswith('image/'):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Le fichier doit être une image"
+        )
+    image_bytes = await image.read()
+    if len(image_bytes) > MAX_IMAGE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="L'image est trop volumineuse (max 10MB)"
+        )
+    
+    async def events():
+        try:
+            async for event, data in ml_service.predict_stream(image_bytes, user_id=current_user.id):
+                yield format_sse(event, data)
+            yield format_sse("done", {})
+        except Exception as e:
+            yield format_sse("error", {"detail": f"Erreur lors de l'analyse: {str(e)}"})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _extract_archive_images(archive_bytes: bytes) -> List[Tuple[str, Optional[bytes], Optional[PredictionError]]]:
+    """Extrait les images d'une archive ZIP (les autres fichiers sont ignorés)"""
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(archive_bytes))
+    except zipfile.BadZipFile:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="L'archive doit être un fichier ZIP valide"
+        )
+    
+    entries = []
+    with archive:
+        for member in archive.infolist():
+            if member.is_dir():
+                continue
+            extension = os.path.splitext(member.filename)[1].lower().lstrip(".")
+            if extension not in settings.allowed_extensions:
+                continue
+            if member.file_size > MAX_IMAGE_SIZE:
+                entries.append((member.filename, None, PredictionError(
+                    error_code="file_too_large",
+                    error_message="L'image est trop volumineuse (max 10MB)"
+                )))
+                continue
+            entries.append((member.filename, archive.read(member), None))
+    return entries
+
+@router.post("/predict/batch", response_model=BatchPredictionResponse)
+async def predict_disease_batch(
+    images: List[UploadFile] = File(default=[]),
+    archive: Optional[UploadFile] = File(None),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Analyse plusieurs images de plantes en une seule requête.
+    Accepte plusieurs fichiers et/ou une archive ZIP; une image invalide
+    est signalée individuellement sans faire échouer tout le batch.
+    """
+    if not ml_service.model_loaded:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Le service de détection n'est pas disponible"
+        )
+    
+    start_time = datetime.now()
+    entries: List[Tuple[str, Optional[bytes], Optional[PredictionError]]] = []
+    
+    for image in images:
+        if not image.content_type or not image.content_type.startswith('image/'):
+            entries.append((image.filename, None, PredictionError(
+                error_code="invalid_file_type",
+                error_message="Le fichier doit être une image"
+            )))
+            continue
+        image_bytes = await image.read()
+        if len(image_bytes) > MAX_IMAGE_SIZE:
+            entries.append((image.filename, None, PredictionError(
+                error_code="file_too_large",
+                error_message="L'image est trop volumineuse (max 10MB)"
+            )))
+            continue
+        entries.append((image.filename, image_bytes, None))
+    
+    if archive is not None:
+        archive_bytes = await archive.read()
+        entries.extend(_extract_archive_images(archive_bytes))
+    
+    if not entries:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Aucune image fournie"
+        )
+    if len(entries) > settings.ml_max_images_per_request:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Trop d'images (max {settings.ml_max_images_per_request} par requête)"
+        )
+    
+    try:
+        valid = [(index, data) for index, (_, data, error) in enumerate(entries) if error is None]
+        predictions = await ml_service.predict_batch_async([data for _, data in valid])
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erreur lors de l'analyse groupée: {str(e)}"
+        )
+    
+    results = [
+        BatchPredictionItem(filename=filename, success=False, error=error)
+        for filename, _, error in entries
+    ]
+    for (index, _), prediction in zip(valid, predictions):
+        if not prediction["success"]:
+            results[index].error = PredictionError(
+                error_code=prediction["error_code"],
+                error_message=prediction["error_message"]
+            )
+            continue
+        
+        result = prediction["result"]
+        results[index].success = True
+        results[index].prediction = PredictionResponse(
+            predicted_class=result["predicted_class"],
+            confidence=result["confidence"],
+            result_type=result["result_type"],
+            top_predictions=result["top_predictions"],
+            recommendations=result["recommendations"],
+            image="",
+            scan_date=datetime.now(),
+            model_version=result["model_version"],
+            processing_time=result.get("processing_time")
+        )
+    
+    succeeded = sum(1 for item in results if item.success)
+    return BatchPredictionResponse(
+        results=results,
+        total=len(results),
+        succeeded=succeeded,
+        failed=len(results) - succeeded,
+        processing_time=(datetime.now() - start_time).total_seconds()
+    )
+
 @router.get("/status", response_model=ServiceStatus)
 async def get_service_status():
     """
@@ -103,6 +287,17 @@ async def get_service_status():
             detail=f"Erreur lors de la récupération du statut: {str(e)}"
         )
 
+@router.get("/ready")
+async def get_readiness():
+    """
+    Sonde de disponibilité: 200 lorsque le modèle est chargé et prêt à prédire,
+    503 pendant le chargement ou après un échec (la vivacité est exposée par /health)
+    """
+    readiness = ml_service.get_readiness()
+    if not readiness["ready"]:
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=readiness)
+    return readiness
+
 @router.get("/model/status", response_model=ModelStatus)
 async def get_model_status():
     """
@@ -110,11 +305,11 @@ async def get_model_status():
     """
     try:
         status_info = ml_service.get_status()
-        model_info = status_info["model_info"]
+        model_info = {**status_info["model_info"], "registry": status_info["registry"]}
         
         return ModelStatus(
             model_loaded=ml_service.model_loaded,
-            model_version="1.0",
+            model_version=ml_service.model_version or "unknown",
             classes_count=len(ml_service.class_names),
             status="ready" if ml_service.model_loaded else "not_loaded",
             model_info=model_info
@@ -150,22 +345,85 @@ async def get_available_classes():
         )
 
 @router.post("/model/reload")
-async def reload_model():
+async def reload_model(current_user: User = Depends(get_current_admin_user)):
     """
-    Recharge le modèle ML (admin seulement)
+    Recharge le modèle ML sans interruption (admin seulement).
+    Le nouveau modèle est chargé et préchauffé en arrière-plan puis échangé
+    atomiquement; les requêtes en cours terminent sur l'ancien modèle.
     """
+    if ml_service.reload_in_progress:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Un rechargement du modèle est déjà en cours"
+        )
+    
     try:
-        success = ml_service.initialize()
-        
-        if success:
-            return {"message": "Modèle rechargé avec succès", "status": "success"}
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Échec du rechargement du modèle"
-            )
+        reload_info = await run_in_threadpool(ml_service.reload)
+        return {"message": "Modèle rechargé avec succès", "status": "success", **reload_info}
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erreur lors du rechargement: {str(e)}"
         )
+
+@router.get("/models")
+async def list_model_versions():
+    """
+    Retourne les versions chargées, le routage et les statistiques par version
+    (latence servie, accord top-1 et latence en mode shadow)
+    """
+    return ml_service.get_status()["registry"]
+
+@router.post("/models/{name}")
+async def load_model_version(name: str, current_user: User = Depends(get_current_admin_user)):
+    """
+    Charge une version nommée depuis app/ml/models/<name>/ à côté de la principale (admin seulement)
+    """
+    try:
+        return await run_in_threadpool(ml_service.load_version, name)
+    except (ValueError, FileNotFoundError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erreur lors du chargement de la version {name}: {str(e)}"
+        )
+
+@router.put("/models/routing")
+async def update_model_routing(
+    routing: ModelRoutingUpdate,
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Définit la version candidate, la part du trafic qu'elle sert et le mode shadow (admin seulement)
+    """
+    try:
+        ml_service.configure_routing(routing.candidate, routing.traffic_percent, routing.shadow)
+    except KeyError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=e.args[0])
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return ml_service.get_status()["registry"]
+
+@router.post("/models/{name}/promote")
+async def promote_model_version(name: str, current_user: User = Depends(get_current_admin_user)):
+    """
+    La version nommée devient principale; l'ancienne est libérée après ses requêtes en cours (admin seulement)
+    """
+    try:
+        return ml_service.promote_version(name)
+    except KeyError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=e.args[0])
+
+@router.delete("/models/{name}")
+async def unload_model_version(name: str, current_user: User = Depends(get_current_admin_user)):
+    """
+    Retire une version non principale du registre (admin seulement)
+    """
+    try:
+        ml_service.unload_version(name)
+    except KeyError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=e.args[0])
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {"message": f"Version {name} retirée", "status": "success"}
@@ -1,17 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status
+import asyncio
+import io
+import time
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
-from app.database import get_db
+from app.database import SessionLocal, get_db
 from app.models.disease import Disease
 from app.models.user import User
-from app.schemas.scan import PlantScan, PlantScanCreate, PlantScanUpdate
+from app.core.config import settings
+from app.schemas.scan import PlantScan, PlantScanCreate, PlantScanUpdate, ScanRecommendations
 from app.core.security import get_current_user
 from app.services.file_service import FileService
 from app.services.ml_service import ml_service
+from app.services.recommendation_worker import recommendation_worker
 from app.crud import scan as crud_scan
 from app.crud.scan import create_scan, create_scan_disease
 from app.crud.activity import create_scan_activity, create_disease_activity
+from app.utils.deadline import Deadline, DeadlineExceeded
+from app.utils.sse import format_sse
 router = APIRouter()
 file_service = FileService()
 
@@ -40,6 +49,46 @@ def get_scan(
         raise HTTPException(status_code=403, detail="Accès non autorisé")
     return scan
 
+def _read_scan_recommendations(scan_id: int) -> Optional[Tuple[int, str, Optional[str]]]:
+    """(propriétaire, statut, texte) des recommandations d'un scan, lus dans une session courte"""
+    db = SessionLocal()
+    try:
+        scan = crud_scan.get_scan(db, scan_id=scan_id)
+        return None if scan is None else (scan.user_id, scan.recommendations_status, scan.recommendations)
+    finally:
+        db.close()
+
+@router.get("/{scan_id}/recommendations", response_model=ScanRecommendations)
+async def get_scan_recommendations(
+    scan_id: int,
+    wait: float = Query(0, ge=0, le=30, description="Attente maximale (s) tant que le statut est 'pending' ou 'processing'"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Statut et texte des recommandations d'un scan (long polling avec `wait` tant qu'elles sont en cours).
+    Chaque lecture utilise sa propre session, hors de la boucle d'événements: aucune
+    connexion n'est retenue pendant l'attente.
+    """
+    # La session de l'authentification n'est plus utile: sa connexion est rendue au pool
+    await run_in_threadpool(db.close)
+    state = await run_in_threadpool(_read_scan_recommendations, scan_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Scan non trouvé")
+    if state[0] != current_user.id:
+        raise HTTPException(status_code=403, detail="Accès non autorisé")
+    
+    deadline = asyncio.get_running_loop().time() + wait
+    while state[1] in ("pending", "processing") and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.5)
+        state = await run_in_threadpool(_read_scan_recommendations, scan_id) or state
+    
+    return ScanRecommendations(
+        scan_id=scan_id,
+        status=state[1],
+        recommendations=state[2]
+    )
+
 @router.get("/plants/{plant_id}/scans", response_model=List[PlantScan])
 def get_plant_scans(
     plant_id: int,
@@ -60,6 +109,130 @@ def get_plant_scans(
     scans = crud_scan.get_scans_by_plant(db, plant_id=plant_id, skip=skip, limit=limit)
     return scans
 
+def _persist_scan(
+    db: Session,
+    user_id: int,
+    plant_id: Optional[int],
+    image_url: str,
+    prediction_result: dict,
+    location_lat: Optional[float],
+    location_lng: Optional[float],
+    record_side_effects: bool = True
+):
+    """Enregistre le scan, ses maladies détectées et les activités associées"""
+    recommendations_pending = prediction_result["recommendations"] is None
+    scan_data = {
+        "plant_id": plant_id,
+        "image_url": image_url,
+        "result_type": prediction_result["result_type"],
+        "confidence_score": prediction_result["confidence"],
+        "recommendations": prediction_result["recommendations"],
+        "recommendations_status": "pending" if recommendations_pending else "ready",
+        "location_lat": location_lat,
+        "location_lng": location_lng,
+        "detected_diseases": prediction_result["top_predictions"],
+    }
+    # Créer le scan
+    scan =  create_scan(db, scan_data, user_id)
+    if recommendations_pending:
+        recommendation_worker.notify()
+    if record_side_effects:
+        _record_scan_side_effects(db, user_id, plant_id, scan.id, prediction_result)
+    return scan
+
+def _record_scan_side_effects(
+    db: Session,
+    user_id: int,
+    plant_id: Optional[int],
+    scan_id: int,
+    prediction_result: dict
+):
+    """Activités du scan et enregistrements scan_diseases (hors du chemin critique si différés)"""
+    # AUTO-GÉNÉRATION D'ACTIVITÉ POUR LE SCAN
+    try:
+        scan_activity = create_scan_activity(
+            db=db, 
+            user_id=user_id, 
+            scan_id=scan_id, 
+            plant_id=plant_id
+        )
+    except Exception as e:
+        print(f"⚠️ Erreur lors de la création de l'activité de scan: {str(e)}")
+
+    # Si une maladie est détectée, créer les enregistrements scan_diseases
+    if prediction_result["result_type"] == "diseased":
+        # Chercher la maladie dans la base de données
+        disease = db.query(Disease).filter(
+            Disease.name.ilike(f"%{prediction_result['predicted_class']}%")
+        ).first()
+
+        if disease:
+            print("the diseased is in the database")
+            scan_disease_data = {                    
+                "disease_id": disease.id,
+                "confidence_score": prediction_result["confidence"],
+                "affected_area_percentage": None
+            }                
+            create_scan_disease(db, scan_disease_data,scan_id)
+          # AUTO-GÉNÉRATION D'ACTIVITÉ POUR LA DÉTECTION DE MALADIE
+            try:
+                disease_activity = create_disease_activity(
+                    db=db,
+                    user_id=user_id,
+                    plant_id=plant_id,
+                    disease_name=disease.name,
+                    confidence=prediction_result["confidence"]
+                )
+                print(f"✅ Activité de maladie créée: {disease_activity.id}")
+            except Exception as e:
+                print(f"⚠️ Erreur lors de la création de l'activité de maladie: {str(e)}")
+        else:                
+            # Créer une activité générique pour maladie inconnue
+            try:
+                unknown_disease_activity = create_disease_activity(
+                    db=db,
+                    user_id=user_id,
+                    plant_id=plant_id,
+                    disease_name=prediction_result.get('predicted_class', 'Unknown Disease'),
+                    confidence=prediction_result["confidence"]
+                )
+                print(f"✅ Activité de maladie inconnue créée: {unknown_disease_activity.id}")
+            except Exception as e:
+                print(f"⚠️ Erreur lors de la création de l'activité de maladie inconnue: {str(e)}")   
+
+def _run_in_session(func, *args):
+    """Exécute une écriture différée dans sa propre session (celle de la requête est fermée)"""
+    db = SessionLocal()
+    try:
+        func(db, *args)
+    except Exception as e:
+        print(f"⚠️ Erreur lors d'une écriture différée: {str(e)}")
+    finally:
+        db.close()
+
+def _set_scan_image_url(db: Session, scan_id: int, image_url: str):
+    scan = crud_scan.get_scan(db, scan_id=scan_id)
+    if scan:
+        scan.image_url = image_url
+        db.commit()
+
+# Tâches différées en cours (référence conservée jusqu'à leur fin)
+_background_tasks = set()
+
+def _in_background(coroutine):
+    task = asyncio.create_task(coroutine)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def _complete_deferred_upload(scan_id: int, upload_task: asyncio.Task):
+    """Renseigne l'URL de l'image du scan une fois l'envoi différé terminé"""
+    try:
+        image_url = await upload_task
+    except Exception as e:
+        print(f"⚠️ Erreur lors de l'envoi différé de l'image du scan {scan_id}: {str(e)}")
+        return
+    await run_in_threadpool(_run_in_session, _set_scan_image_url, scan_id, image_url)
+
 @router.post("/", response_model=PlantScan, status_code=status.HTTP_201_CREATED)
 async def upload_scan(
     image: UploadFile = File(...),
@@ -80,90 +253,153 @@ async def upload_scan(
             if plant.user_id != current_user.id:
                 raise HTTPException(status_code=403, detail="Accès non autorisé")
             
+        # Échéance de la requête: chaque étape dispose de son budget (décodage, prétraitement,
+        # inférence, recommandations, envoi de l'image, écritures en base)
+        deadline = Deadline.from_settings()
+        
         image_bytes = await image.read()
         if len(image_bytes) > 10 * 1024 * 1024:
             raise HTTPException(413, "Image trop volumineuse")
         
-        image.file.seek(0)
-        # Créer le dossier de destination
+        # Image décodée une seule fois (EXIF, RGB), partagée par le modèle et le stockage
+        try:
+            decoded = await ml_service.decode_async(image_bytes, deadline)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        
+        # Envoi de l'image en parallèle de l'analyse, depuis une copie en mémoire:
+        # un envoi différé peut se terminer après la fermeture du fichier de la requête
         folder_path = f"users/{current_user.id}/scans"
-
-        image_url = await file_service.upload_image(
-            file=image,
+        image_copy = UploadFile(file=io.BytesIO(image_bytes), filename=image.filename, headers=image.headers)
+        upload_task = asyncio.create_task(file_service.upload_image(
+            file=image_copy,
             bucket_name="scan",
-            folder_path=folder_path
-        )
+            folder_path=folder_path,
+            decoded=decoded
+        ))
     
-        # Prédiction ML
-        prediction_result = ml_service.predict(image_bytes)
-        scan_data = {
-            "plant_id": plant_id,
-            "image_url": image_url,
-            "result_type": prediction_result["result_type"],
-            "confidence_score": prediction_result["confidence"],
-            "recommendations": prediction_result["recommendations"],
-            "location_lat": location_lat,
-            "location_lng": location_lng,
-            "detected_diseases": prediction_result["top_predictions"],
-        }
-        # Créer le scan
-        scan =  create_scan(db, scan_data, current_user.id)
-
-        # AUTO-GÉNÉRATION D'ACTIVITÉ POUR LE SCAN
+        # Prédiction ML; les recommandations d'une maladie (LLM) peuvent être complétées en arrière-plan
         try:
-            scan_activity = create_scan_activity(
-                db=db, 
-                user_id=current_user.id, 
-                scan_id=scan.id, 
-                plant_id=plant_id
+            prediction_result = await ml_service.predict_async(
+                image_bytes,
+                user_id=current_user.id,
+                include_recommendations=not settings.ml_async_recommendations,
+                deadline=deadline,
+                decoded=decoded
             )
-        except Exception as e:
-            print(f"⚠️ Erreur lors de la création de l'activité de scan: {str(e)}")
-
-        # Si une maladie est détectée, créer les enregistrements scan_diseases
-        if prediction_result["result_type"] == "diseased":
-            # Chercher la maladie dans la base de données
-            disease = db.query(Disease).filter(
-                Disease.name.ilike(f"%{prediction_result['predicted_class']}%")
-            ).first()
-            
-            if disease:
-                print("the diseased is in the database")
-                scan_disease_data = {                    
-                    "disease_id": disease.id,
-                    "confidence_score": prediction_result["confidence"],
-                    "affected_area_percentage": None
-                }                
-                create_scan_disease(db, scan_disease_data,scan.id)
-              # AUTO-GÉNÉRATION D'ACTIVITÉ POUR LA DÉTECTION DE MALADIE
-                try:
-                    disease_activity = create_disease_activity(
-                        db=db,
-                        user_id=current_user.id,
-                        plant_id=plant_id,
-                        disease_name=disease.name,
-                        confidence=prediction_result["confidence"]
-                    )
-                    print(f"✅ Activité de maladie créée: {disease_activity.id}")
-                except Exception as e:
-                    print(f"⚠️ Erreur lors de la création de l'activité de maladie: {str(e)}")
-            else:                
-                # Créer une activité générique pour maladie inconnue
-                try:
-                    unknown_disease_activity = create_disease_activity(
-                        db=db,
-                        user_id=current_user.id,
-                        plant_id=plant_id,
-                        disease_name=prediction_result.get('predicted_class', 'Unknown Disease'),
-                        confidence=prediction_result["confidence"]
-                    )
-                    print(f"✅ Activité de maladie inconnue créée: {unknown_disease_activity.id}")
-                except Exception as e:
-                    print(f"⚠️ Erreur lors de la création de l'activité de maladie inconnue: {str(e)}")   
+        except Exception:
+            upload_task.cancel()
+            raise
+        
+        image_url = ""
+        upload_deferred = False
+        if deadline is None:
+            image_url = await upload_task
+        else:
+            started = time.perf_counter()
+            try:
+                image_url = await asyncio.wait_for(asyncio.shield(upload_task), timeout=deadline.budget("upload"))
+            except asyncio.TimeoutError:
+                deadline.degrade("upload", "stockage trop lent, URL de l'image renseignée après la réponse")
+                upload_deferred = True
+            deadline.record("upload", time.perf_counter() - started)
+        
+        # Peu de temps restant: seul le scan est écrit, les activités et scan_diseases suivent
+        defer_side_effects = deadline is not None and deadline.remaining() < deadline.budgets["db"]
+        started = time.perf_counter()
+        scan = _persist_scan(
+            db, current_user.id, plant_id, image_url, prediction_result, location_lat, location_lng,
+            record_side_effects=not defer_side_effects
+        )
+        if upload_deferred:
+            _in_background(_complete_deferred_upload(scan.id, upload_task))
+        if defer_side_effects:
+            deadline.degrade("db", "activités et maladies du scan enregistrées après la réponse")
+            _in_background(run_in_threadpool(
+                _run_in_session, _record_scan_side_effects, current_user.id, plant_id, scan.id, prediction_result
+            ))
+        if deadline is not None:
+            deadline.record("db", time.perf_counter() - started)
+            scan.degraded_stages = deadline.degraded_stages
         return scan
+    except HTTPException:
+        raise
+    except DeadlineExceeded as e:
+        raise HTTPException(504, f"Analyse trop longue: {str(e)}")
     except Exception as e:
         raise HTTPException(500, f"Erreur lors de l'analyse et du stockage: {str(e)}")
 
+@router.post("/stream")
+async def upload_scan_stream(
+    image: UploadFile = File(...),
+    plant_id: Optional[int] = Form(None),
+    location_lat: Optional[float] = Form(None),
+    location_lng: Optional[float] = Form(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Créer un scan en flux (Server-Sent Events): `classification` dès la fin de
+    l'inférence, les recommandations par morceaux (`recommendation`, puis
+    `recommendations`), enfin `scan` avec l'identifiant du scan enregistré et `done`.
+    L'envoi de l'image vers le stockage se fait en parallèle de l'analyse.
+    """
+    if plant_id:
+        from app.crud import plant as crud_plant
+        plant = crud_plant.get_plant(db, plant_id=plant_id)
+        if not plant:
+            raise HTTPException(status_code=404, detail="Plante non trouvée")
+        if plant.user_id != current_user.id:
+            raise HTTPException(status_code=403, detail="Accès non autorisé")
+    
+    image_bytes = await image.read()
+    if len(image_bytes) > 10 * 1024 * 1024:
+        raise HTTPException(413, "Image trop volumineuse")
+    
+    # Copie en mémoire: le fichier de la requête peut être fermé pendant la réponse en flux
+    user_id = current_user.id
+    image_copy = UploadFile(file=io.BytesIO(image_bytes), filename=image.filename, headers=image.headers)
+    upload_task = asyncio.create_task(file_service.upload_image(
+        file=image_copy,
+        bucket_name="scan",
+        folder_path=f"users/{user_id}/scans"
+    ))
+    
+    def persist(prediction_result: dict, image_url: str) -> int:
+        # Session propre au flux: celle de la requête peut être fermée pendant la réponse
+        stream_db = SessionLocal()
+        try:
+            return _persist_scan(
+                stream_db, user_id, plant_id, image_url, prediction_result, location_lat, location_lng
+            ).id
+        finally:
+            stream_db.close()
+    
+    async def events():
+        try:
+            prediction_result = {}
+            async for event, data in ml_service.predict_stream(image_bytes, user_id=user_id):
+                if event == "classification":
+                    prediction_result.update(data)
+                elif event == "recommendations":
+                    prediction_result["recommendations"] = data["recommendations"]
+                yield format_sse(event, data)
+            
+            image_url = await upload_task
+            scan_id = await run_in_threadpool(persist, prediction_result, image_url)
+            yield format_sse("scan", {"scan_id": scan_id})
+            yield format_sse("done", {})
+        except Exception as e:
+            if not upload_task.done():
+                upload_task.cancel()
+            yield format_sse("error", {"detail": f"Erreur lors de l'analyse et du stockage: {str(e)}"})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.put("/{scan_id}", response_model=PlantScan)
 def update_scan(
     scan_id: int,
@@ -26,6 +26,8 @@ class PredictionResponse(BaseModel):
     scan_date: datetime = Field(..., description="Date et heure du scan")
     model_version: str = Field(..., description="Version du modèle utilisé")
     processing_time: Optional[float] = Field(None, description="Temps de traitement en secondes")
+    degraded_stages: List[str] = Field(default_factory=list, description="Étapes dégradées pour tenir l'échéance")
+    stage_timings_ms: Optional[Dict[str, float]] = Field(None, description="Durée de chaque étape en millisecondes")
 
 class PredictionError(BaseModel):
     """Schéma d'erreur pour les prédictions"""
@@ -33,6 +35,21 @@ class PredictionError(BaseModel):
     error_message: str = Field(..., description="Message d'erreur")
     details: Optional[Dict[str, Any]] = Field(None, description="Détails supplémentaires")
 
+class BatchPredictionItem(BaseModel):
+    """Schéma pour le résultat d'une image dans une prédiction groupée"""
+    filename: Optional[str] = Field(None, description="Nom du fichier d'origine")
+    success: bool = Field(..., description="Prédiction réussie ou non")
+    prediction: Optional[PredictionResponse] = Field(None, description="Résultat de la prédiction")
+    error: Optional[PredictionError] = Field(None, description="Erreur propre à cette image")
+
+class BatchPredictionResponse(BaseModel):
+    """Schéma de réponse pour la prédiction groupée"""
+    results: List[BatchPredictionItem] = Field(..., description="Résultats dans l'ordre des fichiers reçus")
+    total: int = Field(..., description="Nombre d'images reçues")
+    succeeded: int = Field(..., description="Nombre de prédictions réussies")
+    failed: int = Field(..., description="Nombre d'images en erreur")
+    processing_time: Optional[float] = Field(None, description="Temps de traitement total en secondes")
+
 class ModelStatus(BaseModel):
     """Schéma pour le statut du modèle"""
     model_loaded: bool = Field(..., description="Modèle chargé ou non")
@@ -41,6 +58,12 @@ class ModelStatus(BaseModel):
     status: str = Field(..., description="Statut général")
     model_info: Optional[Dict[str, Any]] = Field(None, description="Informations détaillées")
 
+class ModelRoutingUpdate(BaseModel):
+    """Schéma de mise à jour du routage entre versions du modèle"""
+    candidate: Optional[str] = Field(None, description="Version candidate (null pour désactiver)")
+    traffic_percent: float = Field(0.0, ge=0, le=100, description="Part du trafic servie par la candidate (%)")
+    shadow: bool = Field(False, description="Évaluer la candidate en shadow sur le trafic de la principale")
+
 class ClassInfo(BaseModel):
     """Schéma pour les informations sur une classe"""
     class_name: str = Field(..., description="Nom de la classe")
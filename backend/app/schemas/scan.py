@@ -25,6 +25,7 @@ class PlantScanBase(BaseModel):
     confidence_score: Optional[Decimal] = None
     detected_diseases: Optional[List[Dict[str, Any]]] = None
     recommendations: Optional[str] = None
+    recommendations_status: Optional[str] = None  # 'pending', 'processing', 'ready', 'failed'
     location_lat: Optional[Decimal] = None
     location_lng: Optional[Decimal] = None
 
@@ -38,6 +39,11 @@ class PlantScanUpdate(BaseModel):
     detected_diseases: Optional[List[Dict[str, Any]]] = None
     recommendations: Optional[str] = None
 
+class ScanRecommendations(BaseModel):
+    scan_id: int
+    status: str
+    recommendations: Optional[str] = None
+
 class DetectedDisease(BaseModel):
     rank: int
     class_name: str
@@ -49,6 +55,7 @@ class PlantScan(PlantScanBase):
     user_id: int
     scan_date: datetime
     detected_diseases: Optional[List[DetectedDisease]] = None
+    degraded_stages: Optional[List[str]] = None  # étapes dégradées pour tenir l'échéance de la requête
     
     class Config:
         from_attributes = True
@@ -1,11 +1,13 @@
 import os
 from typing import Optional
 from fastapi import UploadFile, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from PIL import Image, ImageOps
 import io
-from supabase import create_client, Client
+import threading
 import logging
 from app.core.config import settings
+from app.ml.image_preprocessor import DecodedImage
 
 logger = logging.getLogger(__name__)
 
@@ -13,27 +15,45 @@ class FileService:
     def __init__(self):
         self.supabase_url: str = settings.supabase_url
         self.supabase_key: str = settings.supabase_key
-        self.supabase_client: Optional[Client] = None
-        self._initialize_supabase_client()
+        # Client créé au premier usage: l'import de supabase ne ralentit pas le démarrage
+        self._supabase_client = None
+        self._client_initialized = False
+        self._client_lock = threading.Lock()
+
+    @property
+    def supabase_client(self):
+        """Client Supabase, initialisé au premier accès"""
+        if not self._client_initialized:
+            with self._client_lock:
+                if not self._client_initialized:
+                    self._supabase_client = self._initialize_supabase_client()
+                    self._client_initialized = True
+        return self._supabase_client
 
     def _initialize_supabase_client(self):
         """Initialise le client Supabase."""
         if not self.supabase_url or not self.supabase_key:
             logger.error("SUPABASE_URL ou SUPABASE_KEY non définies. Le service de fichiers ne fonctionnera pas.")
-            return
+            return None
         try:
-            self.supabase_client = create_client(self.supabase_url, self.supabase_key)
+            from supabase import create_client
+
+            client = create_client(self.supabase_url, self.supabase_key)
             logger.info("✅ Client Supabase initialisé.")
+            return client
         except Exception as e:
             logger.error(f"❌ Erreur lors de l'initialisation du client Supabase: {e}")
-            self.supabase_client = None
+            return None
 
-    async def upload_image(self, file: UploadFile, bucket_name: str, folder_path: str = "") -> str:
+    async def upload_image(self, file: UploadFile, bucket_name: str, folder_path: str = "",
+                           decoded: Optional[DecodedImage] = None) -> str:
         """
         Upload une image vers Supabase Storage après optimisation.
+        Avec `decoded` (image déjà décodée par la requête), le fichier n'est ni relu ni décodé à nouveau.
         Retourne l'URL publique de l'image.
         """
-        if not self.supabase_client:
+        # Le premier accès importe supabase et crée le client: hors de la boucle d'événements
+        if not await run_in_threadpool(lambda: self.supabase_client):
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Supabase client not initialized. Check backend configuration."
@@ -46,46 +66,31 @@ class FileService:
             )
 
         try:
-            contents = await file.read()
-            image = Image.open(io.BytesIO(contents))
+            if decoded is None:
+                contents = await file.read()
+                image = Image.open(io.BytesIO(contents))
+                source_format = image.format
 
-            # Correction de l'orientation EXIF
-            image = ImageOps.exif_transpose(image)
+                # Correction de l'orientation EXIF
+                image = ImageOps.exif_transpose(image)
 
-            # Convertir en RGB si nécessaire
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
+                # Convertir en RGB si nécessaire
+                if image.mode != 'RGB':
+                    image = image.convert('RGB')
+                decoded = DecodedImage(image, source_format)
 
-            # Optimisation
-            output_buffer = io.BytesIO()
-            image.save(output_buffer, format="WEBP", quality=80)
-            output_buffer.seek(0)
+            # Optimisation (encodage hors de la boucle d'événements)
+            contents = await run_in_threadpool(decoded.encoded, "WEBP", 80)
 
             # Définir le chemin de stockage
             file_extension = "webp"
             file_name = f"{os.urandom(16).hex()}.{file_extension}"
             storage_path = os.path.join(folder_path, file_name).replace("\\", "/")
 
-            # Upload vers Supabase Storage
-            res = self.supabase_client.storage.from_(bucket_name).upload(
-                path=storage_path,
-                file=output_buffer.getvalue(),
-                file_options={"content-type": f"image/{file_extension}"}
+            # Upload et URL publique: appels réseau bloquants, exécutés hors de la boucle d'événements
+            public_url = await run_in_threadpool(
+                self._store, bucket_name, storage_path, contents, file_extension
             )
-
-            if not res or not getattr(res, "path", None):
-                logger.error("❌ Échec de l'upload de l'image vers Supabase.")
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="Upload failed: no path returned."
-                )
-
-            # Récupérer l'URL publique
-            public_url = self.supabase_client.storage.from_(bucket_name).get_public_url(storage_path)
-
-            if not public_url or not isinstance(public_url, str):
-                logger.error("❌ Impossible d'obtenir l'URL publique.")
-                raise HTTPException(status_code=500, detail="Failed to get public URL.")
             logger.info(f"✅ Image uploadée: {public_url}")
             return public_url
 
@@ -96,6 +101,29 @@ class FileService:
                 detail=f"Failed to process and upload image: {str(e)}"
             )
 
+    def _store(self, bucket_name: str, storage_path: str, contents: bytes, file_extension: str) -> str:
+        """Upload vers Supabase Storage et retourne l'URL publique (appel bloquant)"""
+        res = self.supabase_client.storage.from_(bucket_name).upload(
+            path=storage_path,
+            file=contents,
+            file_options={"content-type": f"image/{file_extension}"}
+        )
+
+        if not res or not getattr(res, "path", None):
+            logger.error("❌ Échec de l'upload de l'image vers Supabase.")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Upload failed: no path returned."
+            )
+
+        # Récupérer l'URL publique
+        public_url = self.supabase_client.storage.from_(bucket_name).get_public_url(storage_path)
+
+        if not public_url or not isinstance(public_url, str):
+            logger.error("❌ Impossible d'obtenir l'URL publique.")
+            raise HTTPException(status_code=500, detail="Failed to get public URL.")
+        return public_url
+
     async def delete_image(self, bucket_name: str, file_path: str) -> bool:
         """
         Supprime un fichier de Supabase Storage.
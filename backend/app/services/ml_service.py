@@ -1,67 +1,770 @@
-from typing import Dict
+import asyncio
+import threading
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
 import logging
 
-from app.ml.model_loader import model_loader
-from app.ml.prediction_service import prediction_service
+import anyio.to_thread
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.ml.image_preprocessor import DecodedImage, image_preprocessor
+from app.ml.shared_tensor_ring import SharedTensorRing
+from app.ml.inference_workers import InferenceWorkerPool
+from app.ml.model_loader import ModelHandle, compute_model_version, model_loader
+from app.ml.llm_gateway import CircuitOpenError, LLMTimeoutError
+from app.ml.prediction_service import STATIC_RECOMMENDATIONS, prediction_service
+from app.utils.deadline import Deadline, DeadlineExceeded
 
 logger = logging.getLogger(__name__)
 
+class MLExecutors:
+    """
+    Pools de threads dédiés du pipeline ML.
+    - image: décodage PIL, redimensionnement et normalisation (CPU)
+    - inference: passes avant du modèle
+    - io: appels sortants bloquants (Gemini)
+    - shadow: inférences de la version candidate hors du chemin des requêtes
+    Les routes async attendent ces pools au lieu de bloquer la boucle d'événements.
+    """
+    
+    def __init__(self, image_workers: int, inference_workers: int, io_workers: int, shadow_workers: int = 1):
+        self.sizes = {
+            "image": image_workers,
+            "inference": inference_workers,
+            "io": io_workers,
+            "shadow": shadow_workers,
+        }
+        self._pools: Dict[str, ThreadPoolExecutor] = {}
+        # Tâches soumises via submit/run/iterate et non terminées, par pool
+        self._pending: Dict[str, int] = {name: 0 for name in self.sizes}
+        self._pending_lock = threading.Lock()
+    
+    def _get_pool(self, name: str) -> ThreadPoolExecutor:
+        pool = self._pools.get(name)
+        if pool is None:
+            pool = ThreadPoolExecutor(max_workers=self.sizes[name], thread_name_prefix=f"ml-{name}")
+            self._pools[name] = pool
+        return pool
+    
+    @property
+    def image(self) -> Executor:
+        return self._get_pool("image")
+    
+    @property
+    def inference(self) -> Executor:
+        return self._get_pool("inference")
+    
+    @property
+    def io(self) -> Executor:
+        return self._get_pool("io")
+    
+    @property
+    def shadow(self) -> Executor:
+        return self._get_pool("shadow")
+    
+    def queued(self, name: str) -> int:
+        """Nombre de tâches soumises et non terminées sur un pool (en attente ou en cours)"""
+        with self._pending_lock:
+            return self._pending.get(name, 0)
+    
+    def _task_done(self, name: str):
+        with self._pending_lock:
+            self._pending[name] -= 1
+    
+    def submit(self, pool_name: str, func: Callable, *args, **kwargs) -> Future:
+        """Soumet une fonction bloquante à un pool et retourne son Future"""
+        pool = self._get_pool(pool_name)
+        with self._pending_lock:
+            self._pending[pool_name] += 1
+        try:
+            future = pool.submit(func, *args, **kwargs)
+        except Exception:
+            self._task_done(pool_name)
+            raise
+        future.add_done_callback(lambda _: self._task_done(pool_name))
+        return future
+    
+    async def run(self, pool_name: str, func: Callable, *args, **kwargs):
+        """Exécute une fonction bloquante sur un pool et attend son résultat"""
+        return await asyncio.wrap_future(self.submit(pool_name, func, *args, **kwargs))
+    
+    async def iterate(self, pool_name: str, func: Callable, *args) -> AsyncIterator:
+        """Consomme un générateur bloquant sur un pool; ses éléments sont transmis à la boucle au fil de l'eau"""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        finished = object()
+        
+        def produce():
+            try:
+                for item in func(*args):
+                    loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, (finished, e))
+                return
+            loop.call_soon_threadsafe(queue.put_nowait, (finished, None))
+        
+        self.submit(pool_name, produce)
+        while True:
+            item, error = await queue.get()
+            if item is finished:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    
+    def shutdown(self, wait: bool = True):
+        """Arrête tous les pools"""
+        for pool in self._pools.values():
+            pool.shutdown(wait=wait)
+        self._pools.clear()
+    
+    def get_stats(self) -> Dict:
+        """Retourne la taille et la charge des pools"""
+        return {
+            name: {
+                "max_workers": size,
+                "started": name in self._pools,
+                "queued_tasks": self.queued(name),
+            }
+            for name, size in self.sizes.items()
+        }
+
+async def _await_within(future: Future, deadline: Optional[Deadline], stage: str,
+                        on_late: Optional[Callable[[Future], None]] = None):
+    """
+    Attend le résultat d'une étape dans son budget (sans limite si `deadline` est None).
+    Au-delà, lève DeadlineExceeded; le travail se poursuit et `on_late(future)` est
+    appelé à sa fin pour libérer ses ressources.
+    """
+    if deadline is None:
+        return await asyncio.wrap_future(future)
+    
+    budget = deadline.budget(stage)
+    started = time.perf_counter()
+    waiter = asyncio.wrap_future(future)
+    try:
+        return await asyncio.wait_for(asyncio.shield(waiter), timeout=budget)
+    except asyncio.TimeoutError:
+        # Le résultat tardif n'est plus attendu: son éventuelle exception est consommée
+        waiter.add_done_callback(lambda done: done.cancelled() or done.exception())
+        if on_late is not None:
+            future.add_done_callback(on_late)
+        raise DeadlineExceeded(stage, budget)
+    finally:
+        deadline.record(stage, time.perf_counter() - started)
+
+def _release_late_input(future: Future):
+    """Libère l'entrée d'un prétraitement terminé après l'échéance de sa requête"""
+    if future.cancelled() or future.exception() is not None:
+        return
+    output = future.result()
+    prediction_service.release_input(output[0] if isinstance(output, tuple) else output)
+
+def _with_deadline_report(result: Dict, deadline: Optional[Deadline]) -> Dict:
+    """Ajoute au résultat les étapes dégradées et la durée de chaque étape"""
+    if deadline is not None:
+        result.update(deadline.report())
+    return result
+
+def configure_api_threadpool(limit: int):
+    """
+    Plafonne le threadpool anyio utilisé par les routes synchrones (def).
+    Doit être appelé depuis la boucle d'événements (lifespan).
+    """
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = limit
+    logger.info(f"Threadpool anyio limité à {limit} threads")
+
 class MLService:
     """Service principal ML qui orchestre tous les composants"""
     
     def __init__(self):
         self.initialized = False
+        # Initialisation en arrière-plan: pending | loading | ready | failed
+        self.initialization_state = "pending"
+        self.initialization_error: Optional[str] = None
+        self.initialization_seconds: Optional[float] = None
+        self._init_thread: Optional[threading.Thread] = None
+        self._reload_lock = threading.Lock()
+        self.last_reload: Optional[Dict] = None
+        self.shadow_dropped = 0
+        self.worker_pool: Optional[InferenceWorkerPool] = None
+        self.tensor_ring: Optional[SharedTensorRing] = None
+        self.use_worker_processes = settings.ml_worker_processes > 0
+        
+        # En mode multi-processus, chaque thread d'inférence attend un processus
+        inference_workers = settings.ml_inference_workers
+        if self.use_worker_processes:
+            inference_workers = max(inference_workers, settings.ml_worker_processes)
+        
+        self.executors = MLExecutors(
+            image_workers=settings.ml_image_workers,
+            inference_workers=inference_workers,
+            io_workers=settings.ml_io_workers,
+        )
+        prediction_service.attach_inference_executor(
+            self.executors.inference, inference_workers
+        )
+    
+    def _build_worker_pool_handle(self, model_path: str, class_names_path: str) -> ModelHandle:
+        """
+        Démarre un nouveau pool de processus d'inférence et l'enveloppe dans un handle;
+        le processus API n'importe pas TensorFlow
+        """
+        class_names = model_loader.read_class_names(class_names_path)
+        
+        # Anneau de mémoire partagée: seuls les indices d'emplacements traversent les files
+        if settings.ml_shared_memory_transport and self.tensor_ring is None:
+            self.tensor_ring = SharedTensorRing(
+                slot_count=settings.ml_shared_memory_slots,
+                image_shape=(*image_preprocessor.target_size, 3),
+                dtype=image_preprocessor.input_dtype,
+            )
+            prediction_service.tensor_ring = self.tensor_ring
+        
+        worker_pool = InferenceWorkerPool(
+            num_workers=settings.ml_worker_processes,
+            model_path=model_path,
+            engine_name=model_loader.engine_name,
+            warmup_batch_sizes=settings.ml_warmup_batch_sizes,
+            tensor_ring_spec=self.tensor_ring.spec() if self.tensor_ring is not None else None,
+            routing=settings.ml_worker_routing,
+            health_check_interval=settings.ml_worker_health_interval,
+            health_check_timeout=settings.ml_worker_health_timeout,
+            max_restarts=settings.ml_worker_max_restarts,
+            restart_backoff_seconds=settings.ml_worker_restart_backoff_seconds,
+            restart_backoff_max_seconds=settings.ml_worker_restart_backoff_max_seconds,
+        )
+        if not worker_pool.start(wait_timeout=settings.ml_worker_start_timeout):
+            worker_pool.stop()
+            raise RuntimeError("Aucun processus d'inférence n'est prêt (modèle introuvable ou invalide)")
+        
+        model_info = worker_pool.get_stats()["model_info"]
+        return ModelHandle(
+            version=compute_model_version(model_path, class_names_path),
+            class_names=class_names,
+            backend=worker_pool,
+            close_fn=worker_pool.stop,
+            info={**model_info, "worker_processes": worker_pool.num_workers},
+            warmup_timings=model_info.get("warmup"),
+            model_path=model_path,
+            class_names_path=class_names_path,
+        )
+    
+    def _build_handle(self, model_path: Optional[str] = None, class_names_path: Optional[str] = None) -> ModelHandle:
+        """Charge et préchauffe un nouveau modèle à côté des modèles actifs (par défaut app/ml/)"""
+        if model_path is None:
+            model_loader.configure_paths()
+            model_path, class_names_path = model_loader.model_path, model_loader.class_names_path
+        if self.use_worker_processes:
+            return self._build_worker_pool_handle(model_path, class_names_path)
+        return model_loader.build_handle(settings.ml_warmup_batch_sizes, model_path, class_names_path)
+    
+    def _sync_primary_backend(self):
+        """En mode multi-processus, expose le pool de la version principale"""
+        if self.use_worker_processes:
+            handle = model_loader.handle
+            self.worker_pool = handle.backend if handle is not None else None
+            prediction_service.worker_pool = self.worker_pool
+    
+    def _invalidate_cached_predictions(self, model_version: Optional[str]):
+        """Invalide les prédictions en cache d'une version qui n'est plus servie"""
+        cache = prediction_service.prediction_cache
+        if cache is None or model_version is None:
+            return
+        if any(handle.version == model_version for handle in list(model_loader.handles.values())):
+            return
+        cache.invalidate(model_version)
+    
+    def _activate(self, handle: ModelHandle) -> Optional[ModelHandle]:
+        """Échange atomiquement le modèle principal; l'ancien est libéré après ses requêtes en cours"""
+        previous = model_loader.swap(handle)
+        self._sync_primary_backend()
+        if previous is not None:
+            self._invalidate_cached_predictions(previous.version)
+        return previous
+    
+    def _initialize_candidate(self):
+        """Charge la version candidate configurée; un échec n'empêche pas le service de démarrer"""
+        try:
+            self.load_version(settings.ml_candidate_model)
+            model_loader.configure_routing(
+                settings.ml_candidate_model,
+                traffic_percent=settings.ml_candidate_traffic_percent,
+                shadow=settings.ml_shadow_mode,
+            )
+        except Exception as e:
+            logger.error(f"❌ Version candidate {settings.ml_candidate_model} non chargée: {str(e)}")
     
     def initialize(self) -> bool:
         """Initialise tous les composants ML"""
+        start_time = time.perf_counter()
+        self.initialization_state = "loading"
+        self.initialization_error = None
         try:
             logger.info("🚀 Initialisation du service ML...")
             
-            # Initialiser le chargeur de modèle
-            success = model_loader.initialize()
+            self._activate(self._build_handle())
+            if settings.ml_candidate_model:
+                self._initialize_candidate()
+            prediction_service.load_recommendation_catalogue()
+            prediction_service.preload_recommendations()
+            prediction_service.preallocate_buffers()
             
-            if success:
-                self.initialized = True
-                logger.info("✅ Service ML initialisé avec succès")
-            else:
-                self.initialized = False
-                logger.error("❌ Échec de l'initialisation du service ML")
-            
-            return self.initialized
+            self.initialized = True
+            self.initialization_state = "ready"
+            logger.info("✅ Service ML initialisé avec succès")
+            return True
             
         except Exception as e:
-            logger.error(f"Erreur lors de l'initialisation du service ML: {str(e)}")
+            logger.error(f"❌ Échec de l'initialisation du service ML: {str(e)}")
             self.initialized = False
+            self.initialization_state = "failed"
+            self.initialization_error = str(e)
             return False
+        finally:
+            self.initialization_seconds = round(time.perf_counter() - start_time, 3)
+    
+    @property
+    def reload_in_progress(self) -> bool:
+        return self._reload_lock.locked()
+    
+    def reload(self) -> Dict:
+        """
+        Recharge le modèle sans interruption: le nouveau modèle est chargé, validé et
+        préchauffé à côté de l'actuel, puis échangé atomiquement. Les requêtes en
+        cours terminent sur l'ancien modèle, libéré dès la dernière d'entre elles.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            raise RuntimeError("Un rechargement du modèle est déjà en cours")
+        try:
+            # La version principale est rechargée depuis ses propres fichiers
+            current = model_loader.handle
+            start_time = time.perf_counter()
+            if current is not None and current.model_path:
+                handle = self._build_handle(current.model_path, current.class_names_path)
+            else:
+                handle = self._build_handle()
+            build_seconds = time.perf_counter() - start_time
+            
+            previous = self._activate(handle)
+            self.initialized = True
+            self.initialization_state = "ready"
+            self.initialization_error = None
+            
+            self.last_reload = {
+                "old_version": previous.version if previous is not None else None,
+                "new_version": handle.version,
+                "old_in_flight_requests": previous.in_flight if previous is not None else 0,
+                "build_seconds": round(build_seconds, 3),
+                "warmup": handle.get_info()["warmup"],
+                "reloaded_at": datetime.now().isoformat(),
+            }
+            logger.info(
+                f"✅ Modèle rechargé: {self.last_reload['old_version']} -> {handle.version} "
+                f"en {build_seconds:.2f}s"
+            )
+            return self.last_reload
+        finally:
+            self._reload_lock.release()
+    
+    def load_version(self, name: str) -> Dict:
+        """Charge (ou recharge) la version nommée depuis app/ml/models/<nom>/ à côté de la principale"""
+        if name == model_loader.primary_name:
+            raise ValueError("Utilisez le rechargement pour la version principale")
+        model_path, class_names_path = model_loader.paths_for(name)
+        
+        start_time = time.perf_counter()
+        handle = self._build_handle(model_path, class_names_path)
+        previous = model_loader.register(name, handle)
+        if previous is not None:
+            self._invalidate_cached_predictions(previous.version)
+        return {
+            "name": name,
+            "old_version": previous.version if previous is not None else None,
+            "new_version": handle.version,
+            "build_seconds": round(time.perf_counter() - start_time, 3),
+            "warmup": handle.get_info()["warmup"],
+        }
+    
+    def promote_version(self, name: str) -> Dict:
+        """La version nommée devient principale; l'ancienne est libérée après ses requêtes en cours"""
+        result = model_loader.promote(name)
+        self._sync_primary_backend()
+        self._invalidate_cached_predictions(result["old_version"])
+        return result
+    
+    def configure_routing(self, candidate: Optional[str], traffic_percent: float = 0.0, shadow: bool = False):
+        """Définit la version candidate, sa part du trafic et le mode shadow"""
+        model_loader.configure_routing(candidate, traffic_percent, shadow)
+    
+    def unload_version(self, name: str):
+        """Retire une version non principale du registre"""
+        handle = model_loader.unregister(name)
+        self._invalidate_cached_predictions(handle.version)
+    
+    def _submit_shadow(self, candidate: ModelHandle, processed_image, primary_class: str):
+        """Soumet l'inférence shadow de la candidate sans retarder la requête"""
+        if self.executors.queued("shadow") >= settings.ml_shadow_max_queue:
+            # File shadow saturée: l'évaluation est échantillonnée plutôt que de prendre du retard
+            self.shadow_dropped += 1
+            candidate.release()
+            return
+        self.executors.submit("shadow", self._run_shadow, candidate, processed_image, primary_class)
     
-    def predict(self, image_bytes: bytes) -> Dict:
+    def _run_shadow(self, candidate: ModelHandle, processed_image, primary_class: str):
+        """Inférence de la candidate et comparaison top-1 (par nom de classe) avec la principale"""
+        try:
+            start = time.perf_counter()
+            probabilities = candidate.predict(processed_image)[0]
+            seconds = time.perf_counter() - start
+            index = int(probabilities.argmax())
+            candidate_class = candidate.class_names[index] if index < len(candidate.class_names) else None
+            candidate.record_shadow(seconds, candidate_class == primary_class)
+        except Exception as e:
+            logger.error(f"Erreur lors de l'inférence shadow ({candidate.name}): {str(e)}")
+        finally:
+            candidate.release()
+    
+    def start_background_initialization(self) -> Optional[threading.Thread]:
+        """
+        Lance l'initialisation dans un thread dédié afin que l'API accepte les
+        connexions immédiatement; la disponibilité est exposée par /api/ml/ready.
+        """
+        if self._init_thread is not None and self._init_thread.is_alive():
+            return self._init_thread
+        if self.initialized:
+            return None
+        self._init_thread = threading.Thread(target=self.initialize, name="ml-initialization", daemon=True)
+        self._init_thread.start()
+        return self._init_thread
+    
+    def get_readiness(self) -> Dict:
+        """État de disponibilité du modèle pour la sonde de readiness"""
+        readiness = {
+            "ready": self.model_loaded,
+            "state": self.initialization_state,
+            "error": self.initialization_error,
+            "initialization_seconds": self.initialization_seconds,
+        }
+        if self.worker_pool is not None:
+            stats = self.worker_pool.get_stats()
+            readiness["workers"] = {
+                "total": stats["num_workers"],
+                "ready": stats["ready_workers"],
+                "failed": stats["failed_workers"],
+            }
+            if stats["failed_workers"] == stats["num_workers"]:
+                readiness["error"] = "Tous les processus d'inférence sont en échec: " + "; ".join(
+                    sorted({worker["last_error"] for worker in stats["workers"] if worker["last_error"]})
+                )
+        return readiness
+    
+    def predict(self, image_bytes: bytes, user_id: Optional[int] = None) -> Dict:
         """Effectue une prédiction sur une image"""
         if not self.initialized:
             raise RuntimeError("Le service ML n'est pas initialisé")
         
-        return prediction_service.predict(image_bytes)
+        return prediction_service.predict(image_bytes, user_id)
+    
+    def predict_batch(self, images: List[bytes]) -> List[Dict]:
+        """Effectue une prédiction groupée sur plusieurs images"""
+        if not self.initialized:
+            raise RuntimeError("Le service ML n'est pas initialisé")
+        
+        return prediction_service.predict_batch(images, self.executors)
+    
+    async def decode_async(self, image_bytes: bytes, deadline: Optional[Deadline] = None) -> DecodedImage:
+        """
+        Décode l'image de la requête sur le pool image, dans le budget de l'étape `decode`.
+        Lève ValueError si l'image est illisible, DeadlineExceeded au-delà du budget.
+        """
+        return await _await_within(
+            self.executors.submit("image", image_preprocessor.decode, image_bytes), deadline, "decode"
+        )
+    
+    async def predict_async(self, image_bytes: bytes, user_id: Optional[int] = None,
+                            include_recommendations: bool = True, deadline: Optional[Deadline] = None,
+                            decoded: Optional[DecodedImage] = None) -> Dict:
+        """
+        Pipeline de prédiction non bloquant: chaque étape est attendue sur son
+        pool dédié (image, inférence, E/S) plutôt qu'exécutée sur la boucle.
+        Avec `user_id`, un quasi-doublon d'un scan récent de l'utilisateur réutilise sa prédiction.
+        Sans `include_recommendations`, les recommandations d'une maladie (appel LLM) ne sont
+        pas générées: `recommendations` vaut None et reste à compléter en arrière-plan.
+        Avec `deadline`, chaque étape dispose de son budget: le prétraitement et l'inférence
+        échouent (DeadlineExceeded) au-delà, les recommandations se limitent aux mesures de base.
+        `decoded` (même image, déjà décodée par la requête) évite un second décodage.
+        """
+        if not self.initialized:
+            raise RuntimeError("Le service ML n'est pas initialisé")
+        
+        try:
+            start_time = datetime.now()
+            
+            # La requête termine sur la version choisie à son arrivée, même si un rechargement survient;
+            # une part du trafic peut être servie par la candidate, ou la candidate évaluée en shadow
+            handle, shadow = model_loader.acquire_for_request()
+            
+            # Image déjà analysée par cette version du modèle: aucun calcul
+            # (empreinte de l'image et lecture du cache disque sur le pool E/S)
+            cache_key, cached = None, None
+            if prediction_service.prediction_cache is not None:
+                try:
+                    cache_key, cached = await self.executors.run(
+                        "io", prediction_service.lookup_cached_result, image_bytes, handle.version, start_time
+                    )
+                except Exception:
+                    handle.release()
+                    if shadow is not None:
+                        shadow.release()
+                    raise
+            if cached is not None:
+                handle.release()
+                if shadow is not None:
+                    shadow.release()
+                if include_recommendations:
+                    cached = await self._complete_recommendations(cached, deadline)
+                return _with_deadline_report(cached, deadline)
+            
+            shadow_input = None
+            preprocess = (
+                prediction_service.preprocess_input_with_hash
+                if prediction_service.use_near_duplicates(user_id)
+                else prediction_service.preprocess_input
+            )
+            try:
+                output = await _await_within(
+                    self.executors.submit("image", preprocess, decoded if decoded is not None else image_bytes),
+                    deadline, "preprocess",
+                    on_late=_release_late_input
+                )
+            except Exception:
+                handle.release()
+                if shadow is not None:
+                    shadow.release()
+                raise
+            processed_image, image_hash = output if isinstance(output, tuple) else (output, None)
+            
+            # Quasi-doublon d'un scan récent (photos en rafale): l'inférence est évitée
+            duplicate = prediction_service.find_near_duplicate(user_id, image_hash, handle.version, start_time)
+            if duplicate is not None:
+                prediction_service.release_input(processed_image)
+                handle.release()
+                if shadow is not None:
+                    shadow.release()
+                if include_recommendations:
+                    duplicate = await self._complete_recommendations(duplicate, deadline)
+                return _with_deadline_report(duplicate, deadline)
+            
+            def release_inference(_=None):
+                prediction_service.release_input(processed_image)
+                handle.release()
+            
+            try:
+                if shadow is not None:
+                    shadow_input = prediction_service.copy_input(processed_image)
+                probabilities = await _await_within(
+                    prediction_service.submit_inference(processed_image, self.executors.inference, handle),
+                    deadline, "inference",
+                    # Inférence terminée après l'échéance: l'entrée et le modèle sont libérés à sa fin
+                    on_late=release_inference
+                )
+            except DeadlineExceeded:
+                if shadow is not None:
+                    shadow.release()
+                raise
+            except Exception:
+                if shadow is not None:
+                    shadow.release()
+                release_inference()
+                raise
+            release_inference()
+            
+            analysis = prediction_service.analyze_probabilities(probabilities, handle.class_names)
+            if shadow is not None:
+                self._submit_shadow(shadow, shadow_input, analysis["predicted_class"])
+            
+            if not include_recommendations and analysis["result_type"] == "diseased":
+                # Recommandations complétées en arrière-plan: la classification seule est mise en cache,
+                # les recommandations d'une réutilisation sont alors générées par la requête qui la demande
+                recommendations, complete = None, True
+            else:
+                recommendations, complete = await self._recommendations_for(analysis, deadline)
+            
+            result = prediction_service.build_result(analysis, recommendations, start_time, handle.version)
+            if complete:
+                self._cache_in_background(prediction_service.cache_result, cache_key, result)
+                prediction_service.remember_scan(user_id, image_hash, result)
+            return _with_deadline_report(result, deadline)
+        
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            logger.error(f"Erreur dans le pipeline de prédiction: {str(e)}")
+            raise RuntimeError(f"Échec de la prédiction: {str(e)}")
+    
+    def _cache_in_background(self, cache_result: Callable, key, result: Dict):
+        """Mise en cache sur le pool E/S (empreinte et écriture disque hors de la boucle), sans attendre"""
+        if prediction_service.prediction_cache is None or key is None:
+            return
+        # Copie: le résultat renvoyé à l'appelant est encore complété (rapport d'échéance...)
+        self.executors.submit("io", cache_result, key, dict(result))
+    
+    async def _recommendations_for(self, analysis: Dict, deadline: Optional[Deadline]) -> Tuple[str, bool]:
+        """Recommandations d'une classification sur le pool E/S; False si elles sont dégradées (budget dépassé)"""
+        try:
+            recommendations = await _await_within(
+                self.executors.submit(
+                    "io", prediction_service.generate_recommendations,
+                    analysis["predicted_class"], analysis["confidence"],
+                    analysis["result_type"], analysis["top_predictions"]
+                ),
+                deadline, "recommendations"
+            )
+            return recommendations, True
+        except DeadlineExceeded:
+            # La génération continue en arrière-plan et alimente le cache des recommandations
+            deadline.degrade("recommendations", "génération trop lente, mesures de base uniquement")
+            return prediction_service.degraded_recommendations(
+                analysis["predicted_class"], analysis["confidence"]
+            ), False
+    
+    async def _complete_recommendations(self, result: Dict, deadline: Optional[Deadline]) -> Dict:
+        """Résultat réutilisé enregistré sans recommandations: elles sont générées pour cette requête"""
+        if result["recommendations"] is not None:
+            return result
+        recommendations, _ = await self._recommendations_for(result, deadline)
+        return {**result, "recommendations": recommendations}
+    
+    async def predict_stream(self, image_bytes: bytes, user_id: Optional[int] = None) -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        Prédiction en flux, étape par étape:
+        - ("classification", résultat du modèle) dès la fin de l'inférence;
+        - ("recommendation", {"text": morceau}) au fil de la génération des recommandations;
+        - ("recommendations", {"recommendations": texte complet, "status": "ready" | "failed"}).
+        """
+        result = await self.predict_async(image_bytes, user_id, include_recommendations=False)
+        yield "classification", {key: value for key, value in result.items() if key != "recommendations"}
+        
+        if result["recommendations"] is not None:
+            yield "recommendation", {"text": result["recommendations"]}
+            yield "recommendations", {"recommendations": result["recommendations"], "status": "ready"}
+            return
+        
+        chunks = [prediction_service.base_disease_recommendations(result["predicted_class"], result["confidence"])]
+        yield "recommendation", {"text": chunks[0]}
+        recommendations_status = "ready"
+        try:
+            async for chunk in self.executors.iterate(
+                "io", prediction_service.stream_disease_recommendations, result["predicted_class"]
+            ):
+                chunks.append(chunk)
+                yield "recommendation", {"text": chunk}
+        except Exception as e:
+            logger.error(f"Erreur lors de la génération des recommandations ({result['predicted_class']}): {str(e)}")
+            fallback = (
+                STATIC_RECOMMENDATIONS if isinstance(e, (CircuitOpenError, LLMTimeoutError))
+                else "Erreur lors de la récupération des recommandations spécifiques."
+            )
+            chunks.append(fallback)
+            recommendations_status = "failed"
+            yield "recommendation", {"text": fallback}
+        
+        result["recommendations"] = "".join(chunks)
+        if recommendations_status == "ready":
+            self._cache_in_background(prediction_service.cache_image_result, image_bytes, result)
+        yield "recommendations", {"recommendations": result["recommendations"], "status": recommendations_status}
+    
+    async def predict_batch_async(self, images: List[bytes]) -> List[Dict]:
+        """Prédiction groupée dont les étapes sont réparties sur les pools dédiés"""
+        if not self.initialized:
+            raise RuntimeError("Le service ML n'est pas initialisé")
+        
+        # L'orchestration ne fait qu'attendre les pools dédiés: elle ne doit pas
+        # occuper l'un d'eux (risque d'interblocage), d'où le threadpool anyio
+        return await run_in_threadpool(prediction_service.predict_batch, images, self.executors)
+    
+    def shutdown(self):
+        """Arrête le scheduler et les pools d'exécution"""
+        if prediction_service.batch_scheduler is not None:
+            prediction_service.batch_scheduler.stop()
+        model_loader.close()
+        if prediction_service.prediction_cache is not None:
+            prediction_service.prediction_cache.close()
+        prediction_service.llm_gateway.shutdown()
+        if self.tensor_ring is not None:
+            prediction_service.tensor_ring = None
+            self.tensor_ring.close()
+            self.tensor_ring = None
+        self.executors.shutdown(wait=False)
     
     def get_status(self) -> Dict:
         """Retourne le statut complet du service ML"""
         return {
             "service_initialized": self.initialized,
-            "model_loaded": model_loader.model_loaded,
+            "initialization": self.get_readiness(),
+            "last_reload": self.last_reload,
+            "model_loaded": self.model_loaded,
             "model_info": model_loader.get_model_info(),
-            "prediction_service_info": prediction_service.get_service_info()
+            "registry": {**model_loader.get_registry_info(), "shadow_dropped": self.shadow_dropped},
+            "engine": {
+                "name": model_loader.engine_name,
+                "execution": "worker_processes" if self.worker_pool is not None else "in_process",
+                "latency": prediction_service.inference_latency.snapshot(),
+            },
+            "prediction_service_info": prediction_service.get_service_info(),
+            "prediction_cache": (
+                prediction_service.prediction_cache.get_stats()
+                if prediction_service.prediction_cache is not None
+                else {"enabled": False}
+            ),
+            "recommendation_cache": (
+                prediction_service.recommendation_cache.get_stats()
+                if prediction_service.recommendation_cache is not None
+                else {"enabled": False}
+            ),
+            "recommendation_providers": prediction_service.recommendation_providers.get_stats(),
+            "llm_gateway": prediction_service.llm_gateway.get_stats(),
+            "near_duplicates": (
+                prediction_service.near_duplicate_index.get_stats()
+                if prediction_service.near_duplicate_index is not None
+                else {"enabled": False}
+            ),
+            "batch_scheduler": (
+                prediction_service.batch_scheduler.get_stats()
+                if prediction_service.batch_scheduler is not None
+                else {"enabled": False}
+            ),
+            "executors": self.executors.get_stats(),
+            "worker_pool": self.worker_pool.get_stats() if self.worker_pool is not None else {"enabled": False},
+            "shared_memory": self.tensor_ring.get_stats() if self.tensor_ring is not None else {"enabled": False},
+            "buffer_pool": (
+                prediction_service.buffer_pool.get_stats()
+                if prediction_service.buffer_pool is not None
+                else {"enabled": False}
+            ),
         }
     
     @property
     def model_loaded(self) -> bool:
         """Propriété pour vérifier si le modèle est chargé"""
+        if self.worker_pool is not None:
+            return self.initialized and self.worker_pool.ready
         return self.initialized and model_loader.model_loaded
     
+    @property
+    def model_version(self) -> Optional[str]:
+        """Version (empreinte) du modèle actif"""
+        return model_loader.model_version
+    
     @property
     def class_names(self) -> list:
         """Propriété pour accéder aux noms de classes"""
         return model_loader.class_names
 
-# Instance globale du service ML
+# Instance globale du service ML (initialisée en arrière-plan par le lifespan de l'application)
 ml_service = MLService()
-
-# Initialisation automatique au démarrage
-ml_service.initialize()
@@ -0,0 +1,211 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from app.core.config import settings
+from app.ml.prediction_service import prediction_service
+
+logger = logging.getLogger(__name__)
+
+# Scan réservé: (id, tentative, classe prédite, confiance, type de résultat, maladies détectées)
+ClaimedScan = Tuple[int, int, Optional[str], float, str, List[Dict]]
+
+
+class RecommendationWorker:
+    """
+    Complète en arrière-plan les recommandations des scans enregistrés avec le statut
+    `pending`: `upload_scan` répond dès la prédiction du modèle, sans attendre le LLM.
+
+    Chaque cycle se déroule en trois temps, sans transaction ouverte pendant la génération:
+    - réservation: un lot de scans passe au statut `processing` (SKIP LOCKED, validé aussitôt);
+    - génération: une par classe de maladie du lot, session fermée;
+    - écriture: une transaction courte enregistre le texte et le statut `ready` ou `failed`.
+    Un échec est retenté après un délai exponentiel (`retry_backoff_seconds`, doublé à chaque
+    tentative jusqu'à `retry_backoff_max_seconds`), au plus `max_attempts` fois. Un scan dont
+    la réservation dépasse `lease_seconds` (arrêt ou redémarrage en cours de génération) est repris.
+    """
+
+    def __init__(self, batch_size: int = 16, poll_seconds: float = 5.0, max_attempts: int = 5,
+                 retry_backoff_seconds: float = 30.0, retry_backoff_max_seconds: float = 3600.0,
+                 lease_seconds: float = 300.0):
+        if batch_size < 1:
+            raise ValueError("batch_size doit être supérieur ou égal à 1")
+        if max_attempts < 1:
+            raise ValueError("max_attempts doit être supérieur ou égal à 1")
+
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max_attempts
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.retry_backoff_max_seconds = retry_backoff_max_seconds
+        self.lease_seconds = lease_seconds
+
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._batches = 0
+        self._ready = 0
+        self._retries = 0
+        self._failed = 0
+        self._last_error: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Démarre le thread du worker (les scans en attente sont repris immédiatement)"""
+        if self.running:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="recommendation-worker", daemon=True)
+        self._thread.start()
+        logger.info("🚀 Worker de recommandations démarré")
+
+    def stop(self, timeout: float = 10.0):
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def notify(self):
+        """Signale un nouveau scan en attente, sans attendre le prochain cycle"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                processed = self.process_pending()
+            except Exception as e:
+                logger.error(f"❌ Erreur du worker de recommandations: {str(e)}")
+                self._last_error = str(e)
+                processed = 0
+            # Lot complet: d'autres scans attendent probablement, pas de pause
+            if processed >= self.batch_size:
+                continue
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def process_pending(self) -> int:
+        """Traite un lot de scans à compléter; retourne le nombre de scans traités"""
+        claimed = self._claim()
+        if not claimed:
+            return 0
+
+        # Une seule génération par classe de maladie présente dans le lot, hors transaction
+        disease_texts: Dict[str, Optional[str]] = {}
+        for _, _, predicted_class, _, _, _ in claimed:
+            if predicted_class is None or predicted_class in disease_texts:
+                continue
+            try:
+                disease_texts[predicted_class] = prediction_service.get_disease_recommendations(predicted_class)
+            except Exception as e:
+                logger.error(f"❌ Recommandations indisponibles pour '{predicted_class}': {str(e)}")
+                self._last_error = str(e)
+                disease_texts[predicted_class] = None
+
+        self._save(claimed, disease_texts)
+        self._batches += 1
+        logger.info(f"✅ Recommandations traitées pour {len(claimed)} scans")
+        return len(claimed)
+
+    def _claim(self) -> List[ClaimedScan]:
+        """Réserve un lot de scans (statut `processing`) dans une transaction courte"""
+        from app.database import SessionLocal
+        from app.crud.scan import claim_recommendation_scans
+
+        db = SessionLocal()
+        try:
+            scans = claim_recommendation_scans(db, self.batch_size, self.max_attempts, self.lease_seconds)
+            claimed = [
+                (
+                    scan.id,
+                    scan.recommendations_attempts,
+                    self._predicted_class(scan),
+                    float(scan.confidence_score or 0),
+                    scan.result_type or "diseased",
+                    scan.detected_diseases or [],
+                )
+                for scan in scans
+            ]
+            db.commit()
+            return claimed
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _retry_delay(self, attempt: int) -> float:
+        return min(self.retry_backoff_seconds * (2 ** (attempt - 1)), self.retry_backoff_max_seconds)
+
+    def _save(self, claimed: List[ClaimedScan], disease_texts: Dict[str, Optional[str]]):
+        """Enregistre les résultats du lot dans une transaction courte"""
+        from app.database import SessionLocal
+        from app.crud.scan import save_scan_recommendations
+
+        now = datetime.now(timezone.utc)
+        db = SessionLocal()
+        try:
+            for scan_id, attempt, predicted_class, confidence, result_type, detected_diseases in claimed:
+                disease_specific = disease_texts.get(predicted_class) if predicted_class else None
+                retry_at = None
+                if disease_specific is not None:
+                    status = "ready"
+                else:
+                    status = "failed"
+                    if attempt < self.max_attempts:
+                        retry_at = now + timedelta(seconds=self._retry_delay(attempt))
+                    disease_specific = "Les recommandations spécifiques n'ont pas pu être générées pour le moment."
+                recommendations = prediction_service.generate_recommendations(
+                    predicted_class or "Inconnue", confidence, result_type, detected_diseases, disease_specific,
+                )
+                if not save_scan_recommendations(db, scan_id, attempt, recommendations, status, retry_at):
+                    # Réservation expirée: le scan a été repris par une autre tentative
+                    continue
+                if status == "ready":
+                    self._ready += 1
+                elif retry_at is not None:
+                    self._retries += 1
+                else:
+                    self._failed += 1
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def _predicted_class(scan) -> Optional[str]:
+        """Classe prédite (top-1 des maladies détectées enregistrées avec le scan)"""
+        if not scan.detected_diseases:
+            return None
+        return scan.detected_diseases[0].get("class_name")
+
+    def get_stats(self) -> Dict:
+        return {
+            "running": self.running,
+            "batch_size": self.batch_size,
+            "poll_seconds": self.poll_seconds,
+            "max_attempts": self.max_attempts,
+            "batches": self._batches,
+            "ready": self._ready,
+            "retries_scheduled": self._retries,
+            "failed": self._failed,
+            "last_error": self._last_error,
+        }
+
+
+# Instance globale du worker de recommandations
+recommendation_worker = RecommendationWorker(
+    batch_size=settings.ml_recommendation_worker_batch_size,
+    poll_seconds=settings.ml_recommendation_worker_poll_seconds,
+    max_attempts=settings.ml_recommendation_worker_max_attempts,
+    retry_backoff_seconds=settings.ml_recommendation_worker_retry_backoff_seconds,
+    retry_backoff_max_seconds=settings.ml_recommendation_worker_retry_backoff_max_seconds,
+    lease_seconds=settings.ml_recommendation_worker_lease_seconds,
+)
@@ -0,0 +1,75 @@
+import time
+from typing import Dict, List, Optional
+import logging
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Étapes du pipeline d'un scan, dans l'ordre
+PIPELINE_STAGES = ["decode", "preprocess", "inference", "recommendations", "upload", "db"]
+
+
+class DeadlineExceeded(TimeoutError):
+    """Une étape indispensable (décodage, prétraitement, inférence) a dépassé son budget"""
+
+    def __init__(self, stage: str, budget: float):
+        super().__init__(f"Budget de l'étape '{stage}' dépassé ({budget * 1000:.0f} ms)")
+        self.stage = stage
+        self.budget = budget
+
+
+class Deadline:
+    """
+    Échéance d'une requête et budgets de temps par étape.
+
+    Le temps accordé à une étape est le minimum entre son budget et le temps
+    restant avant l'échéance. Une étape facultative qui dépasserait ce temps est
+    dégradée (recommandations de base, envoi différé...) plutôt que d'allonger
+    la requête; les étapes dégradées et la durée de chacune sont rapportées.
+    """
+
+    def __init__(self, total_seconds: float, budgets: Optional[Dict[str, float]] = None):
+        self.total_seconds = total_seconds
+        self.budgets = dict(budgets or {})
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + total_seconds
+        self.degraded_stages: List[str] = []
+        self.stage_timings: Dict[str, float] = {}
+
+    @classmethod
+    def from_settings(cls) -> Optional["Deadline"]:
+        """Échéance configurée dans Settings (None si les budgets sont désactivés)"""
+        if not settings.ml_deadlines_enabled:
+            return None
+        return cls(settings.ml_request_deadline_seconds, {
+            "decode": settings.ml_budget_decode_seconds,
+            "preprocess": settings.ml_budget_preprocess_seconds,
+            "inference": settings.ml_budget_inference_seconds,
+            "recommendations": settings.ml_budget_recommendations_seconds,
+            "upload": settings.ml_budget_upload_seconds,
+            "db": settings.ml_budget_db_seconds,
+        })
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def budget(self, stage: str) -> float:
+        """Temps accordé à l'étape: son budget, borné par le temps restant"""
+        return min(self.budgets.get(stage, float("inf")), self.remaining())
+
+    def record(self, stage: str, seconds: float):
+        self.stage_timings[stage] = seconds
+
+    def degrade(self, stage: str, reason: str):
+        if stage not in self.degraded_stages:
+            self.degraded_stages.append(stage)
+        logger.warning(f"⚠️ Étape '{stage}' dégradée: {reason}")
+
+    def report(self) -> Dict:
+        return {
+            "degraded_stages": list(self.degraded_stages),
+            "stage_timings_ms": {stage: round(seconds * 1000, 1) for stage, seconds in self.stage_timings.items()},
+            "deadline_ms": round(self.total_seconds * 1000, 1),
+            "elapsed_ms": round((time.monotonic() - self.started_at) * 1000, 1),
+        }
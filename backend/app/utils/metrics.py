@@ -0,0 +1,44 @@
+import threading
+from collections import deque
+from typing import Dict
+
+import numpy as np
+
+
+class LatencyTracker:
+    """Fenêtre glissante de latences avec moyenne et percentiles"""
+
+    def __init__(self, window: int = 1000):
+        self._samples = deque(maxlen=window)
+        self._items = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def record(self, seconds: float, items: int = 1):
+        """Enregistre la durée d'un appel traitant `items` éléments"""
+        with self._lock:
+            self._samples.append(seconds)
+            self._items.append(items)
+            self.count += 1
+
+    def snapshot(self) -> Dict:
+        """Retourne les statistiques en millisecondes sur la fenêtre courante"""
+        with self._lock:
+            samples = np.array(self._samples, dtype=np.float64) * 1000
+            items = np.array(self._items, dtype=np.float64)
+            count = self.count
+
+        if samples.size == 0:
+            return {"count": count, "window": 0}
+
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+        return {
+            "count": count,
+            "window": int(samples.size),
+            "avg_ms": round(float(samples.mean()), 3),
+            "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3),
+            "max_ms": round(float(samples.max()), 3),
+            "avg_per_item_ms": round(float(samples.sum() / items.sum()), 3),
+        }
@@ -0,0 +1,7 @@
+import json
+from typing import Any
+
+
+def format_sse(event: str, data: Any) -> str:
+    """Formate un événement Server-Sent Events (données sérialisées en JSON)"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
@@ -0,0 +1,96 @@
+"""
+Benchmark du pool de tableaux d'entrée (ML_BUFFER_POOL_ENABLED): allocations avec et sans pool.
+
+Simule une charge soutenue: des groupes d'images sont prétraités puis assemblés
+en batch comme le fait le scheduler de micro-batching, puis les tableaux sont
+rendus. Pour chaque mode, affiche le temps médian par batch, le pic
+d'allocations suivies par tracemalloc (tableaux NumPy; la mémoire interne de PIL
+n'y apparaît pas) et, avec le pool, le taux de réutilisation et le pic de
+mémoire gérée. Aucun modèle n'est chargé.
+
+Usage, depuis le dossier backend:
+
+    python -m benchmarks.bench_buffer_pool [--batches 200] [--batch-size 8] [--dtype float32]
+"""
+import argparse
+import io
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+from app.ml.image_preprocessor import INPUT_DTYPES, ImagePreprocessor
+from app.ml.tensor_buffer_pool import TensorBufferPool
+
+
+def make_images(count: int):
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(count):
+        base = rng.integers(0, 255, (30, 40, 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(base).resize((640, 480), Image.Resampling.BICUBIC).save(buffer, format="JPEG", quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def without_pool(preprocessor: ImagePreprocessor, images, pool=None):
+    """Chemin historique: un tableau par image, puis une concaténation par batch"""
+    return np.concatenate([preprocessor.preprocess(image_bytes) for image_bytes in images], axis=0)
+
+
+def with_pool(preprocessor: ImagePreprocessor, images, pool: TensorBufferPool):
+    """Images écrites dans des tableaux empruntés, assemblées dans un batch emprunté, puis rendus"""
+    inputs = []
+    for image_bytes in images:
+        buffer = pool.acquire(1, preprocessor.input_dtype)
+        preprocessor.preprocess(image_bytes, out=buffer.array)
+        inputs.append(buffer)
+    batch = pool.acquire(len(inputs), preprocessor.input_dtype)
+    np.concatenate([buffer.array for buffer in inputs], axis=0, out=batch.array)
+    for buffer in inputs:
+        buffer.release()
+    batch.release()
+
+
+def measure(pipeline, preprocessor, images, batch_size: int, batches: int, pool=None):
+    groups = [images[(i * batch_size) % len(images):][:batch_size] for i in range(batches)]
+    pipeline(preprocessor, groups[0], pool)
+
+    tracemalloc.start()
+    timings = []
+    for group in groups:
+        started = time.perf_counter()
+        pipeline(preprocessor, group, pool)
+        timings.append(time.perf_counter() - started)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return float(np.median(timings)) * 1000, peak / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batches", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--dtype", choices=INPUT_DTYPES, default="float32")
+    args = parser.parse_args()
+
+    preprocessor = ImagePreprocessor(decode_profile="speed", input_dtype=args.dtype)
+    images = make_images(32)
+    pool = TensorBufferPool(image_shape=(*preprocessor.target_size, 3))
+
+    print(f"{'mode':>9} | {'p50/batch (ms)':>14} | {'pic tracemalloc (Mo)':>20}")
+    print("-" * 52)
+    for name, pipeline, pipeline_pool in (("sans pool", without_pool, None), ("avec pool", with_pool, pool)):
+        p50, peak = measure(pipeline, preprocessor, images, args.batch_size, args.batches, pipeline_pool)
+        print(f"{name:>9} | {p50:>14.2f} | {peak:>20.2f}")
+
+    stats = pool.get_stats()
+    print()
+    print(f"✅ Réutilisation: {stats['reuse_rate']:.1%} ({stats['reused']}/{stats['acquired']}), "
+          f"pic de mémoire gérée: {stats['peak_bytes'] / 1e6:.2f} Mo")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark du décodage des images d'un scan: chemin historique contre image décodée une seule fois.
+
+Pour chaque taille de photo (JPEG avec orientation EXIF), compare:
+- avant: validate_image, puis preprocess (nouvelle ouverture, EXIF, RGB, redimensionnement),
+  puis FileService.upload_image qui relit et décode à nouveau pour l'encodage WebP;
+- après: ImagePreprocessor.decode une fois, puis preprocess et l'encodage WebP sur la même DecodedImage.
+
+Affiche le nombre d'ouvertures et de décodages complets, les pixels décodés et le temps médian.
+Aucun envoi réseau n'est effectué. Usage, depuis le dossier backend:
+
+    python -m benchmarks.bench_image_decode [--iterations 10]
+"""
+import argparse
+import io
+import time
+
+import numpy as np
+from PIL import Image, ImageFile, ImageOps
+
+from app.ml.image_preprocessor import image_preprocessor
+
+PHOTO_SIZES = [(1024, 768), (2048, 1536), (4000, 3000)]
+
+
+class DecodeCounter:
+    """Compte les ouvertures (Image.open) et les décodages effectifs (ImageFile.load)"""
+
+    def __init__(self):
+        self.opens = 0
+        self.decodes = 0
+        self.pixels = 0
+        self._open = Image.open
+        self._load = ImageFile.ImageFile.load
+
+    def __enter__(self):
+        counter = self
+
+        def counting_open(*args, **kwargs):
+            counter.opens += 1
+            return counter._open(*args, **kwargs)
+
+        def counting_load(image):
+            if getattr(image, "tile", None):
+                counter.decodes += 1
+                counter.pixels += image.size[0] * image.size[1]
+            return counter._load(image)
+
+        Image.open = counting_open
+        ImageFile.ImageFile.load = counting_load
+        return self
+
+    def __exit__(self, *exc):
+        Image.open = self._open
+        ImageFile.ImageFile.load = self._load
+
+
+def make_photo(size) -> bytes:
+    """Photo JPEG synthétique, orientée à 90° via l'EXIF comme une photo de téléphone"""
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 255, (size[1] // 16, size[0] // 16, 3), dtype=np.uint8)
+    image = Image.fromarray(base).resize(size, Image.Resampling.BILINEAR)
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90, exif=exif)
+    return buffer.getvalue()
+
+
+def before(image_bytes: bytes):
+    """Chemin historique: validation, prétraitement et encodage décodent chacun l'image"""
+    if not image_preprocessor.validate_image(image_bytes):
+        raise ValueError("Format d'image non supporté")
+    image = Image.open(io.BytesIO(image_bytes))
+    image = image_preprocessor.enhance_image(image)
+    image = image_preprocessor.convert_to_rgb(image)
+    image = image_preprocessor.resize_image(image)
+    image_preprocessor.add_batch_dimension(image_preprocessor.normalize_image(np.array(image)))
+
+    # FileService.upload_image avant la mise en commun
+    image = Image.open(io.BytesIO(image_bytes))
+    image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    image.save(io.BytesIO(), format="WEBP", quality=80)
+
+
+def after(image_bytes: bytes):
+    """Image décodée une fois, partagée par le prétraitement et l'encodage pour le stockage"""
+    decoded = image_preprocessor.decode(image_bytes)
+    image_preprocessor.preprocess(decoded)
+    decoded.encoded("WEBP", 80)
+
+
+def measure(pipeline, image_bytes: bytes, iterations: int):
+    with DecodeCounter() as counter:
+        pipeline(image_bytes)
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        pipeline(image_bytes)
+        timings.append(time.perf_counter() - started)
+    return counter, float(np.median(timings)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'photo':>11} | {'mode':>5} | {'ouvertures':>10} | {'décodages':>9} | {'Mpx décodés':>11} | {'p50 (ms)':>9}")
+    print("-" * 72)
+    for size in PHOTO_SIZES:
+        image_bytes = make_photo(size)
+        results = {}
+        for name, pipeline in (("avant", before), ("après", after)):
+            counter, p50 = measure(pipeline, image_bytes, args.iterations)
+            results[name] = p50
+            print(
+                f"{size[0]:>5}x{size[1]:<5} | {name:>5} | {counter.opens:>10} | {counter.decodes:>9} | "
+                f"{counter.pixels / 1e6:>11.1f} | {p50:>9.1f}"
+            )
+        print(f"{'':>11} | gain: {results['avant'] / results['après']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
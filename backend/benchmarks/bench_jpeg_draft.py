@@ -0,0 +1,132 @@
+"""
+Benchmark et contrôle de non-régression des profils de décodage JPEG (ML_DECODE_PROFILE).
+
+Pour chaque profil (exact, quality, speed), mesure le temps médian de
+ImagePreprocessor.preprocess et la taille de l'image décodée. L'écart de chaque
+tenseur avec le profil exact est aussi mesuré (écart absolu moyen et maximal,
+PSNR). Avec --model, le script vérifie de plus que la classe prédite (top-1)
+est la même qu'avec le profil exact.
+
+Usage, depuis le dossier backend:
+
+    python -m benchmarks.bench_jpeg_draft [--images dossier_de_photos] [--model app/ml/best_model.keras]
+
+Sans --images, des photos JPEG synthétiques de 12 et 48 Mpx sont générées. Le PSNR sur ces
+photos ne suffit pas à changer ML_DECODE_PROFILE (exact par défaut): seul un passage avec
+--images (photos de feuilles réelles) et --model montrant une classe top-1 identique le justifie.
+Le code de retour vaut 1 si un profil change la classe prédite d'au moins une photo.
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+from app.ml.image_preprocessor import DECODE_PROFILES, ImagePreprocessor
+
+SYNTHETIC_SIZES = [(4032, 3024), (8000, 6000)]
+
+
+def synthetic_photo(size, seed: int) -> bytes:
+    """Photo JPEG synthétique: dégradés et textures basse fréquence, proche d'une feuille photographiée"""
+    rng = np.random.default_rng(seed)
+    base = rng.integers(0, 255, (size[1] // 64, size[0] // 64, 3), dtype=np.uint8)
+    image = Image.fromarray(base).resize(size, Image.Resampling.BICUBIC)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=92)
+    return buffer.getvalue()
+
+
+def load_images(folder: str, limit: int):
+    names = sorted(name for name in os.listdir(folder) if name.lower().endswith((".jpg", ".jpeg")))[:limit]
+    for name in names:
+        with open(os.path.join(folder, name), "rb") as f:
+            yield name, f.read()
+
+
+def psnr(reference: np.ndarray, other: np.ndarray) -> float:
+    mse = float(np.mean((reference - other) ** 2))
+    return float("inf") if mse == 0 else 10 * np.log10(1.0 / mse)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="Dossier de photos JPEG réelles")
+    parser.add_argument("--limit", type=int, default=50, help="Nombre maximal de photos lues dans --images")
+    parser.add_argument("--model", help="Modèle à utiliser pour comparer la classe prédite")
+    parser.add_argument("--iterations", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.images:
+        images = list(load_images(args.images, args.limit))
+    else:
+        images = [(f"synthétique {w}x{h}", synthetic_photo((w, h), seed)) for seed, (w, h) in enumerate(SYNTHETIC_SIZES)]
+    if not images:
+        print("❌ Aucune photo JPEG trouvée")
+        return 1
+
+    engine = None
+    if args.model:
+        from app.ml.model_loader import model_loader
+        engine = model_loader.load_engine(args.model)
+
+    preprocessors = {profile: ImagePreprocessor(decode_profile=profile) for profile in DECODE_PROFILES}
+    timings = {profile: [] for profile in DECODE_PROFILES}
+    decoded_mpx = {profile: [] for profile in DECODE_PROFILES}
+    errors = {profile: [] for profile in DECODE_PROFILES}
+    agreements = {profile: 0 for profile in DECODE_PROFILES}
+
+    for name, image_bytes in images:
+        tensors = {}
+        for profile, preprocessor in preprocessors.items():
+            decoded = preprocessor.decode(image_bytes, reduced=True)
+            decoded_mpx[profile].append(decoded.size[0] * decoded.size[1] / 1e6)
+            for _ in range(args.iterations):
+                started = time.perf_counter()
+                tensors[profile] = preprocessor.preprocess(image_bytes)
+                timings[profile].append(time.perf_counter() - started)
+
+        reference = tensors["exact"]
+        reference_class = int(np.argmax(engine.predict(reference))) if engine is not None else None
+        for profile, tensor in tensors.items():
+            difference = np.abs(tensor - reference)
+            errors[profile].append((float(difference.mean()), float(difference.max()), psnr(reference, tensor)))
+            if engine is not None and int(np.argmax(engine.predict(tensor))) == reference_class:
+                agreements[profile] += 1
+        print(f"✅ {name}")
+
+    print()
+    header = f"{'profil':>8} | {'p50 (ms)':>9} | {'gain':>5} | {'Mpx décodés':>11} | {'écart moyen':>11} | {'écart max':>9} | {'PSNR (dB)':>9}"
+    if engine is not None:
+        header += f" | {'top-1 identique':>15}"
+    print(header)
+    print("-" * len(header))
+    exact_p50 = float(np.median(timings["exact"])) * 1000
+    for profile in DECODE_PROFILES:
+        p50 = float(np.median(timings[profile])) * 1000
+        mean_error = np.mean([error[0] for error in errors[profile]])
+        max_error = np.max([error[1] for error in errors[profile]])
+        min_psnr = np.min([error[2] for error in errors[profile]])
+        line = (
+            f"{profile:>8} | {p50:>9.1f} | {exact_p50 / p50:>4.1f}x | {np.mean(decoded_mpx[profile]):>11.2f} | "
+            f"{mean_error:>11.4f} | {max_error:>9.4f} | {min_psnr:>9.1f}"
+        )
+        if engine is not None:
+            line += f" | {agreements[profile]:>7}/{len(images):<7}"
+        print(line)
+    if engine is not None:
+        engine.close()
+        for profile in DECODE_PROFILES:
+            if agreements[profile] < len(images):
+                print(f"⚠️ {profile}: classe top-1 différente pour {len(images) - agreements[profile]} photo(s)")
+        if any(agreements[profile] < len(images) for profile in DECODE_PROFILES):
+            return 1
+        print(f"✅ Classe top-1 identique pour tous les profils ({len(images)} photos)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
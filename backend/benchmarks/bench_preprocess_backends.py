@@ -0,0 +1,92 @@
+"""
+Benchmark des backends de prétraitement (ML_PREPROCESS_BACKEND): PIL contre OpenCV/NumPy.
+
+Pour des images JPEG (avec orientation EXIF) et PNG avec transparence de plusieurs
+tailles, mesure par image:
+- la latence médiane et p95 de ImagePreprocessor.preprocess, écrite dans un buffer fourni;
+- le pic d'allocations suivies par tracemalloc (tableaux NumPy, dont ceux d'OpenCV;
+  la mémoire interne de PIL n'y apparaît pas);
+- l'écart moyen du tenseur OpenCV avec celui de PIL.
+
+Usage, depuis le dossier backend:
+
+    python -m benchmarks.bench_preprocess_backends [--iterations 20] [--profile exact]
+"""
+import argparse
+import io
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+from app.ml.image_preprocessor import DECODE_PROFILES, ImagePreprocessor
+
+IMAGES = [("JPEG", (640, 480)), ("JPEG", (1600, 1200)), ("JPEG", (4032, 3024)), ("PNG", (1024, 1024))]
+
+
+def make_image(image_format: str, size) -> bytes:
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 255, (size[1] // 32, size[0] // 32, 3), dtype=np.uint8)
+    image = Image.fromarray(base).resize(size, Image.Resampling.BICUBIC)
+    buffer = io.BytesIO()
+    if image_format == "PNG":
+        alpha = Image.linear_gradient("L").resize(size)
+        image.putalpha(alpha)
+        image.save(buffer, format="PNG")
+    else:
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        image.save(buffer, format="JPEG", quality=90, exif=exif)
+    return buffer.getvalue()
+
+
+def measure(preprocessor: ImagePreprocessor, image_bytes: bytes, iterations: int):
+    height, width = preprocessor.target_size
+    out = np.empty((1, height, width, 3), dtype=np.float32)
+    preprocessor.preprocess(image_bytes, out=out)
+
+    tracemalloc.start()
+    preprocessor.preprocess(image_bytes, out=out)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        preprocessor.preprocess(image_bytes, out=out)
+        timings.append(time.perf_counter() - started)
+    timings = np.array(timings) * 1000
+    return float(np.median(timings)), float(np.percentile(timings, 95)), peak / 1e6, out.copy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--profile", choices=list(DECODE_PROFILES), default="exact", help="Profil de décodage commun")
+    args = parser.parse_args()
+
+    backends = {
+        "pil": ImagePreprocessor(decode_profile=args.profile, backend="pil"),
+        "opencv": ImagePreprocessor(decode_profile=args.profile, backend="opencv"),
+    }
+    if backends["opencv"].backend != "opencv":
+        print("❌ OpenCV indisponible")
+        return
+
+    print(f"{'image':>15} | {'backend':>7} | {'p50 (ms)':>9} | {'p95 (ms)':>9} | {'pic NumPy (Mo)':>14} | {'écart/PIL':>9}")
+    print("-" * 80)
+    for image_format, size in IMAGES:
+        image_bytes = make_image(image_format, size)
+        label = f"{image_format} {size[0]}x{size[1]}"
+        reference = None
+        for name, preprocessor in backends.items():
+            p50, p95, peak, tensor = measure(preprocessor, image_bytes, args.iterations)
+            if reference is None:
+                reference = tensor
+            difference = float(np.abs(tensor - reference).mean())
+            print(f"{label:>15} | {name:>7} | {p50:>9.2f} | {p95:>9.2f} | {peak:>14.2f} | {difference:>9.4f}")
+
+
+if __name__ == "__main__":
+    main()
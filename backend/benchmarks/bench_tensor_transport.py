@@ -0,0 +1,90 @@
+"""
+Benchmark du transport des tenseurs entre le processus API et un processus d'inférence.
+
+Compare, pour des batches de 1 à 32 images 224x224x3 float32:
+- pickle: le tableau (N, H, W, C) est envoyé par une multiprocessing.Queue
+- shm: l'image est écrite dans l'anneau SharedTensorRing, seuls les indices sont envoyés
+
+Le worker ne charge pas de modèle (réduction triviale), afin de mesurer uniquement
+le coût du transport. Usage, depuis le dossier backend:
+
+    python -m benchmarks.bench_tensor_transport [--iterations 50]
+"""
+import argparse
+import multiprocessing
+import time
+
+import numpy as np
+
+from app.ml.shared_tensor_ring import SharedBatch, SharedTensorRing
+
+BATCH_SIZES = [1, 2, 4, 8, 16, 32]
+IMAGE_SHAPE = (224, 224, 3)
+
+
+def _echo_worker(request_queue, response_queue, ring_spec):
+    ring = SharedTensorRing.attach(ring_spec)
+    while True:
+        message = request_queue.get()
+        if message is None:
+            break
+        batch = ring.batch_view(message.indices) if isinstance(message, SharedBatch) else message
+        # Lecture complète du batch pour un coût équivalent dans les deux modes
+        response_queue.put(batch.reshape(batch.shape[0], -1).mean(axis=1))
+    ring.close()
+
+
+def _run(mode, batch_size, iterations, images, ring, request_queue, response_queue):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        if mode == "pickle":
+            request_queue.put(np.concatenate(images[:batch_size], axis=0))
+        else:
+            slots = [ring.acquire() for _ in range(batch_size)]
+            for slot, image in zip(slots, images):
+                # Équivalent de ImagePreprocessor.preprocess(..., out=slot.array)
+                np.copyto(slot.array, image)
+            request_queue.put(SharedBatch([slot.index for slot in slots]))
+        response_queue.get()
+        timings.append(time.perf_counter() - started)
+        if mode == "shm":
+            for slot in slots:
+                slot.release()
+    timings = np.array(timings) * 1000
+    return float(np.median(timings)), float(np.percentile(timings, 95))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    ring = SharedTensorRing(slot_count=max(BATCH_SIZES), image_shape=IMAGE_SHAPE)
+    request_queue, response_queue = context.Queue(), context.Queue()
+    worker = context.Process(target=_echo_worker, args=(request_queue, response_queue, ring.spec()))
+    worker.start()
+
+    rng = np.random.default_rng(0)
+    images = [rng.random((1, *IMAGE_SHAPE), dtype=np.float32) for _ in range(max(BATCH_SIZES))]
+
+    print(f"{'batch':>5} | {'pickle p50 (ms)':>15} | {'pickle p95':>10} | {'shm p50 (ms)':>12} | {'shm p95':>8} | {'gain':>5}")
+    print("-" * 72)
+    try:
+        for batch_size in BATCH_SIZES:
+            # Échauffement
+            _run("pickle", batch_size, 3, images, ring, request_queue, response_queue)
+            _run("shm", batch_size, 3, images, ring, request_queue, response_queue)
+
+            pickle_p50, pickle_p95 = _run("pickle", batch_size, args.iterations, images, ring, request_queue, response_queue)
+            shm_p50, shm_p95 = _run("shm", batch_size, args.iterations, images, ring, request_queue, response_queue)
+            print(f"{batch_size:>5} | {pickle_p50:>15.3f} | {pickle_p95:>10.3f} | {shm_p50:>12.3f} | {shm_p95:>8.3f} | {pickle_p50 / shm_p50:>4.1f}x")
+    finally:
+        request_queue.put(None)
+        worker.join()
+        ring.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.ml.batch_scheduler import BatchScheduler
+
+
+def make_input(value: float) -> np.ndarray:
+    return np.full((1, 1, 1, 1), value, dtype=np.float32)
+
+
+class GatedModel:
+    """Faux modèle: le premier batch reste bloqué jusqu'à `open()`, chaque ligne est doublée"""
+
+    def __init__(self):
+        self.calls = []
+        self.first_started = threading.Event()
+        self._gate = threading.Event()
+
+    def open(self):
+        self._gate.set()
+
+    def __call__(self, batch, key):
+        self.calls.append((key, batch.shape[0]))
+        if len(self.calls) == 1:
+            self.first_started.set()
+            assert self._gate.wait(5)
+        return batch.reshape(batch.shape[0], -1) * 2
+
+
+@pytest.fixture
+def scheduler_factory():
+    schedulers = []
+
+    def create(predict_fn, **kwargs):
+        scheduler = BatchScheduler(predict_fn, **kwargs)
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield create
+    for scheduler in schedulers:
+        scheduler.stop()
+
+
+def test_idle_model_dispatches_without_waiting(scheduler_factory):
+    scheduler = scheduler_factory(lambda batch, key: batch.reshape(batch.shape[0], -1), max_wait_ms=2000)
+
+    started = time.perf_counter()
+    scheduler.predict(make_input(1.0), timeout=5)
+
+    assert time.perf_counter() - started < 1.0
+    assert scheduler.get_stats()["immediate_batches"] == 1
+
+
+def test_items_queued_during_a_forward_pass_are_batched_and_fanned_out(scheduler_factory):
+    model = GatedModel()
+    scheduler = scheduler_factory(model, max_batch_size=8, max_wait_ms=50)
+
+    first = scheduler.submit(make_input(0.0))
+    assert model.first_started.wait(5)
+    futures = [scheduler.submit(make_input(float(value))) for value in (1, 2, 3)]
+    model.open()
+
+    assert first.result(5).tolist() == [0.0]
+    assert [future.result(5).tolist() for future in futures] == [[2.0], [4.0], [6.0]]
+    assert [size for _, size in model.calls] == [1, 3]
+
+    stats = scheduler.get_stats()
+    assert stats["total_requests"] == 4
+    assert stats["total_batches"] == 2
+    assert stats["batch_size_histogram"] == {1: 1, 3: 1}
+    assert stats["max_batch_size_seen"] == 3
+    assert stats["active_batches"] == 0
+
+
+def test_batches_never_mix_keys(scheduler_factory):
+    model = GatedModel()
+    scheduler = scheduler_factory(model, max_batch_size=8, max_wait_ms=50)
+
+    first = scheduler.submit(make_input(0.0), key="v1")
+    assert model.first_started.wait(5)
+    futures = [
+        scheduler.submit(make_input(1.0), key="v2"),
+        scheduler.submit(make_input(2.0), key="v1"),
+        scheduler.submit(make_input(3.0), key="v2"),
+    ]
+    model.open()
+
+    first.result(5)
+    assert [future.result(5).tolist() for future in futures] == [[2.0], [4.0], [6.0]]
+    assert model.calls == [("v1", 1), ("v2", 2), ("v1", 1)]
+
+
+def test_max_batch_size_is_respected(scheduler_factory):
+    model = GatedModel()
+    scheduler = scheduler_factory(model, max_batch_size=2, max_wait_ms=50)
+
+    first = scheduler.submit(make_input(0.0))
+    assert model.first_started.wait(5)
+    futures = [scheduler.submit(make_input(float(value))) for value in range(1, 6)]
+    model.open()
+
+    first.result(5)
+    for future in futures:
+        future.result(5)
+    assert [size for _, size in model.calls] == [1, 2, 2, 1]
+
+
+def test_failed_batch_propagates_to_every_caller(scheduler_factory):
+    def failing(batch, key):
+        raise RuntimeError("modèle indisponible")
+
+    scheduler = scheduler_factory(failing)
+
+    with pytest.raises(RuntimeError, match="modèle indisponible"):
+        scheduler.predict(make_input(1.0), timeout=5)
+    assert scheduler.get_stats()["failed_batches"] == 1
+
+
+def test_row_count_mismatch_is_an_error(scheduler_factory):
+    scheduler = scheduler_factory(lambda batch, key: np.zeros((batch.shape[0] + 1, 2)))
+
+    with pytest.raises(ValueError):
+        scheduler.predict(make_input(1.0), timeout=5)
+
+
+def test_submit_rejects_unbatched_shapes(scheduler_factory):
+    scheduler = scheduler_factory(lambda batch, key: batch)
+
+    with pytest.raises(ValueError):
+        scheduler.submit(np.zeros((2, 1, 1, 1)))
+    assert not scheduler.running
+
@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.ml.image_preprocessor import image_preprocessor
+from app.services.ml_service import MLExecutors, ml_service
+from app.utils.deadline import Deadline, DeadlineExceeded
+
+
+def test_stage_budget_is_bounded_by_the_remaining_time():
+    deadline = Deadline(1.0, {"inference": 0.2, "upload": 5.0})
+
+    assert deadline.budget("inference") == 0.2
+    assert 0.9 < deadline.budget("upload") <= 1.0
+    assert 0.9 < deadline.budget("db") <= 1.0
+
+
+def test_expired_deadline_leaves_no_budget():
+    deadline = Deadline(0.01, {"inference": 1.0})
+    time.sleep(0.02)
+
+    assert deadline.remaining() == 0.0
+    assert deadline.budget("inference") == 0.0
+
+
+def test_report_lists_degraded_stages_once_and_timings():
+    deadline = Deadline(2.0)
+    deadline.record("preprocess", 0.0123)
+    deadline.degrade("recommendations", "budget dépassé")
+    deadline.degrade("recommendations", "budget dépassé")
+    deadline.degrade("upload", "envoi différé")
+
+    report = deadline.report()
+
+    assert report["degraded_stages"] == ["recommendations", "upload"]
+    assert report["stage_timings_ms"] == {"preprocess": 12.3}
+    assert report["deadline_ms"] == 2000.0
+    assert report["elapsed_ms"] >= 0
+
+
+def test_deadline_exceeded_is_a_timeout():
+    error = DeadlineExceeded("inference", 0.25)
+
+    assert isinstance(error, TimeoutError)
+    assert error.stage == "inference"
+    assert "250 ms" in str(error)
+
+
+def test_from_settings(monkeypatch):
+    monkeypatch.setattr(settings, "ml_deadlines_enabled", False)
+    assert Deadline.from_settings() is None
+
+    monkeypatch.setattr(settings, "ml_deadlines_enabled", True)
+    deadline = Deadline.from_settings()
+    assert deadline.total_seconds == settings.ml_request_deadline_seconds
+    assert deadline.budgets["inference"] == settings.ml_budget_inference_seconds
+    assert deadline.budgets["decode"] == settings.ml_budget_decode_seconds
+
+
+def test_decode_over_budget_raises_deadline_exceeded(monkeypatch):
+    executors = MLExecutors(image_workers=1, inference_workers=1, io_workers=1)
+    monkeypatch.setattr(ml_service, "executors", executors)
+    monkeypatch.setattr(image_preprocessor, "decode", lambda image_bytes: time.sleep(0.2))
+    deadline = Deadline(5.0, {"decode": 0.01})
+    try:
+        with pytest.raises(DeadlineExceeded) as error:
+            asyncio.run(ml_service.decode_async(b"image", deadline))
+    finally:
+        executors.shutdown(wait=True)
+
+    assert error.value.stage == "decode"
+    assert "decode" in deadline.stage_timings
@@ -0,0 +1,33 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image, ImageOps
+
+from app.ml.image_preprocessor import ImagePreprocessor
+
+
+def rgba_png_bytes() -> bytes:
+    pixels = np.random.default_rng(0).integers(0, 255, (40, 60, 4), dtype=np.uint8)
+    pixels[:10, :, 3] = 0
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("backend", ["pil", "opencv"])
+def test_stored_copy_of_a_transparent_image_drops_alpha_without_compositing(backend):
+    if backend == "opencv":
+        pytest.importorskip("cv2")
+    image_bytes = rgba_png_bytes()
+    # Fichier stocké par FileService avant le décodage partagé
+    previous = io.BytesIO()
+    ImageOps.exif_transpose(Image.open(io.BytesIO(image_bytes))).convert("RGB").save(
+        previous, format="WEBP", quality=80
+    )
+
+    decoded = ImagePreprocessor(backend=backend).decode(image_bytes)
+
+    assert decoded.encoded("WEBP", 80) == previous.getvalue()
+    # L'entrée du modèle reste composée sur fond blanc
+    assert np.asarray(decoded.image)[:10].min() == 255
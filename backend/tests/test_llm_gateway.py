@@ -0,0 +1,197 @@
+import threading
+import time
+
+import pytest
+
+from app.ml.llm_gateway import CLOSED, HALF_OPEN, OPEN, CircuitOpenError, LLMGateway, LLMTimeoutError
+
+
+@pytest.fixture
+def gateway_factory():
+    gateways = []
+
+    def create(**kwargs):
+        gateway = LLMGateway(**kwargs)
+        gateways.append(gateway)
+        return gateway
+
+    yield create
+    for gateway in gateways:
+        gateway.shutdown()
+
+
+def fail():
+    raise RuntimeError("erreur de l'API")
+
+
+def open_circuit(gateway: LLMGateway):
+    for _ in range(gateway.failure_threshold):
+        with pytest.raises(RuntimeError):
+            gateway.call(fail)
+    assert gateway.state == OPEN
+
+
+def test_successful_call_returns_the_result(gateway_factory):
+    gateway = gateway_factory()
+
+    assert gateway.call(lambda: "réponse") == "réponse"
+    stats = gateway.get_stats()
+    assert stats["successes"] == 1
+    assert stats["state"] == CLOSED
+
+
+def test_breaker_opens_after_consecutive_failures_and_rejects_without_calling(gateway_factory):
+    gateway = gateway_factory(failure_threshold=3, reset_seconds=60)
+    open_circuit(gateway)
+    calls = []
+
+    with pytest.raises(CircuitOpenError):
+        gateway.call(lambda: calls.append(1))
+
+    assert calls == []
+    stats = gateway.get_stats()
+    assert stats["opened"] == 1
+    assert stats["rejected_open"] == 1
+
+
+def test_success_resets_the_failure_count(gateway_factory):
+    gateway = gateway_factory(failure_threshold=2)
+    with pytest.raises(RuntimeError):
+        gateway.call(fail)
+    gateway.call(lambda: "ok")
+    with pytest.raises(RuntimeError):
+        gateway.call(fail)
+
+    assert gateway.state == CLOSED
+
+
+def test_half_open_admits_a_single_trial_that_closes_the_circuit(gateway_factory):
+    gateway = gateway_factory(failure_threshold=1, reset_seconds=0.05)
+    open_circuit(gateway)
+    time.sleep(0.1)
+    assert gateway.state == HALF_OPEN
+
+    release = threading.Event()
+    trial = threading.Thread(target=gateway.call, args=(lambda: release.wait(5),))
+    trial.start()
+    try:
+        time.sleep(0.05)
+        with pytest.raises(CircuitOpenError):
+            gateway.call(lambda: "second essai")
+    finally:
+        release.set()
+        trial.join(5)
+
+    assert gateway.state == CLOSED
+
+
+def test_failed_trial_reopens_the_circuit(gateway_factory):
+    gateway = gateway_factory(failure_threshold=1, reset_seconds=0.05)
+    open_circuit(gateway)
+    time.sleep(0.1)
+
+    with pytest.raises(RuntimeError):
+        gateway.call(fail)
+
+    assert gateway.state == OPEN
+    assert gateway.get_stats()["opened"] == 2
+
+
+def test_slow_calls_count_as_failures(gateway_factory):
+    gateway = gateway_factory(failure_threshold=1, slow_call_seconds=0.01)
+
+    assert gateway.call(lambda: time.sleep(0.05) or "lent") == "lent"
+
+    assert gateway.state == OPEN
+    assert gateway.get_stats()["slow_calls"] == 1
+
+
+def test_caller_is_released_after_the_timeout(gateway_factory):
+    gateway = gateway_factory(timeout_seconds=0.1, failure_threshold=5)
+    release = threading.Event()
+
+    started = time.perf_counter()
+    with pytest.raises(LLMTimeoutError):
+        gateway.call(lambda: release.wait(5))
+    elapsed = time.perf_counter() - started
+    release.set()
+
+    assert elapsed < 1.0
+    assert gateway.get_stats()["timeouts"] == 1
+
+
+def test_saturated_gateway_rejects_after_the_queue_timeout(gateway_factory):
+    gateway = gateway_factory(max_concurrency=1, timeout_seconds=0.05, queue_timeout_seconds=0.05)
+    release = threading.Event()
+    with pytest.raises(LLMTimeoutError):
+        gateway.call(lambda: release.wait(5))
+
+    # L'appel bloquant occupe toujours la seule place
+    with pytest.raises(CircuitOpenError):
+        gateway.call(lambda: "ok")
+    release.set()
+
+    assert gateway.get_stats()["rejected_saturated"] == 1
+
+
+def test_hedged_call_returns_the_first_response(gateway_factory):
+    gateway = gateway_factory(hedge_after_seconds=0.05, timeout_seconds=2)
+    release = threading.Event()
+    attempts = []
+
+    def generate():
+        attempts.append(1)
+        if len(attempts) == 1:
+            release.wait(5)
+            return "appel initial"
+        return "relance"
+
+    try:
+        assert gateway.call(generate) == "relance"
+    finally:
+        release.set()
+
+    stats = gateway.get_stats()
+    assert stats["hedges"] == 1
+    assert stats["hedge_wins"] == 1
+
+
+def test_stream_yields_every_chunk(gateway_factory):
+    gateway = gateway_factory()
+
+    assert list(gateway.stream(lambda: iter(["a", "b", "c"]))) == ["a", "b", "c"]
+    stats = gateway.get_stats()
+    assert stats["successes"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_stream_first_chunk_timeout(gateway_factory):
+    gateway = gateway_factory(timeout_seconds=0.1)
+    release = threading.Event()
+
+    def slow_stream():
+        release.wait(5)
+        yield "trop tard"
+
+    started = time.perf_counter()
+    with pytest.raises(LLMTimeoutError):
+        list(gateway.stream(slow_stream))
+    release.set()
+
+    assert time.perf_counter() - started < 1.0
+    assert gateway.get_stats()["timeouts"] == 1
+
+
+def test_abandoned_stream_frees_the_half_open_trial(gateway_factory):
+    gateway = gateway_factory(failure_threshold=1, reset_seconds=0.05)
+    open_circuit(gateway)
+    time.sleep(0.1)
+
+    stream = gateway.stream(lambda: iter(["a", "b"]))
+    assert next(stream) == "a"
+    stream.close()
+
+    assert gateway.state == HALF_OPEN
+    assert gateway.get_stats()["in_flight"] == 0
+    assert gateway.call(lambda: "essai") == "essai"
+    assert gateway.state == CLOSED
@@ -0,0 +1,82 @@
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.ml.image_preprocessor import ImagePreprocessor
+from app.ml.near_duplicate_index import NearDuplicateIndex, compute_dhash, hamming_distance
+
+
+RESULT = {"predicted_class": "Tomato___Late_blight", "confidence": 0.93, "model_version": "v1"}
+
+
+def test_hamming_distance():
+    assert hamming_distance(0b1011, 0b1011) == 0
+    assert hamming_distance(0b1011, 0b0010) == 2
+    assert hamming_distance(0, (1 << 64) - 1) == 64
+
+
+def test_near_duplicate_reuses_the_closest_recent_scan():
+    index = NearDuplicateIndex(max_distance=4)
+    index.add(1, 0b0000_0000, "v1", {"predicted_class": "far"})
+    index.add(1, 0b0000_0111, "v1", {"predicted_class": "near"})
+
+    result, distance = index.find(1, 0b0000_0011, "v1")
+
+    assert result == {"predicted_class": "near"}
+    assert distance == 1
+    assert index.get_stats()["reuses"] == 1
+
+
+def test_near_duplicate_is_scoped_to_user_model_version_and_distance():
+    index = NearDuplicateIndex(max_distance=2)
+    index.add(1, 0b1111, "v1", RESULT)
+
+    assert index.find(2, 0b1111, "v1") is None
+    assert index.find(1, 0b1111, "v2") is None
+    assert index.find(1, 0b0000, "v1") is None
+    assert index.get_stats()["reuse_rate"] == 0.0
+
+
+def test_near_duplicate_history_and_ttl_are_bounded():
+    index = NearDuplicateIndex(max_distance=0, history_size=2, ttl_seconds=0.05)
+    for image_hash in (1, 2, 3):
+        index.add(1, image_hash, "v1", {"hash": image_hash})
+
+    assert index.find(1, 1, "v1") is None
+    assert index.find(1, 3, "v1") == ({"hash": 3}, 0)
+    assert index.get_stats()["entries"] == 2
+
+    time.sleep(0.1)
+    assert index.find(1, 3, "v1") is None
+
+
+def test_near_duplicate_evicts_least_recent_users():
+    index = NearDuplicateIndex(max_users=2)
+    for user_id in (1, 2, 3):
+        index.add(user_id, 0, "v1", RESULT)
+
+    assert index.find(1, 0, "v1") is None
+    assert index.find(3, 0, "v1") is not None
+    assert index.get_stats()["users"] == 2
+
+
+def test_dhash_follows_horizontal_gradients():
+    ramp = np.tile(np.linspace(0, 255, 224, dtype=np.float32), (224, 1)).astype(np.uint8)
+    pixels = np.repeat(ramp[:, :, None], 3, axis=2)
+
+    assert compute_dhash(pixels) == (1 << 64) - 1
+    assert compute_dhash(pixels[:, ::-1]) == 0
+
+
+def test_dhash_is_the_same_for_every_preprocessing_backend():
+    pytest.importorskip("cv2")
+    from app.ml.opencv_preprocessor import OpenCVPreprocessor
+
+    rgb = np.random.default_rng(0).integers(0, 255, (224, 224, 3), dtype=np.uint8)
+    opencv = OpenCVPreprocessor((224, 224), {"JPEG"})
+
+    pil_hash = ImagePreprocessor().compute_dhash(Image.fromarray(rgb))
+    assert pil_hash == compute_dhash(rgb)
+    assert opencv.compute_dhash(np.ascontiguousarray(rgb[:, :, ::-1])) == pil_hash
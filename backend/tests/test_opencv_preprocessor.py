@@ -0,0 +1,42 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.ml.image_preprocessor import DecodedImage, ImagePreprocessor
+
+pytest.importorskip("cv2")
+
+
+def png_bytes(pixels: np.ndarray, orientation: int = 1) -> bytes:
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG", exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("orientation", range(1, 9))
+def test_transparent_image_is_oriented_like_the_pil_backend(orientation):
+    rgba = np.random.default_rng(orientation).integers(0, 255, (30, 50, 4), dtype=np.uint8)
+    image_bytes = png_bytes(rgba, orientation)
+
+    pil = ImagePreprocessor().decode(image_bytes)
+    opencv = ImagePreprocessor(backend="opencv").decode(image_bytes)
+
+    assert opencv.size == pil.size
+    np.testing.assert_array_equal(np.asarray(opencv.image), np.asarray(pil.image))
+
+
+def test_request_decode_uses_the_opencv_backend():
+    preprocessor = ImagePreprocessor(backend="opencv")
+    rgb = np.random.default_rng(0).integers(0, 255, (300, 400, 3), dtype=np.uint8)
+    image_bytes = png_bytes(rgb)
+
+    decoded = preprocessor.decode(image_bytes)
+
+    assert isinstance(decoded, DecodedImage)
+    assert decoded.pixels is not None
+    assert decoded.size == (400, 300)
+    np.testing.assert_array_equal(preprocessor.preprocess(decoded), preprocessor.preprocess(image_bytes))
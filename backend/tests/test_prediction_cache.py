@@ -0,0 +1,93 @@
+import time
+
+import pytest
+
+from app.ml.prediction_cache import PredictionCache
+
+
+RESULT = {"predicted_class": "Tomato___Late_blight", "confidence": 0.93, "model_version": "v1"}
+
+
+def test_key_depends_on_content_model_version_and_threshold():
+    key = PredictionCache.make_key(b"image", "v1", 0.7)
+
+    assert key == PredictionCache.make_key(b"image", "v1", 0.7)
+    assert key != PredictionCache.make_key(b"image!", "v1", 0.7)
+    assert key != PredictionCache.make_key(b"image", "v2", 0.7)
+    assert key != PredictionCache.make_key(b"image", "v1", 0.8)
+
+
+def test_memory_cache_hits_and_evicts_least_recently_used():
+    cache = PredictionCache(max_entries=2)
+    cache.put("a", "v1", RESULT)
+    cache.put("b", "v1", RESULT)
+    assert cache.get("a") == RESULT
+    cache.put("c", "v1", RESULT)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == RESULT
+    stats = cache.get_stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+
+
+def test_entries_expire_after_ttl():
+    cache = PredictionCache(ttl_seconds=0.05)
+    cache.put("a", "v1", RESULT)
+    time.sleep(0.1)
+
+    assert cache.get("a") is None
+    assert cache.get_stats()["expired"] == 1
+
+
+def test_invalidate_only_removes_the_given_model_version():
+    cache = PredictionCache()
+    cache.put("a", "v1", RESULT)
+    cache.put("b", "v2", RESULT)
+
+    assert cache.invalidate("v1") == 1
+    assert cache.get("a") is None
+    assert cache.get("b") == RESULT
+    assert cache.invalidate() == 1
+    assert cache.get("b") is None
+
+
+def test_persistent_level_survives_a_restart(tmp_path):
+    path = str(tmp_path / "cache" / "predictions.db")
+    cache = PredictionCache(persistent_path=path)
+    cache.put("a", "v1", RESULT)
+    cache.close()
+
+    reopened = PredictionCache(persistent_path=path)
+    try:
+        assert reopened.get("a") == RESULT
+        assert reopened.get_stats()["disk_hits"] == 1
+        # Remontée en mémoire: le second accès ne lit plus le disque
+        assert reopened.get("a") == RESULT
+        assert reopened.get_stats()["disk_hits"] == 1
+    finally:
+        reopened.close()
+
+
+def test_invalid_size_is_rejected():
+    with pytest.raises(ValueError):
+        PredictionCache(max_entries=0)
+
+
+def test_persistent_level_is_pruned_periodically(tmp_path):
+    cache = PredictionCache(
+        persistent_path=str(tmp_path / "predictions.db"), persistent_max_entries=2, prune_interval_seconds=3600
+    )
+    try:
+        for key in ("a", "b", "c", "d"):
+            cache.put(key, "v1", RESULT)
+        # Seule la première écriture a purgé le disque: la purge suivante attend l'intervalle
+        assert cache.get_stats()["persistent_entries"] == 4
+
+        cache.prune_interval_seconds = 0
+        cache.put("e", "v1", RESULT)
+        assert cache.get_stats()["persistent_entries"] == 2
+    finally:
+        cache.close()
@@ -0,0 +1,98 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.ml.recommendation_cache import RecommendationCache
+
+
+KEY = ("Tomato___Late_blight", "fr", "v1")
+
+
+def wait_until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition non atteinte"
+        time.sleep(0.005)
+
+
+def test_concurrent_requests_share_a_single_generation():
+    cache = RecommendationCache(persistent=False)
+    release = threading.Event()
+    calls = []
+
+    def generate():
+        calls.append(1)
+        assert release.wait(5)
+        return "traitement"
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [executor.submit(cache.get_or_generate, KEY, generate) for _ in range(8)]
+        wait_until(lambda: cache.get_stats()["coalesced"] == 7)
+        release.set()
+        results = [future.result(5) for future in futures]
+
+    assert results == ["traitement"] * 8
+    assert len(calls) == 1
+    stats = cache.get_stats()
+    assert stats["misses"] == 1
+    assert stats["in_flight"] == 0
+    assert cache.get_or_generate(KEY, generate) == "traitement"
+    assert len(calls) == 1
+
+
+def test_generation_error_reaches_every_waiter_and_is_not_cached():
+    cache = RecommendationCache(persistent=False)
+    release = threading.Event()
+
+    def failing():
+        assert release.wait(5)
+        raise ValueError("réponse vide")
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [executor.submit(cache.get_or_generate, KEY, failing) for _ in range(3)]
+        wait_until(lambda: cache.get_stats()["coalesced"] == 2)
+        release.set()
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result(5)
+
+    assert cache.lookup(KEY) is None
+    assert cache.get_or_generate(KEY, lambda: "nouvel essai") == "nouvel essai"
+
+
+def test_stale_value_is_served_when_refresh_fails():
+    cache = RecommendationCache(ttl_seconds=0.05, persistent=False)
+    cache.get_or_generate(KEY, lambda: "ancienne valeur")
+    time.sleep(0.1)
+
+    def failing():
+        raise RuntimeError("LLM indisponible")
+
+    assert cache.get_or_generate(KEY, failing) == "ancienne valeur"
+    stats = cache.get_stats()
+    assert stats["refreshes"] == 1
+    assert stats["stale_served"] == 1
+
+    assert cache.get_or_generate(KEY, lambda: "nouvelle valeur") == "nouvelle valeur"
+
+
+def test_keys_are_isolated_by_language_and_prompt_version():
+    cache = RecommendationCache(persistent=False)
+    cache.put(KEY, "texte fr")
+
+    assert cache.lookup(KEY) == "texte fr"
+    assert cache.lookup(("Tomato___Late_blight", "en", "v1")) is None
+    assert cache.lookup(("Tomato___Late_blight", "fr", "v2")) is None
+
+
+def test_invalidate_by_disease_class():
+    cache = RecommendationCache(max_entries=4, persistent=False)
+    cache.put(KEY, "a")
+    cache.put(("Apple___Apple_scab", "fr", "v1"), "b")
+
+    cache.invalidate("Tomato___Late_blight")
+
+    assert cache.lookup(KEY) is None
+    assert cache.lookup(("Apple___Apple_scab", "fr", "v1")) == "b"
@@ -0,0 +1,189 @@
+import io
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.core.config import settings
+from app.ml.model_loader import ModelHandle, model_loader
+from app.ml.prediction_service import PredictionService
+from app.ml.recommendation_providers import (
+    CatalogueProvider,
+    LLMProvider,
+    RecommendationProviderChain,
+    class_name_keys,
+)
+
+
+CLASS_NAMES = ["Tomato___Late_blight", "Tomato___Bacterial_spot", "Tomato___healthy"]
+
+
+def disease(name, symptoms="Taches brunes", treatment="Fongicide cuivrique", prevention="Rotation des cultures"):
+    return SimpleNamespace(name=name, symptoms=symptoms, treatment=treatment, prevention=prevention)
+
+
+def catalogue_with(*diseases, language="fr") -> CatalogueProvider:
+    catalogue = CatalogueProvider(refresh_seconds=3600, language=language)
+    catalogue.load(list(diseases))
+    return catalogue
+
+
+def test_class_name_keys():
+    assert class_name_keys("Tomato___Late_blight") == ["tomato late blight"]
+    assert class_name_keys("Cherry_(including_sour)___Powdery_mildew") == [
+        "cherry including sour powdery mildew",
+        "cherry powdery mildew",
+    ]
+
+
+def test_catalogue_matches_crop_and_disease_only():
+    catalogue = catalogue_with(disease("Potato Late blight"), disease("Cherry - Powdery mildew"))
+
+    assert catalogue.get("Tomato___Late_blight", "fr") is None
+    assert catalogue.get("Potato___Late_blight", "fr").startswith("Recommandations spécifiques pour: Potato___Late_blight")
+    assert catalogue.get("Cherry_(including_sour)___Powdery_mildew", "fr") is not None
+
+
+def test_catalogue_skips_entries_without_advice():
+    catalogue = catalogue_with(disease("Tomato Late blight", treatment=None, prevention=None))
+
+    assert catalogue.size == 0
+
+
+def test_catalogue_only_answers_in_its_language():
+    catalogue = catalogue_with(disease("Tomato Late blight"))
+
+    assert catalogue.get("Tomato___Late_blight", "en") is None
+    assert "Fongicide cuivrique" in catalogue.get("Tomato___Late_blight", "fr")
+    assert catalogue.get_info()["language"] == "fr"
+
+
+def test_chain_falls_back_to_the_llm_on_a_catalogue_miss():
+    llm_calls = []
+
+    def generate(disease_name, language):
+        llm_calls.append((disease_name, language))
+        return "texte du LLM"
+
+    chain = RecommendationProviderChain([catalogue_with(disease("Tomato Late blight")), LLMProvider(generate)])
+
+    assert chain.get("Tomato___Late_blight", "fr")[1] == "catalogue"
+    assert chain.get("Tomato___Bacterial_spot", "fr") == ("texte du LLM", "llm")
+    assert chain.get("Tomato___Late_blight", "en") == ("texte du LLM", "llm")
+    assert llm_calls == [("Tomato___Bacterial_spot", "fr"), ("Tomato___Late_blight", "en")]
+
+    stats = chain.get_stats()
+    assert stats["catalogue"]["hits"] == 1
+    assert stats["catalogue"]["misses"] == 2
+    assert stats["llm"]["hits"] == 2
+    assert stats["llm"]["latency"]["count"] == 2
+
+
+def test_chain_raises_the_last_error_or_lookup_error():
+    def failing(disease_name, language):
+        raise RuntimeError("LLM indisponible")
+
+    with pytest.raises(RuntimeError):
+        RecommendationProviderChain([catalogue_with(), LLMProvider(failing)]).get("Tomato___Late_blight", "fr")
+    with pytest.raises(LookupError):
+        RecommendationProviderChain([catalogue_with()]).get("Tomato___Late_blight", "fr")
+
+
+class FixedBackend:
+    """Moteur d'inférence de test: mêmes probabilités pour chaque image du batch"""
+
+    def __init__(self, probabilities):
+        self.probabilities = np.asarray(probabilities, dtype=np.float32)
+        self.batches = 0
+
+    def predict(self, batch):
+        self.batches += 1
+        return np.tile(self.probabilities, (len(batch), 1))
+
+    def close(self):
+        pass
+
+
+def jpeg_bytes(seed: int) -> bytes:
+    pixels = np.random.default_rng(seed).integers(0, 255, (64, 64, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def offline_service(monkeypatch):
+    """PredictionService complet sans base de données, modèle TensorFlow ni appel au LLM"""
+    monkeypatch.setattr(settings, "ml_recommendation_cache_persistent", False)
+    monkeypatch.setattr(settings, "ml_recommendation_lookup_only", False)
+    monkeypatch.setattr(settings, "ml_prediction_cache_path", "")
+    monkeypatch.setattr(settings, "ml_recommendation_language", "fr")
+    monkeypatch.setattr(settings, "ml_recommendation_catalogue_language", "fr")
+
+    service = PredictionService()
+    llm_calls = []
+
+    def generate(disease_name, language):
+        llm_calls.append((disease_name, language))
+        return f"Recommandations spécifiques pour: {disease_name}\n\ntexte du LLM"
+
+    monkeypatch.setattr(service, "_generate_disease_recommendations", generate)
+    service.catalogue.load([disease("Tomato Late blight")])
+
+    def use_model(probabilities):
+        backend = FixedBackend(probabilities)
+        handle = ModelHandle("test-v1", CLASS_NAMES, backend)
+        monkeypatch.setattr(model_loader, "acquire", handle.acquire)
+        return backend
+
+    yield service, use_model, llm_calls
+    if service.batch_scheduler is not None:
+        service.batch_scheduler.stop()
+    service.llm_gateway.shutdown()
+
+
+def test_offline_pipeline_serves_catalogue_recommendations(offline_service):
+    service, use_model, llm_calls = offline_service
+    backend = use_model([0.9, 0.05, 0.05])
+
+    result = service.predict(jpeg_bytes(0))
+
+    assert result["predicted_class"] == "Tomato___Late_blight"
+    assert result["result_type"] == "diseased"
+    assert result["model_version"] == "test-v1"
+    assert "Isolez la plante" in result["recommendations"]
+    assert "Fongicide cuivrique" in result["recommendations"]
+    assert llm_calls == []
+    assert backend.batches == 1
+
+    # Même image: résultat en cache, sans nouvelle inférence
+    again = service.predict(jpeg_bytes(0))
+    assert again["cached"] is True
+    assert again["recommendations"] == result["recommendations"]
+    assert backend.batches == 1
+
+
+def test_offline_pipeline_uses_the_llm_only_on_a_catalogue_miss(offline_service):
+    service, use_model, llm_calls = offline_service
+    use_model([0.05, 0.9, 0.05])
+
+    result = service.predict(jpeg_bytes(1))
+
+    assert result["predicted_class"] == "Tomato___Bacterial_spot"
+    assert "texte du LLM" in result["recommendations"]
+    assert llm_calls == [("Tomato___Bacterial_spot", "fr")]
+    stats = service.recommendation_providers.get_stats()
+    assert stats["catalogue"]["misses"] == 1
+    assert stats["llm"]["hits"] == 1
+
+
+def test_offline_pipeline_healthy_scan_needs_no_recommendation_source(offline_service):
+    service, use_model, llm_calls = offline_service
+    use_model([0.02, 0.03, 0.95])
+
+    result = service.predict(jpeg_bytes(2))
+
+    assert result["result_type"] == "healthy"
+    assert llm_calls == []
+    assert service.recommendation_providers.get_stats()["catalogue"]["hits"] == 0
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from app.ml.tensor_buffer_pool import TensorBufferPool
+
+
+IMAGE_SHAPE = (4, 4, 3)
+IMAGE_BYTES = 4 * 4 * 3 * 4  # float32
+
+
+def test_released_buffers_are_reused():
+    pool = TensorBufferPool(IMAGE_SHAPE)
+    buffer = pool.acquire(1, np.float32)
+    array = buffer.array
+    assert array.shape == (1, *IMAGE_SHAPE)
+    buffer.release()
+
+    again = pool.acquire(1, np.float32)
+
+    assert again.array is array
+    stats = pool.get_stats()
+    assert stats["reused"] == 1
+    assert stats["allocated"] == 1
+    assert stats["reuse_rate"] == 0.5
+
+
+def test_buffers_are_keyed_by_batch_size_and_dtype():
+    pool = TensorBufferPool(IMAGE_SHAPE)
+    pool.acquire(1, np.float32).release()
+
+    assert pool.acquire(2, np.float32).array.shape == (2, *IMAGE_SHAPE)
+    assert pool.acquire(1, np.float16).array.dtype == np.float16
+    assert pool.get_stats()["reused"] == 0
+
+
+def test_release_is_idempotent():
+    pool = TensorBufferPool(IMAGE_SHAPE)
+    buffer = pool.acquire()
+    buffer.release()
+    buffer.release()
+
+    assert pool.get_stats()["buffers"]["1xfloat32"] == {"free": 1, "in_use": 0}
+
+
+def test_memory_limit_falls_back_to_unpooled_arrays():
+    pool = TensorBufferPool(IMAGE_SHAPE, max_total_bytes=IMAGE_BYTES)
+    pooled = pool.acquire()
+    overflow = pool.acquire()
+
+    assert pooled.pooled and not overflow.pooled
+    overflow.release()
+    pooled.release()
+
+    stats = pool.get_stats()
+    assert stats["overflow"] == 1
+    assert stats["pooled_bytes"] == IMAGE_BYTES
+    assert stats["buffers"]["1xfloat32"]["free"] == 1
+
+
+def test_free_buffers_per_key_are_bounded():
+    pool = TensorBufferPool(IMAGE_SHAPE, max_buffers_per_key=1)
+    first, second = pool.acquire(), pool.acquire()
+    first.release()
+    second.release()
+
+    stats = pool.get_stats()
+    assert stats["discarded"] == 1
+    assert stats["pooled_bytes"] == IMAGE_BYTES
+    assert stats["peak_bytes"] == 2 * IMAGE_BYTES
+
+
+def test_preallocate_and_clear():
+    pool = TensorBufferPool(IMAGE_SHAPE, max_buffers_per_key=3)
+
+    assert pool.preallocate(1, np.float32, 5) == 3
+    assert pool.get_stats()["pooled_bytes"] == 3 * IMAGE_BYTES
+    pool.acquire().release()
+    assert pool.get_stats()["reused"] == 1
+
+    pool.clear()
+    assert pool.get_stats()["pooled_bytes"] == 0
+
+
+def test_invalid_limits_are_rejected():
+    with pytest.raises(ValueError):
+        TensorBufferPool(IMAGE_SHAPE, max_buffers_per_key=0)
+    with pytest.raises(ValueError):
+        TensorBufferPool(IMAGE_SHAPE, max_total_bytes=-1)